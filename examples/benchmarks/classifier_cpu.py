@@ -0,0 +1,157 @@
+# Copyright (c) 2024, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import time
+
+from nemo_curator import DomainClassifier, QualityClassifier
+from nemo_curator.datasets import DocumentDataset
+from nemo_curator.distributed_data_classification.quality_classifier_multiple_models_inference import (
+    delete_model_and_tokenizer_from_workers,
+)
+from nemo_curator.utils.distributed_utils import get_client, read_data
+from nemo_curator.utils.file_utils import get_all_files_paths_under
+from nemo_curator.utils.script_utils import add_distributed_args
+
+
+def main(args):
+    client = get_client(args, "cpu")
+
+    files = list(get_all_files_paths_under(args.input_data_dir))
+    dataset = DocumentDataset(
+        read_data(files, file_type=args.input_file_type, backend="pandas")
+    )
+    if args.num_documents is not None:
+        dataset = DocumentDataset(
+            dataset.df.head(args.num_documents, npartitions=-1, compute=False)
+        )
+    dataset = dataset.persist()
+    num_documents = len(dataset)
+    print(f"Classifying {num_documents} documents on the CPU")
+
+    results = {}
+    for quantize in [False, True]:
+        if args.classifier == "domain":
+            classifier = DomainClassifier(
+                model_file_name=args.model_file_name,
+                labels=args.labels,
+                batch_size=args.batch_size,
+                device_type="cpu",
+                autocast=False,
+                max_tokens_per_batch=args.max_tokens_per_batch,
+                quantize=quantize,
+                mmap_dir=args.mmap_dir,
+            )
+        else:
+            classifier = QualityClassifier(
+                model_file_name=args.model_file_name,
+                labels=args.labels,
+                batch_size=args.batch_size,
+                device_type="cpu",
+                autocast=False,
+                max_tokens_per_batch=args.max_tokens_per_batch,
+                quantize=quantize,
+                mmap_dir=args.mmap_dir,
+            )
+        t0 = time.time()
+        result = classifier(dataset).df.compute()
+        elapsed = time.time() - t0
+        # The workers keep the last model they loaded
+        delete_model_and_tokenizer_from_workers(client)
+        results[quantize] = result[classifier.pred_column].tolist()
+        name = "int8" if quantize else "fp32"
+        print(
+            f"{name}: classified {num_documents} documents in {elapsed:.2f}s "
+            f"({num_documents / elapsed:.1f} docs/s)"
+        )
+
+    agreement = sum(a == b for a, b in zip(results[False], results[True]))
+    print(f"int8 and fp32 agree on {agreement / num_documents:.1%} of the predictions")
+
+    client.close()
+
+
+def attach_args(
+    parser=argparse.ArgumentParser(
+        """
+        Compares the throughput of a domain or quality classifier on the CPU
+        with and without int8 dynamic quantization. Each Dask worker splits the
+        cores of the machine between its threads, so --threads-per-worker
+        controls how many partitions are classified at the same time.
+        """,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+):
+    parser.add_argument(
+        "--input-data-dir",
+        type=str,
+        required=True,
+        help="Directory of documents to classify.",
+    )
+    parser.add_argument(
+        "--input-file-type",
+        type=str,
+        default="jsonl",
+        help="File type of the dataset to be read in.",
+    )
+    parser.add_argument(
+        "--num-documents",
+        type=int,
+        default=None,
+        help="If specified, only classifies this many documents.",
+    )
+    parser.add_argument(
+        "--classifier",
+        type=str,
+        default="quality",
+        choices=["domain", "quality"],
+        help="The classifier to benchmark.",
+    )
+    parser.add_argument(
+        "--model-file-name",
+        type=str,
+        required=True,
+        help="The path to the model file of the classifier.",
+    )
+    parser.add_argument(
+        "--labels",
+        type=str,
+        nargs="+",
+        default=["High", "Medium", "Low"],
+        help="The labels of the classifier.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=64,
+        help="The number of documents per batch.",
+    )
+    parser.add_argument(
+        "--max-tokens-per-batch",
+        type=int,
+        default=None,
+        help="If specified, batches documents of similar lengths under this token budget.",
+    )
+    parser.add_argument(
+        "--mmap-dir",
+        type=str,
+        default=None,
+        help="If specified, the workers memory-map the model weights from this directory.",
+    )
+
+    return add_distributed_args(parser)
+
+
+if __name__ == "__main__":
+    main(attach_args().parse_args())
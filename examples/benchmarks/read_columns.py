@@ -0,0 +1,119 @@
+# Copyright (c) 2024, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import time
+
+import dask
+
+from nemo_curator.datasets import DocumentDataset
+from nemo_curator.utils.file_utils import get_all_files_paths_under
+
+
+def bytes_read():
+    # The bytes read by this process, including those served from the page cache
+    with open("/proc/self/io") as f:
+        for line in f:
+            if line.startswith("rchar:"):
+                return int(line.split()[1])
+
+
+def main(args):
+    files = [
+        f
+        for f in get_all_files_paths_under(args.input_data_dir)
+        if f.endswith(".parquet")
+    ]
+    stages = {
+        "all columns": {},
+        "exact/fuzzy dedup": {"columns": [args.id_field, args.text_field]},
+    }
+    if args.filter_field is not None:
+        stages[f"{args.filter_field} == {args.filter_value}"] = {
+            "columns": [args.id_field, args.text_field],
+            "filters": [(args.filter_field, "==", args.filter_value)],
+        }
+
+    print(f"Reading {len(files)} Parquet files")
+    # Files are read by threads of this process, so that its I/O counters see every read
+    with dask.config.set(scheduler="threads"):
+        for stage, read_kwargs in stages.items():
+            start_bytes = bytes_read()
+            t0 = time.time()
+            dataset = DocumentDataset.read_parquet(
+                files, backend=args.backend, **read_kwargs
+            )
+            num_rows = len(dataset)
+            elapsed = time.time() - t0
+            num_bytes = bytes_read() - start_bytes
+            print(
+                f"{stage}: read {num_bytes / 2**20:.1f} MiB for {num_rows} documents "
+                f"in {elapsed:.2f}s ({num_rows / elapsed:.1f} docs/s)"
+            )
+
+
+def attach_args(
+    parser=argparse.ArgumentParser(
+        """
+        Compares the bytes read and the time spent reading a Parquet dataset
+        with every column, with only the columns read by deduplication and
+        with a row filter pushed down to the Parquet reader. Bytes are counted
+        from /proc/self/io, so this benchmark only runs on Linux.
+        """,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+):
+    parser.add_argument(
+        "--input-data-dir",
+        type=str,
+        required=True,
+        help="Directory of Parquet files to read.",
+    )
+    parser.add_argument(
+        "--id-field",
+        type=str,
+        default="id",
+        help="The name of the field that contains the document ids.",
+    )
+    parser.add_argument(
+        "--text-field",
+        type=str,
+        default="text",
+        help="The name of the field that contains the text.",
+    )
+    parser.add_argument(
+        "--filter-field",
+        type=str,
+        default=None,
+        help="If specified, also reads the documents whose value of this field "
+        "is --filter-value.",
+    )
+    parser.add_argument(
+        "--filter-value",
+        type=str,
+        default="EN",
+        help="The value of --filter-field to keep.",
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        default="pandas",
+        help="The backend to read the data with. Either pandas or cudf.",
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    main(attach_args().parse_args())
@@ -0,0 +1,130 @@
+# Copyright (c) 2024, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import random
+import time
+
+import nemo_curator as nc
+from nemo_curator.datasets import DocumentDataset
+from nemo_curator.tasks import DownstreamTask
+from nemo_curator.utils.distributed_utils import get_client, read_data
+from nemo_curator.utils.file_utils import get_all_files_paths_under
+from nemo_curator.utils.script_utils import add_distributed_args
+
+
+class SampledTask(DownstreamTask):
+    """
+    A task made of passages sampled from the benchmark corpus itself,
+    so that matches are guaranteed without downloading any evaluation data.
+    """
+
+    def __init__(self, documents, min_ngram_size=8, max_ngram_size=13):
+        super().__init__()
+        self._task_name = "sampled"
+        self._min_ngram_size = min_ngram_size
+        self._max_ngram_size = max_ngram_size
+        self._dataset = documents
+
+    def generate_ngrams(self):
+        for line in self._dataset:
+            self._update_ngrams(line, self._min_ngram_size, self._max_ngram_size)
+
+        return self.ngrams
+
+
+def main(args):
+    client = get_client(args, args.device)
+
+    files = list(get_all_files_paths_under(args.input_data_dir))
+    dataset = DocumentDataset(
+        read_data(files, file_type=args.input_file_type, backend="pandas")
+    ).persist()
+    num_documents = len(dataset)
+
+    texts = dataset.df[args.input_text_field].sample(frac=args.task_fraction, random_state=42).compute()
+    rng = random.Random(42)
+    passages = []
+    for text in texts:
+        start = rng.randint(0, max(0, len(text) - args.passage_length))
+        passages.append(text[start : start + args.passage_length])
+    task_ngrams = SampledTask(passages).generate_ngrams()
+    print(f"Benchmarking {num_documents} documents against {len(task_ngrams)} task n-grams")
+
+    results = {}
+    for ngram_matcher in ["loop", "hash"]:
+        decontaminator = nc.TaskDecontamination(
+            [], text_field=args.input_text_field, ngram_matcher=ngram_matcher
+        )
+        t0 = time.time()
+        result = decontaminator.find_matching_ngrams(task_ngrams, dataset).compute()
+        elapsed = time.time() - t0
+        results[ngram_matcher] = result["matched-ngrams"]
+        print(
+            f"{ngram_matcher}: found {len(result['matched-ngrams'])} matching n-grams in {elapsed:.2f}s "
+            f"({num_documents / elapsed:.1f} docs/s)"
+        )
+
+    if results["loop"] != results["hash"]:
+        raise RuntimeError("The hash and loop matchers found different n-grams")
+
+    client.close()
+
+
+def attach_args(
+    parser=argparse.ArgumentParser(
+        """
+        Compares the throughput of the "loop" and "hash" n-gram matchers of
+        TaskDecontamination.find_matching_ngrams on a local corpus.
+        Task n-grams are built from passages sampled out of the corpus.
+        """,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+):
+    parser.add_argument(
+        "--input-data-dir",
+        type=str,
+        required=True,
+        help="Directory of documents to search for task n-grams.",
+    )
+    parser.add_argument(
+        "--input-file-type",
+        type=str,
+        default="jsonl",
+        help="File type of the dataset to be read in.",
+    )
+    parser.add_argument(
+        "--input-text-field",
+        type=str,
+        default="text",
+        help="The name of the field that contains the text.",
+    )
+    parser.add_argument(
+        "--task-fraction",
+        type=float,
+        default=0.01,
+        help="Fraction of documents a task passage is sampled from.",
+    )
+    parser.add_argument(
+        "--passage-length",
+        type=int,
+        default=500,
+        help="Length in characters of every sampled task passage.",
+    )
+
+    return add_distributed_args(parser)
+
+
+if __name__ == "__main__":
+    main(attach_args().parse_args())
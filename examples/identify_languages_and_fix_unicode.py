@@ -17,7 +17,7 @@ import os
 
 import nemo_curator as nc
 from nemo_curator.datasets import DocumentDataset
-from nemo_curator.filters import FastTextLangId
+from nemo_curator.filters import BatchedFastTextLangId
 from nemo_curator.modifiers import UnicodeReformatter
 from nemo_curator.utils.file_utils import get_all_files_paths_under, separate_by_metadata
 from nemo_curator.utils.distributed_utils import read_data, write_to_disk, get_client
@@ -49,7 +49,7 @@ def main(args):
 
     # Filter data
     multilingual_dataset = load_dataset(multilingual_data_path)
-    language_id_pipeline = nc.ScoreFilter(FastTextLangId(model_path), score_field=language_field, score_type='object')
+    language_id_pipeline = nc.ScoreFilter(BatchedFastTextLangId(model_path), score_field=language_field, score_type='object', batched=True)
     filtered_dataset = language_id_pipeline(multilingual_dataset)
     
     # Remove the language score
@@ -40,13 +40,22 @@ class DocumentDataset:
         backend="pandas",
         files_per_partition=1,
         add_filename=False,
+        columns=None,
+        filters=None,
     ):
+        """
+        See nemo_curator.utils.distributed_utils.read_data docstring for the parameters.
+        JSONL files are parsed completely before the columns and rows are selected.
+
+        """
         return cls(_read_json_or_parquet(
             input_files=input_files,
             file_type="jsonl",
             backend=backend,
             files_per_partition=files_per_partition,
             add_filename=add_filename,
+            columns=columns,
+            filters=filters,
         ))
 
     @classmethod
@@ -56,13 +65,22 @@ class DocumentDataset:
         backend="pandas",
         files_per_partition=1,
         add_filename=False,
+        columns=None,
+        filters=None,
     ):
+        """
+        See nemo_curator.utils.distributed_utils.read_data docstring for the parameters.
+        Only the columns and the row groups that are needed are read from the Parquet files.
+
+        """
         return cls(_read_json_or_parquet(
             input_files=input_files,
             file_type="parquet",
             backend=backend,
             files_per_partition=files_per_partition,
             add_filename=add_filename,
+            columns=columns,
+            filters=filters,
         ))
 
     @classmethod
@@ -87,6 +105,7 @@ class DocumentDataset:
         self,
         output_file_dir,
         write_to_filename=False,
+        records_per_chunk=None,
     ):
         """
         See nemo_curator.utils.distributed_utils.write_to_disk docstring for other parameters.
@@ -97,12 +116,16 @@ class DocumentDataset:
             output_file_dir=output_file_dir,
             write_to_filename=write_to_filename,
             output_type="jsonl",
+            records_per_chunk=records_per_chunk,
         )
 
     def to_parquet(
         self,
         output_file_dir,
         write_to_filename=False,
+        row_group_size=None,
+        compression="snappy",
+        use_dictionary=True,
     ):
         """
         See nemo_curator.utils.distributed_utils.write_to_disk docstring for other parameters.
@@ -113,6 +136,9 @@ class DocumentDataset:
             output_file_dir=output_file_dir,
             write_to_filename=write_to_filename,
             output_type="parquet",
+            row_group_size=row_group_size,
+            compression=compression,
+            use_dictionary=use_dictionary,
         )
 
     def to_pickle(
@@ -129,6 +155,8 @@ def _read_json_or_parquet(
     backend,
     files_per_partition,
     add_filename,
+    columns=None,
+    filters=None,
 ):
     """
     `input_files` may be a list or a string type.
@@ -158,6 +186,8 @@ def _read_json_or_parquet(
                 backend=backend,
                 files_per_partition=files_per_partition,
                 add_filename=add_filename,
+                columns=columns,
+                filters=filters,
             )
 
         # List of directories
@@ -174,6 +204,8 @@ def _read_json_or_parquet(
                     backend=backend,
                     files_per_partition=files_per_partition,
                     add_filename=add_filename,
+                    columns=columns,
+                    filters=filters,
                 )
                 dfs.append(df)
 
@@ -199,6 +231,8 @@ def _read_json_or_parquet(
             backend=backend,
             files_per_partition=files_per_partition,
             add_filename=add_filename,
+            columns=columns,
+            filters=filters,
         )
 
     else:
@@ -114,7 +114,7 @@ def add_model_args(parser):
     Args:
         parser: An argparse ArgumentParser object.
     Returns:
-        An argparse ArgumentParser with 4 additional arguments.
+        An argparse ArgumentParser with 6 additional arguments.
 
     """
     # Add a mutually exclusive group for model_file_name and model_file_names
@@ -143,6 +143,20 @@ def add_model_args(parser):
         default=128,
         help="The batch size to be used for inference",
     )
+    parser.add_argument(
+        "--max_tokens_per_batch",
+        type=int,
+        default=None,
+        help="If specified, sort the documents of each partition by token length "
+        "and build batches of at most this many tokens, including padding, "
+        "instead of using --batch_size",
+    )
+    parser.add_argument(
+        "--stream_tokenization",
+        action="store_true",
+        help="Tokenize the documents one batch at a time while the previous batch "
+        "runs through the model, instead of tokenizing each partition up front",
+    )
     return parser
 
 
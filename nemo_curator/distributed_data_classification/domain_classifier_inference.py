@@ -26,8 +26,12 @@ from nemo_curator.distributed_data_classification.arg_utils import create_arg_pa
 from nemo_curator.distributed_data_classification.pytorch_utils import (
     CFG,
     CustomModel,
+    StreamingTestDataset,
     TestDataset,
     collate,
+    get_data_loader,
+    prefetch,
+    restore_order,
 )
 from nemo_curator.utils.distributed_utils import (
     get_client,
@@ -49,6 +53,8 @@ def inference_per_partition(
     model_file_name,
     labels,
     autocast,
+    max_tokens_per_batch=None,
+    stream_tokenization=False,
 ):
     """
     This function runs domain classification on a subset of the data.
@@ -63,31 +69,35 @@ def inference_per_partition(
         model_file_name: The path to the model file.
         labels: The list of domain labels.
         autocast: A boolean representing whether to perform inference with mixed precision.
+        max_tokens_per_batch: If specified, the documents are sorted by token length and batched
+            so that each padded batch holds at most this many tokens, instead of batch_size documents.
+        stream_tokenization: A boolean representing whether to tokenize the documents one batch at a time,
+            while the previous batch runs through the model, instead of tokenizing the whole partition up front.
     Returns:
         The input Dask DataFrame with the calculated "pred" column.
 
     """
     cfg = cfg_per_partition()
 
-    dataset_valid = TestDataset(cfg, df, max_chars)
-    loader_valid = torch.utils.data.DataLoader(
-        dataset_valid,
-        batch_size=batch_size,
-        shuffle=False,
-        num_workers=num_workers,
+    if stream_tokenization:
+        dataset_valid = StreamingTestDataset(cfg, df, max_chars)
+    else:
+        dataset_valid = TestDataset(cfg, df, max_chars)
+    loader_valid = get_data_loader(
+        dataset_valid, batch_size, num_workers, max_tokens_per_batch
     )
     device = torch.device("cuda")
     load_model_kwargs = {"cfg": cfg, "device": device, "model_path": model_file_name}
     run_inference_kwargs = {"autocast": autocast}
     st = time.time()
     preds = process_all_batches(
-        loader_valid,
+        prefetch(loader_valid) if stream_tokenization else loader_valid,
         load_model,
         load_model_kwargs,
         run_inference,
         run_inference_kwargs,
     )
-    preds = preds.cpu().numpy()
+    preds = restore_order(preds, loader_valid).cpu().numpy()
     df["pred"] = [labels[i] for i in preds]
 
     et = time.time()
@@ -249,6 +259,8 @@ def main():
             args.model_file_name,
             labels,
             args.autocast,
+            max_tokens_per_batch=args.max_tokens_per_batch,
+            stream_tokenization=args.stream_tokenization,
             meta=meta_df,
             enforce_metadata=False,
         )
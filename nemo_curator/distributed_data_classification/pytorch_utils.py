@@ -12,14 +12,28 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 os.environ["RAPIDS_NO_INITIALIZE"] = "1"
+import pyarrow as pa
 import torch
 import torch.nn as nn
-from torch.utils.data import Dataset
+from torch.utils.data import (
+    BatchSampler,
+    DataLoader,
+    Dataset,
+    Sampler,
+    SequentialSampler,
+)
 from transformers import AutoConfig, AutoModel
 
+from nemo_curator.utils.gpu_utils import is_cudf_type
+
 
 class CFG:
     model = "microsoft/deberta-v3-base"
@@ -29,8 +43,8 @@ class CFG:
         self.max_len = max_len
 
 
-def collate(inputs):
-    inputs = {k: v.to("cuda") for k, v in inputs.items()}
+def collate(inputs, device="cuda"):
+    inputs = {k: v.to(device) for k, v in inputs.items()}
     mask_len = int(inputs["attention_mask"].sum(axis=1).max())
     for k, v in inputs.items():
         # CPMP: no need to truncate labels
@@ -52,7 +66,7 @@ class CustomModel(nn.Module):
         if pretrained:
             self.model = AutoModel.from_pretrained(cfg.model, config=self.config)
         else:
-            self.model = AutoModel(self.config)
+            self.model = AutoModel.from_config(self.config)
         self.fc_dropout = nn.Dropout(cfg.fc_dropout)
         self.fc = nn.Linear(self.config.hidden_size, out_dim)
         self._init_weights(self.fc)
@@ -81,10 +95,84 @@ class CustomModel(nn.Module):
         return output
 
 
+@contextmanager
+def init_empty_weights():
+    """
+    Creates the parameters of the modules built in this context on the meta device,
+    so that no memory is allocated or initialized for them until they are assigned
+    with load_state_dict(..., assign=True). Buffers are created as usual, since
+    state dicts do not hold the non-persistent ones.
+    """
+    register_parameter = nn.Module.register_parameter
+
+    def register_empty_parameter(module, name, param):
+        register_parameter(module, name, param)
+        if param is not None:
+            param = module._parameters[name]
+            module._parameters[name] = type(param)(
+                param.to("meta"), requires_grad=param.requires_grad
+            )
+
+    nn.Module.register_parameter = register_empty_parameter
+    try:
+        yield
+    finally:
+        nn.Module.register_parameter = register_parameter
+
+
+def load_mmap_state_dict(model_file_name, read_state_dict, mmap_dir):
+    """
+    Returns the state dict of a checkpoint with its tensors memory-mapped
+    read-only from a file in mmap_dir. The first call converts the checkpoint
+    into that file with read_state_dict, a function that loads the checkpoint
+    and returns the state dict to map. Later calls, from any worker process on
+    the node, map the converted file directly, so its pages are shared through
+    the page cache instead of being copied into every process.
+    The file is converted again whenever the checkpoint is newer than it.
+    """
+    model_file_name = os.path.abspath(model_file_name)
+    path_hash = hashlib.blake2b(model_file_name.encode(), digest_size=8).hexdigest()
+    name = os.path.splitext(os.path.basename(model_file_name))[0]
+    mmap_file_name = os.path.join(mmap_dir, f"{name}-{path_hash}.pt")
+
+    if not os.path.exists(mmap_file_name) or os.path.getmtime(
+        mmap_file_name
+    ) < os.path.getmtime(model_file_name):
+        os.makedirs(mmap_dir, exist_ok=True)
+        state_dict = {
+            k: v.contiguous() for k, v in read_state_dict(model_file_name).items()
+        }
+        # Other workers may be converting the same checkpoint, so the file is
+        # written under a temporary name and atomically renamed
+        tmp_file_name = f"{mmap_file_name}.{os.getpid()}-{threading.get_ident()}.tmp"
+        torch.save(state_dict, tmp_file_name)
+        os.replace(tmp_file_name, mmap_file_name)
+        del state_dict
+
+    return torch.load(
+        mmap_file_name, map_location="cpu", mmap=True, weights_only=True
+    )
+
+
+def quantize_dynamic(model):
+    """
+    Replaces the linear layers of a model with int8 dynamically quantized ones.
+    Their weights are quantized once, and their activations are quantized on
+    the fly for each batch. Quantized models only run on the CPU.
+    """
+    return torch.ao.quantization.quantize_dynamic(
+        model, {nn.Linear}, dtype=torch.qint8
+    )
+
+
 class TestDataset(Dataset):
     def __init__(self, cfg, df, max_chars):
         self.cfg = cfg
-        text = df["text"].str.slice(0, max_chars).to_arrow().to_pylist()
+        text = df["text"].str.slice(0, max_chars)
+        if is_cudf_type(text):
+            text = text.to_arrow().to_pylist()
+        else:
+            text = text.tolist()
         with torch.no_grad():
             self.tokens = cfg.tokenizer.batch_encode_plus(
                 text,
@@ -95,6 +183,7 @@ class TestDataset(Dataset):
                 truncation=True,
                 return_token_type_ids=False,
             )
+        self.lengths = self.tokens["attention_mask"].sum(axis=1)
         self.max_chars = max_chars
         self.dataset_len = len(text)
 
@@ -103,3 +192,193 @@ class TestDataset(Dataset):
 
     def __getitem__(self, item):
         return {k: v[item] for k, v in self.tokens.items()}
+
+
+class StreamingTestDataset(Dataset):
+    """
+    Tokenizes the documents of a partition one batch at a time, instead of
+    tokenizing and padding the whole partition up front like TestDataset.
+    It is indexed with the list of positions of a batch, and returns their
+    tokens padded to the longest document of the batch.
+    Token ids are cached by a hash of the text, so duplicated documents are
+    only tokenized once. The cache holds at most cache_size documents.
+    """
+
+    def __init__(self, cfg, df, max_chars, cache_size=4096):
+        self.cfg = cfg
+        text = df["text"].str.slice(0, max_chars)
+        if is_cudf_type(text):
+            self.text = text.to_arrow()
+        else:
+            self.text = pa.array(text, type=pa.string())
+        self.max_chars = max_chars
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.dataset_len = len(self.text)
+        self._lengths = None
+
+    def __len__(self):
+        return self.dataset_len
+
+    @property
+    def lengths(self):
+        """
+        The number of tokens of every document. Token-budget batching needs
+        them before the first batch, so the documents are tokenized in chunks
+        and their token ids are kept in the cache until it is full.
+        """
+        if self._lengths is None:
+            lengths = []
+            for start in range(0, self.dataset_len, self.cache_size):
+                texts = self.text.slice(start, self.cache_size).to_pylist()
+                lengths.extend(len(ids) for ids in self._token_ids(texts))
+            self._lengths = torch.tensor(lengths, dtype=torch.int64)
+        return self._lengths
+
+    def _token_ids(self, texts):
+        keys = [hashlib.blake2b(t.encode(), digest_size=16).digest() for t in texts]
+        token_ids = {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                token_ids[key] = self.cache[key]
+            else:
+                missing[key] = text
+
+        if missing:
+            encoded = self.cfg.tokenizer.batch_encode_plus(
+                list(missing.values()),
+                add_special_tokens=True,
+                max_length=self.cfg.max_len,
+                truncation=True,
+                return_token_type_ids=False,
+                return_attention_mask=False,
+            )
+            for key, ids in zip(missing, encoded["input_ids"]):
+                token_ids[key] = ids
+                self.cache[key] = ids
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+        return [token_ids[key] for key in keys]
+
+    def __getitem__(self, items):
+        texts = self.text.take(pa.array(items, type=pa.int64())).to_pylist()
+        token_ids = self._token_ids(texts)
+
+        pad_token_id = self.cfg.tokenizer.pad_token_id or 0
+        max_len = max(len(ids) for ids in token_ids)
+        input_ids = torch.full((len(token_ids), max_len), pad_token_id)
+        attention_mask = torch.zeros((len(token_ids), max_len), dtype=torch.int64)
+        for i, ids in enumerate(token_ids):
+            input_ids[i, : len(ids)] = torch.tensor(ids)
+            attention_mask[i, : len(ids)] = 1
+
+        return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+
+class TokenBudgetBatchSampler(Sampler):
+    """
+    Groups the samples of a dataset into batches of similar token lengths.
+    The samples are sorted by length, longest first, and each batch holds as
+    many samples as fit in max_tokens once padded to its longest sample.
+    Since `collate` trims a batch to its longest sample, short documents are no
+    longer padded to the length of a long document in the same batch.
+    """
+
+    def __init__(self, lengths, max_tokens):
+        lengths = torch.as_tensor(lengths)
+        self.order = torch.argsort(lengths, descending=True, stable=True)
+        lengths = lengths.tolist()
+
+        self.batches = []
+        batch = []
+        for i in self.order.tolist():
+            # The first sample of a batch is its longest one
+            if batch and (len(batch) + 1) * max(lengths[batch[0]], 1) > max_tokens:
+                self.batches.append(batch)
+                batch = []
+            batch.append(i)
+        if batch:
+            self.batches.append(batch)
+
+    def __iter__(self):
+        return iter(self.batches)
+
+    def __len__(self):
+        return len(self.batches)
+
+    def restore_order(self, outputs):
+        """
+        Takes the outputs of every batch, concatenated in the order they were
+        yielded, and returns them in the original order of the dataset.
+        """
+        restored = torch.empty_like(outputs)
+        restored[self.order.to(outputs.device)] = outputs
+        return restored
+
+
+def get_data_loader(dataset, batch_size, num_workers, max_tokens_per_batch=None):
+    """
+    Creates the DataLoader used for inference on a TestDataset or a
+    StreamingTestDataset.
+    If max_tokens_per_batch is None, the dataset is split into batches of
+    batch_size samples in its original order. Otherwise, it is batched by
+    a TokenBudgetBatchSampler, and the outputs must be passed to
+    `restore_order` before being assigned back to the DataFrame.
+    """
+    if isinstance(dataset, StreamingTestDataset):
+        # The dataset returns whole batches, so the DataLoader does not batch them again
+        if max_tokens_per_batch is None:
+            sampler = BatchSampler(
+                SequentialSampler(dataset), batch_size=batch_size, drop_last=False
+            )
+        else:
+            sampler = TokenBudgetBatchSampler(dataset.lengths, max_tokens_per_batch)
+        return DataLoader(
+            dataset, sampler=sampler, batch_size=None, num_workers=num_workers
+        )
+
+    if max_tokens_per_batch is None:
+        return DataLoader(
+            dataset,
+            batch_size=batch_size,
+            shuffle=False,
+            num_workers=num_workers,
+        )
+
+    return DataLoader(
+        dataset,
+        batch_sampler=TokenBudgetBatchSampler(dataset.lengths, max_tokens_per_batch),
+        num_workers=num_workers,
+    )
+
+
+def restore_order(outputs, data_loader):
+    """
+    Returns the outputs of a DataLoader created by `get_data_loader` in the
+    order of its dataset.
+    """
+    for sampler in (data_loader.batch_sampler, data_loader.sampler):
+        if isinstance(sampler, TokenBudgetBatchSampler):
+            return sampler.restore_order(outputs)
+    return outputs
+
+
+def prefetch(data_loader):
+    """
+    Yields the batches of a DataLoader while a background thread loads the
+    next one. Fast tokenizers release the GIL, so a StreamingTestDataset
+    tokenizes the next batch while the model runs on the current one, without
+    starting DataLoader worker processes.
+    """
+    batches = iter(data_loader)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        next_batch = executor.submit(next, batches, None)
+        while True:
+            batch = next_batch.result()
+            if batch is None:
+                return
+            next_batch = executor.submit(next, batches, None)
+            yield batch
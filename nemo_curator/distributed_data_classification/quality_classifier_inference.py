@@ -24,8 +24,12 @@ from nemo_curator.distributed_data_classification.arg_utils import create_arg_pa
 from nemo_curator.distributed_data_classification.pytorch_utils import (
     CFG,
     CustomModel,
+    StreamingTestDataset,
     TestDataset,
     collate,
+    get_data_loader,
+    prefetch,
+    restore_order,
 )
 from nemo_curator.utils.distributed_utils import (
     get_client,
@@ -47,7 +51,8 @@ def inference_per_partition(
     model_file_name,
     labels,
     autocast,
-    include_model_name=False,
+    max_tokens_per_batch=None,
+    stream_tokenization=False,
 ):
     """
     This function runs quality classification on a subset of the data.
@@ -63,19 +68,22 @@ def inference_per_partition(
         model_file_name: The path to the model file.
         labels: The list of domain labels.
         autocast: A boolean representing whether to perform inference with mixed precision.
-        include_model_name: A boolean representing whether to include the model name in the "quality_pred" column name.
+        max_tokens_per_batch: If specified, the documents are sorted by token length and batched
+            so that each padded batch holds at most this many tokens, instead of batch_size documents.
+        stream_tokenization: A boolean representing whether to tokenize the documents one batch at a time,
+            while the previous batch runs through the model, instead of tokenizing the whole partition up front.
     Returns:
         The input Dask DataFrame with the calculated "quality_pred" column.
 
     """
     cfg = cfg_per_partition()
 
-    dataset_valid = TestDataset(cfg, df, max_chars)
-    loader_valid = torch.utils.data.DataLoader(
-        dataset_valid,
-        batch_size=batch_size,
-        shuffle=False,
-        num_workers=num_workers,
+    if stream_tokenization:
+        dataset_valid = StreamingTestDataset(cfg, df, max_chars)
+    else:
+        dataset_valid = TestDataset(cfg, df, max_chars)
+    loader_valid = get_data_loader(
+        dataset_valid, batch_size, num_workers, max_tokens_per_batch
     )
     device = torch.device("cuda")
     if len(labels) == 1:
@@ -101,26 +109,20 @@ def inference_per_partition(
     }
     st = time.time()
     probs = process_all_batches(
-        loader_valid,
+        prefetch(loader_valid) if stream_tokenization else loader_valid,
         load_model,
         load_model_kwargs,
         run_inference,
         run_inference_kwargs,
     )
+    probs = restore_order(probs, loader_valid)
     if binary_classification:
         preds = (probs > 0.5).to(torch.int64).squeeze()
     else:
         preds = torch.argmax(probs, dim=1)
     # TODO: Do this without a CPU roundtrip in the future
-    if include_model_name:
-        filename = os.path.basename(model_file_name)
-        df[f"quality_pred_{filename}"] = [
-            labels[i] for i in preds.to("cpu").numpy().tolist()
-        ]
-        df[f"quality_prob_{filename}"] = probs.to("cpu").numpy().tolist()
-    else:
-        df["quality_pred"] = [labels[i] for i in preds.to("cpu").numpy().tolist()]
-        df["quality_prob"] = probs.to("cpu").numpy().tolist()
+    df["quality_pred"] = [labels[i] for i in preds.to("cpu").numpy().tolist()]
+    df["quality_prob"] = probs.to("cpu").numpy().tolist()
     et = time.time()
     print(
         f"Time taken for inference for num_batches: {len(loader_valid)} : {et-st} s",
@@ -288,6 +290,8 @@ def main():
             args.model_file_name,
             labels,
             args.autocast,
+            max_tokens_per_batch=args.max_tokens_per_batch,
+            stream_tokenization=args.stream_tokenization,
             meta=meta_df,
             enforce_metadata=False,
         )
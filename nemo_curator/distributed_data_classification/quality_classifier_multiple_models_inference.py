@@ -12,16 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import os
 import time
 
 from dask.distributed import wait
 
+from nemo_curator.datasets import DocumentDataset
 from nemo_curator.distributed_data_classification.arg_utils import create_arg_parser
 from nemo_curator.distributed_data_classification.quality_classifier_inference import (
     add_quality_model_specific_args,
     get_labels,
-    inference_per_partition,
+)
+from nemo_curator.modules.distributed_data_classifier import (
+    MultipleModelQualityClassifier,
 )
 from nemo_curator.utils.distributed_utils import (
     get_client,
@@ -32,37 +34,38 @@ from nemo_curator.utils.distributed_utils import (
 from nemo_curator.utils.file_utils import get_remaining_files
 
 
-def delete_model_and_tokenizer_from_workers(client):
+def delete_model_and_tokenizer_from_workers(client, model_file_names=None):
     """
-    Offloads cfg_with_tokenizer and model from all Dask client workers.
+    Offloads cfg_with_tokenizer and the models from all Dask client workers.
 
     Args:
         client: A Dask client object.
+        model_file_names: The checkpoints loaded by a MultipleModelQualityClassifier,
+            whose models are kept under one attribute per checkpoint.
+            If None, the model of a single model classifier is offloaded.
 
     """
+    if model_file_names is None:
+        attrs = ["cfg_with_tokenizer", "model"]
+    else:
+        attrs = ["cfg_with_tokenizer"] + [
+            f"model_{model_file_name}" for model_file_name in model_file_names
+        ]
     task_ls = []
     # TODO: client.run does not work anymore
     # See: https://dask.discourse.group/t/cannot-run-client-run-function-when-function-contains-get-worker-in-distributed-2023-3-2-1/1772
     # find a better alternate
     for worker in client.scheduler_info()["workers"]:
-        task_ls.append(
-            client.submit(
-                offload_object_on_worker,
-                "cfg_with_tokenizer",
-                workers=[worker],
-                allow_other_workers=False,
-                pure=False,
-            )
-        )
-        task_ls.append(
-            client.submit(
-                offload_object_on_worker,
-                "model",
-                workers=[worker],
-                allow_other_workers=False,
-                pure=False,
+        for attr in attrs:
+            task_ls.append(
+                client.submit(
+                    offload_object_on_worker,
+                    attr,
+                    workers=[worker],
+                    allow_other_workers=False,
+                    pure=False,
+                )
             )
-        )
     wait(task_ls)
     for t in task_ls:
         assert t.result() == True
@@ -80,7 +83,17 @@ def main():
     batch_size = args.batch_size
     num_workers = 0
     client = get_client(args, cluster_type="gpu")
-    client.upload_file("quality_classifier_inference.py")
+    # Every partition is tokenized once and classified by all of the models
+    quality_classifier = MultipleModelQualityClassifier(
+        model_file_names=args.model_file_names,
+        labels=labels,
+        batch_size=batch_size,
+        max_chars=max_chars,
+        num_workers=num_workers,
+        autocast=args.autocast,
+        max_tokens_per_batch=args.max_tokens_per_batch,
+        stream_tokenization=args.stream_tokenization,
+    )
 
     print("Starting quality classifier inference", flush=True)
     global_st = time.time()
@@ -109,28 +122,7 @@ def main():
         )
         print(f"Total input Dask DataFrame partitions {df.npartitions}", flush=True)
 
-        for model_file_path in args.model_file_names:
-            meta_df = df._meta.copy()
-            model_file_name = os.path.basename(model_file_path)
-            print(f"model_file_name={model_file_name}", flush=True)
-            print("--" * 30, flush=True)
-            meta_df[f"quality_pred_{model_file_name}"] = ["low"] * len(meta_df)
-            meta_df[f"quality_prob_{model_file_name}"] = [[0, 0, 1]] * len(meta_df)
-            df = df.map_partitions(
-                inference_per_partition,
-                max_chars,
-                batch_size,
-                num_workers,
-                model_file_path,
-                labels,
-                args.autocast,
-                include_model_name=True,
-                meta=meta_df,
-                enforce_metadata=False,
-            )
-            df = df.persist()
-            wait(df)
-            delete_model_and_tokenizer_from_workers(client)
+        df = quality_classifier(DocumentDataset(df)).df
 
         write_to_disk(
             df=df,
@@ -148,6 +140,7 @@ def main():
         f"Total time taken for multiple quality classifier inference models: {global_et-global_st} s",
         flush=True,
     )
+    delete_model_and_tokenizer_from_workers(client, args.model_file_names)
     client.close()
 
 
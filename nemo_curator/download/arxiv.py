@@ -12,15 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
 import os
 import re
 import gzip
-import tempfile
 import tarfile
 import subprocess
 
 from nemo_curator.datasets import DocumentDataset
-from nemo_curator.utils.file_utils import get_all_files_paths_under, expand_outdir_and_mkdir
+from nemo_curator.utils.file_utils import expand_outdir_and_mkdir
 from nemo_curator.download.doc_builder import (
     DocumentDownloader,
     DocumentIterator,
@@ -33,6 +33,90 @@ from nemo_curator.utils.download_utils import get_arxiv_urls
 # from the Red-Pajama repo
 # https://github.com/togethercomputer/RedPajama-Data/tree/main/data_prep/arxiv
 
+# Matches a \section-like header:
+#   \<section-type>[optional-args]{name}
+_SECTION_HEADER_RE = re.compile(
+    r"("
+    r"\\\bchapter\b\*?(?:\[(.*?)\])?\{(.*?)\}|"
+    r"\\\bpart\b\*?(?:\[(.*?)\])?\{(.*?)\}|"
+    r"\\\bsection\b\*?(?:\[(.*?)\])?\{(.*?)\}|"
+    r"\\\bsubsection\b\*?(?:\[(.*?)\])?\{(.*?)\}|"
+    r"\\\bsubsubsection\b\*?(?:\[(.*?)\])?\{(.*?)\}|"
+    r"\\\bparagraph\b\*?(?:\[(.*?)\])?\{(.*?)\}"
+    r"\\\bsubparagraph\b\*?(?:\[(.*?)\])?\{(.*?)\}"
+    r")",
+    flags=re.DOTALL,  # make sure that the dot matches also newlines
+)
+
+# Matches line comments
+_LINE_COMMENT_RE = re.compile(r"(?m)^%.*\n?", flags=re.MULTILINE)
+
+# Matches a "%" that is not preceded by a backslash (=comment) and the rest of its line
+_INLINE_COMMENT_RE = re.compile(r"[^\\]%.+$", flags=re.MULTILINE)
+
+# Matches the first occurence of either \appendix or \bibliography and everything after it
+_APPENDIX_RE = re.compile(
+    r"("
+    r"\\appendix|"
+    r"\\begin\{references\}|"
+    r"\\begin\{REFERENCES\}|"
+    r"\\begin\{thebibliography\}|"
+    r"\\bibliography\{.*\}"
+    r").*$",
+    flags=re.DOTALL,
+)
+
+# this regex matches the following:
+# \newcommand{\macro_name}{macro_value}
+# \newcommand*{\macro_name}{macro_value}
+# where macro_name is only allowed to contain letters and numbers;
+# macro_value can contain any character.
+_NON_ARG_NEWCOMMAND_RE = re.compile(
+    pattern=r'\\\bnewcommand\b\*?\{(\\[a-zA-Z0-9]+?)\}\{(.*?)\}$',
+    flags=re.MULTILINE,
+)
+
+# this regex matches the following:
+# \def\macro_name{macro_value}
+# where macro_name is only allowed to contain letters and numbers;
+# macro_value can contain any character.
+_NON_ARG_DEF_RE = re.compile(
+    pattern=r'\\def\s*(\\[a-zA-Z0-9]+?)\s*\{(.*?)\}$',
+    flags=re.MULTILINE,
+)
+
+
+def _compile_non_arg_macros(non_arg_macros):
+  r""" function compiles the expansion of macros without arguments into a single
+    pattern that matches any of them, so that all of them are expanded in one pass
+    over a tex file. Since expanding the macros one after the other also expands
+    the macros that come later in the values of those that come earlier, these
+    values are expanded ahead of time.
+
+    @param non_arg_macros: dict of the form {macro_name: macro_value}
+
+    @return: tuple of the pattern and a dict of the expanded macro values,
+        or None if there are no macros
+    """
+  if len(non_arg_macros) == 0:
+    return None
+
+  # the macro must not be part of a longer alphanumeric word
+  pattern = re.compile(
+      "(" + "|".join(map(re.escape, non_arg_macros)) + ")(?![a-zA-Z0-9])")
+  order = {macro_name: i for i, macro_name in enumerate(non_arg_macros)}
+  expanded_values = {}
+  for macro_name in reversed(list(non_arg_macros)):
+    position = order[macro_name]
+
+    def expand_later_macro(match):
+      name = match.group(1)
+      return expanded_values[name] if order[name] > position else name
+
+    expanded_values[macro_name] = pattern.sub(expand_later_macro, non_arg_macros[macro_name])
+
+  return pattern, expanded_values
+
 
 class ArxivDownloader(DocumentDownloader):
 
@@ -72,48 +156,52 @@ class ArxivIterator(DocumentIterator):
     self._counter = 0
 
   def iterate(self, file_path):
+    """
+    Yields the tex files of every project of an arXiv bulk tar file. The tar file
+    is read as a stream and each project is read in memory, without extracting
+    anything to disk.
+    """
     self._counter = 0
-    download_dir = os.path.split(file_path)[0]
     bname = os.path.split(file_path)[-1]
-    with tempfile.TemporaryDirectory(dir=download_dir) as tmpdir:
-      with tarfile.open(file_path) as tf:
-        tf.extractall(members=tf.getmembers(), path=tmpdir)
-        for i, item in enumerate(get_all_files_paths_under(tmpdir)):
-          if self._counter > 0 and self._counter % self._log_frequency == 0:
-            print(f"Extracted {self._counter} papers from {file_path}")
-          self._counter += 1
-
-          tex_files = self._tex_proj_loader(item)
-          arxiv_id = os.path.splitext(os.path.split(item)[-1])[0]
-
-          # get the arxiv id in the correct format
-          try:
-            clean_arxiv_id = self._format_arxiv_id(arxiv_id)
-          except Exception as e:
-            print(f"[WARNING] failed to format arxiv id "
-                              f"{arxiv_id}; exception={e}")
-            clean_arxiv_id = arxiv_id
-
-          if tex_files is None:
-            continue
-
-          yield {'id': clean_arxiv_id, 'source_id': f'{bname}'}, tex_files
-
-  def _tex_proj_loader(self, file_or_dir_path):
-    r""" function to load the tex files from a tar file or a gzip file. The
-      function will return a tuple containing a list of tex files and the
-      timestamp of the project.
-
-      @param file_or_dir_path: path to the tar file or the gzip file
-
-      @return: tuple containing a list of tex files and the timestamp of the
-          project
+    with tarfile.open(file_path, mode="r|*") as tf:
+      for member in tf:
+        if not member.isfile():
+          continue
+        if self._counter > 0 and self._counter % self._log_frequency == 0:
+          print(f"Extracted {self._counter} papers from {file_path}")
+        self._counter += 1
+
+        tex_files = self._tex_proj_loader(tf.extractfile(member).read(), member.name)
+        arxiv_id = os.path.splitext(os.path.split(member.name)[-1])[0]
+
+        # get the arxiv id in the correct format
+        try:
+          clean_arxiv_id = self._format_arxiv_id(arxiv_id)
+        except Exception as e:
+          print(f"[WARNING] failed to format arxiv id "
+                            f"{arxiv_id}; exception={e}")
+          clean_arxiv_id = arxiv_id
+
+        if tex_files is None:
+          continue
+
+        yield {'id': clean_arxiv_id, 'source_id': f'{bname}'}, tex_files
+
+  def _tex_proj_loader(self, project, name):
+    r""" function to load the tex files of a project from the content of its
+      tar file or gzip file. The function will return a list of the contents
+      of the tex files.
+
+      @param project: the content of the tar file or the gzip file
+      @param name: the name of the project file, used in error messages
+
+      @return: list of the contents of the tex files
       """
     files_and_content = []
 
     try:
       # if it is a directory, open it as a tarfile
-      with tarfile.open(file_or_dir_path) as sub_tf:
+      with tarfile.open(fileobj=io.BytesIO(project)) as sub_tf:
         for member in sub_tf.getmembers():
           if member.name.endswith(".tex"):
 
@@ -122,7 +210,7 @@ class ArxivIterator(DocumentIterator):
             try:
               file_content = file_content.decode("utf-8")
             except UnicodeDecodeError:
-              # self._logger.info(f"UnicodeDecodeError: {file_or_dir_path}")
+              # self._logger.info(f"UnicodeDecodeError: {name}")
               return None
 
             files_and_content.append(file_content)
@@ -130,23 +218,22 @@ class ArxivIterator(DocumentIterator):
     except tarfile.ReadError:
       # otherwise we try opening it as a gzip file
       try:
-        with gzip.open(file_or_dir_path, "rb") as gz:
-          file_content = gz.read()
+        file_content = gzip.decompress(project)
       except Exception:
         # all fails, we skip this file
-        # self._logger.info(f"[ERROR] {e}: {file_or_dir_path}")
+        # self._logger.info(f"[ERROR] {e}: {name}")
         return None
 
       try:
         file_content = file_content.decode("utf-8")
       except UnicodeDecodeError:
-        # self._logger.info(f"UnicodeDecodeError: {file_or_dir_path}")
+        # self._logger.info(f"UnicodeDecodeError: {name}")
         return None
 
       files_and_content.append(file_content)
 
     except Exception as e:
-      print(f"[ERROR] {e}: {file_or_dir_path}")
+      print(f"[ERROR] {e}: {name}")
       return None
 
     return files_and_content
@@ -220,6 +307,7 @@ class ArxivExtractor(DocumentExtractor):
 
     # join multiple latex files with a newline character
     try:
+      non_arg_macros = _compile_non_arg_macros(non_arg_macros)
       cleaned_latex_file_str = "\n".join(
           self._clean_tex_file(
               file_content=file_content,
@@ -246,79 +334,36 @@ class ArxivExtractor(DocumentExtractor):
       - inline-expand definitions and macros
 
       @param file_content: the content of the tex file as a string.
+      @param non_arg_macros: the macros without arguments compiled by
+          _compile_non_arg_macros
 
       @return: cleaned tex file as a string
       """
     # find the first occurence of a \section-like header and replace everything
-    # before it with an empty string. This matches the following pattern:
-    #   \<section-type>[optional-args]{name}
-    pattern = r"^(.*?)("
-    pattern += r"\\\bchapter\b\*?(?:\[(.*?)\])?\{(.*?)\}|"
-    pattern += r"\\\bpart\b\*?(?:\[(.*?)\])?\{(.*?)\}|"
-    pattern += r"\\\bsection\b\*?(?:\[(.*?)\])?\{(.*?)\}|"
-    pattern += r"\\\bsubsection\b\*?(?:\[(.*?)\])?\{(.*?)\}|"
-    pattern += r"\\\bsubsubsection\b\*?(?:\[(.*?)\])?\{(.*?)\}|"
-    pattern += r"\\\bparagraph\b\*?(?:\[(.*?)\])?\{(.*?)\}"
-    pattern += r"\\\bsubparagraph\b\*?(?:\[(.*?)\])?\{(.*?)\}"
-    pattern += r")"
+    # before it with an empty string
+    match = _SECTION_HEADER_RE.search(file_content)
 
     # if no section like header is found, then we return an empty string
-    if not re.search(pattern, file_content, flags=re.DOTALL):
+    if match is None:
       return ""
 
-    # replace everything with the second group of the match (i.e. everything
-    # after and including the section header)
-    file_content = re.sub(
-        pattern=pattern,
-        repl=r"\2",
-        string=file_content,
-        flags=re.DOTALL  # make sure that the dot matches also newlines
-    )
+    # keep everything after and including the section header
+    file_content = file_content[match.start():]
 
     # remove all line comments
-    file_content = re.sub(
-        pattern=r"(?m)^%.*\n?",
-        repl=r"",
-        string=file_content,
-        flags=re.MULTILINE,
-    )
+    file_content = _LINE_COMMENT_RE.sub("", file_content)
 
     # remove all in comments within a line
-    file_content = re.sub(
-        # pattern matches a "%" that is not preceded by a backslash (=comment)
-        pattern=r"[^\\]%.+$",
-        repl=r"",
-        string=file_content,
-        flags=re.MULTILINE)
+    file_content = _INLINE_COMMENT_RE.sub("", file_content)
 
     # find the first occurence of either \appendix or \bibliography and
     # replace everything after it with an empty string
-    pattern = r"("
-    pattern += r"\\appendix|"
-    pattern += r"\\begin\{references\}|"
-    pattern += r"\\begin\{REFERENCES\}|"
-    pattern += r"\\begin\{thebibliography\}|"
-    pattern += r"\\bibliography\{.*\}"
-    pattern += r").*$"
-
-    file_content = re.sub(
-        pattern=pattern,
-        repl=r'',
-        string=file_content,
-        flags=re.DOTALL  # make sure that the dot matches also newlines
-    )
+    file_content = _APPENDIX_RE.sub("", file_content)
 
     # inline-expand all non-arg macros
-    for macro_name, macro_value in non_arg_macros.items():
-      file_content = re.sub(
-          # make pattern grouped to make sure that the macro is not part
-          # of a longer alphanumeric word
-          pattern=r"(" + macro_name + r")" + r"([^a-zA-Z0-9])",
-          # replace the macro with its value and add back the character that
-          # was matched after the macro
-          repl=macro_value + r"\2",
-          string=file_content,
-      )
+    if non_arg_macros is not None:
+      pattern, expanded_values = non_arg_macros
+      file_content = pattern.sub(lambda match: expanded_values[match.group(1)], file_content)
 
     # inline-expand all macros that use args
     # TODO: inline-expand macros with args
@@ -336,43 +381,15 @@ class ArxivExtractor(DocumentExtractor):
 
       @return: dict
       """
-    # regex for extracting \newcommand macros without arguments
-    non_arg_nc_reg = re.compile(
-        # this regex matches the following:
-        # \newcommand{\macro_name}{macro_value}
-        # \newcommand*{\macro_name}{macro_value}
-        # where macro_name is only allowed to contain letters and numbers;
-        # macro_value can contain any character.
-        pattern=r'\\\bnewcommand\b\*?\{(\\[a-zA-Z0-9]+?)\}\{(.*?)\}$',
-        flags=re.MULTILINE,
-    )
-
-    # regex for extracting \def macros without arguments
-    non_arg_def_reg = re.compile(
-        # this regex matches the following:
-        # \def\macro_name{macro_value}
-        # where macro_name is only allowed to contain letters and numbers;
-        # macro_value can contain any character.
-        pattern=r'\\def\s*(\\[a-zA-Z0-9]+?)\s*\{(.*?)\}$',
-        flags=re.MULTILINE,
-    )
-
     # Extract all user-defined LaTeX macros from the preamble
     macros = {}
-    for reg in [non_arg_nc_reg, non_arg_def_reg]:
+    for reg in [_NON_ARG_NEWCOMMAND_RE, _NON_ARG_DEF_RE]:
       for match in reg.finditer(file_content):
-        # convert the macro name and value to a raw string that can be
-        # used in re.sub
-        macro_name = match \
-            .group(1).encode("unicode-escape").decode("utf-8")
-        macro_val = match \
-            .group(2).encode("unicode-escape").decode("utf-8")
-
-        macros[macro_name] = macro_val
+        macros[match.group(1)] = match.group(2)
 
     return macros
 
-def download_arxiv(output_path: str, output_type: str="jsonl", raw_download_dir=None, keep_raw_download=False, force_download=False, url_limit=None) -> DocumentDataset:
+def download_arxiv(output_path: str, output_type: str="jsonl", raw_download_dir=None, keep_raw_download=False, force_download=False, url_limit=None, records_per_chunk=None, extract_processes=None) -> DocumentDataset:
   """
   Downloads Arxiv tar files and extracts them
 
@@ -386,6 +403,10 @@ def download_arxiv(output_path: str, output_type: str="jsonl", raw_download_dir=
       directly read from them instead.
     url_limit: The maximum number of raw files to download from the snapshot. If None, all
       files from the range of snapshots are downloaded.
+    records_per_chunk: If specified, extracted records are written to disk in chunks of this
+      many records while each file is extracted, bounding the memory used per file.
+    extract_processes: If specified, the projects of each tar file are cleaned by a pool of
+      this many processes. See download_and_extract for the Dask configuration this requires.
   """
   arxiv_urls = get_arxiv_urls()
   if url_limit:
@@ -405,6 +426,6 @@ def download_arxiv(output_path: str, output_type: str="jsonl", raw_download_dir=
     "source_id": str,
     "filename": str,
   }
-  dataset = download_and_extract(arxiv_urls, output_paths, downloader, iterator, extractor, output_format, output_type=output_type, keep_raw_download=keep_raw_download, force_download=force_download)
+  dataset = download_and_extract(arxiv_urls, output_paths, downloader, iterator, extractor, output_format, output_type=output_type, keep_raw_download=keep_raw_download, force_download=force_download, records_per_chunk=records_per_chunk, extract_processes=extract_processes)
 
   return dataset
\ No newline at end of file
@@ -15,6 +15,7 @@
 
 import os
 import subprocess
+from bisect import bisect_left
 import pycld2 as cld2
 import justext
 import lxml
@@ -29,7 +30,7 @@ from nemo_curator.download.doc_builder import (
     DocumentExtractor,
     download_and_extract,
 )
-from nemo_curator.utils.download_utils import get_common_crawl_urls
+from nemo_curator.utils.download_utils import download_file, get_common_crawl_urls
 from nemo_curator.datasets import DocumentDataset
 from nemo_curator.utils.file_utils import expand_outdir_and_mkdir
 
@@ -167,8 +168,9 @@ class CommonCrawlWARCDownloader(DocumentDownloader):
     Args:
       download_dir: Path to store raw compressed WARC files
       aws: If True, uses the s5cmd command to download from the Common Crawl's S3 bucket.
-        If False, uses wget.
-      verbose: If True, logs stdout and stderr of the download command (s5cmd/wget)
+        If False, downloads over HTTPS with nemo_curator.utils.download_utils.download_file,
+        which resumes partial downloads and retries failed ones.
+      verbose: If True, logs stdout and stderr of the s5cmd command
     """
     super().__init__()
     self._download_dir = download_dir
@@ -184,12 +186,15 @@ class CommonCrawlWARCDownloader(DocumentDownloader):
       print(f"WARC file: {output_file} exists. Not downloading")
     else:
       print(f"Downloading {url} and writing to {output_file}")
-      # Download with either wget or s5cmd (aws)
-      if self._aws:
-        s3path = os.path.join("s3://commoncrawl/", urlpath)
-        cmd = ["s5cmd", "cp", s3path, output_file]
-      else:
-        cmd = ["wget", url, "-O", output_file]
+      if not self._aws:
+        try:
+          download_file(url, output_file)
+        except RuntimeError as e:
+          print(f"Failed to download {url} to {output_file}: {e}")
+        return output_file
+
+      s3path = os.path.join("s3://commoncrawl/", urlpath)
+      cmd = ["s5cmd", "cp", s3path, output_file]
       if self._verbose:
         stdout, stderr = None, None
       else:
@@ -226,19 +231,29 @@ class CommonCrawlWARCIterator(DocumentIterator):
     self._counter = 0
     self._log_frequency = log_frequency
 
-  def iterate(self, file_path):
+  def iterate(self, file_path, byte_range=None):
+    """
+    Yields the response records of a WARC file. If byte_range is given as a
+    (start, end) tuple from split, only the records that start within it are read.
+    """
     # Loop over all records in the current WARC
     self._counter = 0
     bname = os.path.split(file_path)[-1]
+    start, end = byte_range if byte_range is not None else (0, None)
     with open(file_path, 'rb') as file_pointer:
+      file_pointer.seek(start)
       ai = ArchiveIterator(file_pointer, arc2warc=True)
       for k, rec in enumerate(ai):
+        # The offset of a record is only known once it has been read,
+        # so the content is read before checking if the record is in range
+        content = rec.content_stream().read() if rec.rec_type == 'response' else None
+        if end is not None and ai.get_record_offset() >= end:
+          break
         # Get the response from the crawl
-        if rec.rec_type == 'response':
+        if content is not None:
           if self._counter > 0 and self._counter % self._log_frequency == 0:
             print(f"Extracted {self._counter} records in WARC")
           self._counter += 1
-          content = rec.content_stream().read()
           warc_id = rec.rec_headers.get_header('WARC-Record-ID')[10:-1]
           url = rec.rec_headers.get_header('WARC-Target-URI')
           meta = {
@@ -248,6 +263,26 @@ class CommonCrawlWARCIterator(DocumentIterator):
           }
           yield meta, content
 
+  def split(self, file_path, num_splits):
+    """
+    Splits a WARC file into num_splits byte ranges of about the same size.
+    The ranges start and end at record boundaries, which in a compressed WARC
+    are the gzip members of the records, so each range can be read on its own.
+    """
+    # Skipping over the records only decompresses them to find where the next one starts
+    with open(file_path, 'rb') as file_pointer:
+      ai = ArchiveIterator(file_pointer, arc2warc=True)
+      offsets = [ai.get_record_offset() for _ in ai]
+
+    size = os.path.getsize(file_path)
+    boundaries = [0]
+    for i in range(1, num_splits):
+      j = bisect_left(offsets, size * i / num_splits)
+      boundaries.append(offsets[j] if j < len(offsets) else size)
+    boundaries.append(size)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
 
 class CommonCrawlWARCExtractor(DocumentExtractor):
 
@@ -271,7 +306,7 @@ class CommonCrawlWARCExtractor(DocumentExtractor):
         else:
           return None, None
 
-def download_common_crawl(output_path: str, start_snapshot: str, end_snapshot: str, output_type: str="jsonl", news=False, aws=False, raw_download_dir=None, keep_raw_download=False, force_download=False, url_limit=None) -> DocumentDataset:
+def download_common_crawl(output_path: str, start_snapshot: str, end_snapshot: str, output_type: str="jsonl", news=False, aws=False, raw_download_dir=None, keep_raw_download=False, force_download=False, url_limit=None, records_per_chunk=None, extract_processes=None, files_per_partition=1, prefetch_depth=0, splits_per_file=1) -> DocumentDataset:
   """
   Downloads Common Crawl WARC snapshots and extracts them using jusText
 
@@ -294,6 +329,15 @@ def download_common_crawl(output_path: str, start_snapshot: str, end_snapshot: s
       directly read from them instead.
     url_limit: The maximum number of raw files to download from the snapshot. If None, all
       files from the range of snapshots are downloaded.
+    records_per_chunk: If specified, extracted records are written to disk in chunks of this
+      many records while each file is extracted, bounding the memory used per file.
+    extract_processes: If specified, the records of each WARC file are extracted by a pool of
+      this many processes. See download_and_extract for the Dask configuration this requires.
+    files_per_partition: The number of WARC files downloaded and extracted by each partition.
+    prefetch_depth: The number of files of a partition downloaded ahead in background threads
+      while an earlier file is extracted, overlapping download and extraction.
+    splits_per_file: The number of partitions each WARC file is extracted by. Every WARC file
+      is indexed once and split into byte ranges of about the same size at record boundaries.
   """
   common_crawl_urls = get_common_crawl_urls(starting_snapshot=start_snapshot, ending_snapshot=end_snapshot, news=news)
   if url_limit:
@@ -315,6 +359,6 @@ def download_common_crawl(output_path: str, start_snapshot: str, end_snapshot: s
     "source_id": str,
     "filename": str,
   }
-  dataset = download_and_extract(common_crawl_urls, output_paths, downloader, iterator, extractor, output_format, output_type=output_type, keep_raw_download=keep_raw_download, force_download=force_download)
+  dataset = download_and_extract(common_crawl_urls, output_paths, downloader, iterator, extractor, output_format, output_type=output_type, keep_raw_download=keep_raw_download, force_download=force_download, records_per_chunk=records_per_chunk, extract_processes=extract_processes, files_per_partition=files_per_partition, prefetch_depth=prefetch_depth, splits_per_file=splits_per_file)
 
   return dataset
\ No newline at end of file
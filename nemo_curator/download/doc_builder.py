@@ -13,12 +13,23 @@
 # limitations under the License.
 
 import importlib
+import json
+import multiprocessing
+import threading
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
 from typing import List, Tuple
 import dask.dataframe as dd
 from dask import delayed, compute
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import os
+from distributed import Lock, get_client
 
 from nemo_curator.datasets import DocumentDataset
 from nemo_curator.utils.distributed_utils import single_partition_write_with_filename, read_single_partition
@@ -48,6 +59,14 @@ class DocumentIterator(ABC):
   def iterate(self, file_path):
     pass
 
+  def split(self, file_path, num_splits):
+    """
+    Splits a downloaded file into num_splits (start, end) byte ranges, each of which
+    is read by passing it to iterate as its byte_range argument. Iterators that
+    support this let download_and_extract extract one file in several partitions.
+    """
+    raise NotImplementedError(f"{type(self).__name__} cannot split a file into byte ranges")
+
 
 class DocumentExtractor(ABC):
   """ Abstract class for extracting text from records read from disk """
@@ -92,20 +111,74 @@ def import_extractor(extractor_path):
                      "in nemo_curator.download.docbuilder")
   return extractor_class
 
-def _download_and_extract_single_partition(paths: List[Tuple[str, str]], downloader: DocumentDownloader, iterator: DocumentIterator, extractor: DocumentExtractor, output_type: str, keep_raw_download: bool, force_download: bool) -> pd.DataFrame:
-  url, output_path = paths
+def _batches(items, batch_size):
+  batch = []
+  for item in items:
+    batch.append(item)
+    if len(batch) == batch_size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+
+# The extractor of each process in the pool of _extract_in_processes
+_process_extractor = None
+
+
+def _init_extract_process(extractor: DocumentExtractor):
+  global _process_extractor
+  _process_extractor = extractor
+
+
+def _extract_batch(contents):
+  return [_process_extractor.extract(content) for content in contents]
+
+
+def _extract_in_processes(items, extractor: DocumentExtractor, processes: int, chunksize: int):
+  """
+  Extracts the contents of (record_meta, content) items in a pool of processes,
+  chunksize records per task. At most two tasks per process are queued at a time,
+  so memory stays bounded, and results are yielded in the order of the items.
+  """
+  if multiprocessing.current_process().daemon:
+    raise RuntimeError(
+        "Extraction processes cannot be started from a daemonic process. "
+        "Set the Dask config 'distributed.worker.daemon' to False before starting the cluster."
+    )
+  pending = deque()
+  # Forking a multi-threaded Dask worker is unsafe, so processes are forked from
+  # a single-threaded server that has imported NeMo Curator once per worker
+  context = multiprocessing.get_context("forkserver")
+  context.set_forkserver_preload([__name__])
+  with ProcessPoolExecutor(processes, mp_context=context, initializer=_init_extract_process, initargs=(extractor,)) as pool:
+    for batch in _batches(items, chunksize):
+      record_metas = [record_meta for record_meta, _ in batch]
+      pending.append((record_metas, pool.submit(_extract_batch, [content for _, content in batch])))
+      if len(pending) >= 2 * processes:
+        record_metas, future = pending.popleft()
+        yield from zip(record_metas, future.result())
+    while pending:
+      record_metas, future = pending.popleft()
+      yield from zip(record_metas, future.result())
+
 
-  if os.path.exists(output_path) and not force_download:
-    partition = read_single_partition([output_path], backend="pandas", filetype=output_type, add_filename=True)
-    return partition
+def _extract_records(downloaded_file: str, iterator: DocumentIterator, extractor: DocumentExtractor, extract_processes: int=None, extract_chunksize: int=64, byte_range: Tuple[int, int]=None):
+  """
+  Yields the extracted text and metadata of every record in a downloaded file,
+  or only in byte_range of the file if it is given
+  """
+  if byte_range is None:
+    items = iterator.iterate(downloaded_file)
+  else:
+    items = iterator.iterate(downloaded_file, byte_range=byte_range)
+  if extract_processes is None:
+    extracted_items = ((record_meta, extractor.extract(content)) for record_meta, content in items)
+  else:
+    extracted_items = _extract_in_processes(items, extractor, extract_processes, extract_chunksize)
 
-  downloaded_file = downloader.download(url)
-  records = []
   # Iterate over all records in file
-  for item in iterator.iterate(downloaded_file):
-    record_meta, content = item
-    # Extract the text from the record
-    extracted = extractor.extract(content)
+  for record_meta, extracted in extracted_items:
     if extracted is not None:
       text_meta, text = extracted
       if text is not None:
@@ -114,19 +187,260 @@ def _download_and_extract_single_partition(paths: List[Tuple[str, str]], downloa
             **text_meta,
             **record_meta,
         }
-        records.append(line)
-  
-  partition = pd.DataFrame(records)
+        yield line
+
+
+def _record_chunks(records, filename, chunk_size):
+  for chunk in _batches(records, chunk_size):
+    yield pd.DataFrame(chunk).assign(filename=filename)
+
+
+def _arrow_schema(output_format: dict) -> pa.Schema:
+  fields = []
+  for name, dtype in output_format.items():
+    dtype = np.dtype(dtype)
+    if dtype.kind in ("U", "O"):
+      fields.append(pa.field(name, pa.string()))
+    else:
+      fields.append(pa.field(name, pa.from_numpy_dtype(dtype)))
+  return pa.schema(fields)
+
+
+def _write_records_in_chunks(records, output_path: str, output_type: str, output_format: dict, records_per_chunk: int) -> int:
+  """
+  Writes records to output_path while they are being extracted, records_per_chunk
+  at a time, so that only one chunk of records is held in memory.
+  JSONL chunks are appended to the file and Parquet chunks are written as row groups.
+  The file is written under a temporary name and only appears at output_path once complete,
+  so an interrupted extraction is never mistaken for a finished one.
+
+  Returns the number of records written.
+  """
+  filename = os.path.basename(output_path)
+  tmp_path = output_path + ".tmp"
+  num_records = 0
+  try:
+    if output_type == "jsonl":
+      with open(tmp_path, "w", encoding="utf-8") as f:
+        for chunk in _record_chunks(records, filename, records_per_chunk):
+          chunk.to_json(f, orient="records", lines=True, force_ascii=False)
+          num_records += len(chunk)
+    elif output_type == "parquet":
+      # Every row group must share one schema, so it is taken from output_format
+      schema = _arrow_schema({"filename": str, **output_format})
+      with pq.ParquetWriter(tmp_path, schema) as writer:
+        for chunk in _record_chunks(records, filename, records_per_chunk):
+          chunk = chunk.reindex(columns=schema.names)
+          writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+          num_records += len(chunk)
+    else:
+      raise ValueError(f"Unknown output type: {output_type}")
+  except BaseException:
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
+    raise
+
+  if num_records == 0:
+    os.remove(tmp_path)
+  else:
+    os.replace(tmp_path, output_path)
+  return num_records
+
+
+def _prefetch_downloads(urls: List[str], download, prefetch_depth: int=0, prefetch_max_bytes: int=None):
+  """
+  Yields the file downloaded by download(url) for every url in order. While a file is being used,
+  up to prefetch_depth of the following urls are downloaded in background threads.
+  No new download is started while the files that were downloaded ahead
+  take up prefetch_max_bytes or more on disk.
+  """
+  if prefetch_depth == 0:
+    for url in urls:
+      yield download(url)
+    return
+
+  def prefetched_bytes():
+    done = [future.result() for future in pending if future.done()]
+    return sum(os.path.getsize(path) for path in done if os.path.exists(path))
+
+  pending = deque()
+  urls = iter(urls)
+  with ThreadPoolExecutor(prefetch_depth) as pool:
+    while True:
+      # Keep the next url and prefetch_depth urls after it downloading
+      while len(pending) <= prefetch_depth:
+        if pending and prefetch_max_bytes is not None and prefetched_bytes() >= prefetch_max_bytes:
+          break
+        url = next(urls, None)
+        if url is None:
+          break
+        pending.append(pool.submit(download, url))
+      if not pending:
+        return
+      yield pending.popleft().result()
+
+
+# Locks of the files being split when no Dask client is running
+_local_locks = {}
+_local_locks_lock = threading.Lock()
+
+
+def _url_lock(url: str):
+  """
+  Returns the lock held while the file of a url is downloaded and split.
+  It is a Dask lock shared by every worker when a Dask client is running.
+  """
+  try:
+    get_client()
+  except ValueError:
+    with _local_locks_lock:
+      return _local_locks.setdefault(url, threading.Lock())
+  return Lock(name=f"download_and_extract-{url}")
+
+
+def _split_output_path(output_path: str, split: int, num_splits: int) -> str:
+  path = Path(output_path)
+  return str(path.with_name(f"{path.stem}-{split:05d}-of-{num_splits:05d}{path.suffix}"))
+
+
+def _splits_file(downloaded_file: str) -> str:
+  return f"{downloaded_file}.splits.json"
+
+
+def _write_splits(downloaded_file: str, splits: dict):
+  # Written under a temporary name so other partitions never read a partial file
+  splits_file = _splits_file(downloaded_file)
+  with open(splits_file + ".tmp", "w") as f:
+    json.dump(splits, f)
+  os.replace(splits_file + ".tmp", splits_file)
+
+
+def _read_splits(downloaded_file: str) -> dict:
+  with open(_splits_file(downloaded_file)) as f:
+    return json.load(f)
+
+
+def _download_and_split(url: str, downloader: DocumentDownloader, iterator: DocumentIterator, num_splits: int) -> str:
+  """
+  Downloads the file of a url that is extracted by num_splits partitions and splits it
+  into byte ranges. Only the first partition of the file to get here downloads and splits it.
+  The byte ranges are saved next to the file with the splits that have been extracted,
+  so that the other partitions, and later runs, find them there.
+  """
+  with _url_lock(url):
+    downloaded_file = downloader.download(url)
+    if not os.path.exists(_splits_file(downloaded_file)) or _read_splits(downloaded_file)["num_splits"] != num_splits:
+      byte_ranges = iterator.split(downloaded_file, num_splits)
+      _write_splits(downloaded_file, {"num_splits": num_splits, "byte_ranges": byte_ranges, "extracted": []})
+  return downloaded_file
+
+
+def _remove_extracted_split(url: str, downloaded_file: str, split: int):
+  """
+  Records that a split of a downloaded file has been extracted and removes
+  the file once all of its splits have been
+  """
+  with _url_lock(url):
+    splits = _read_splits(downloaded_file)
+    splits["extracted"] = sorted(set(splits["extracted"]) | {split})
+    if len(splits["extracted"]) < splits["num_splits"]:
+      _write_splits(downloaded_file, splits)
+      return
+    os.remove(downloaded_file)
+    os.remove(_splits_file(downloaded_file))
+
+
+def _extract_downloaded_file(downloaded_file: str, output_path: str, iterator: DocumentIterator, extractor: DocumentExtractor, output_type: str, extract_processes: int, extract_chunksize: int, byte_range: Tuple[int, int]=None) -> pd.DataFrame:
+  records = _extract_records(downloaded_file, iterator, extractor, extract_processes, extract_chunksize, byte_range)
+  partition = pd.DataFrame(list(records))
   filename = os.path.basename(output_path)
   output_dir = os.path.dirname(output_path)
   partition["filename"] = filename
   single_partition_write_with_filename(partition, output_dir, output_type=output_type)
-  if not keep_raw_download:
-    os.remove(downloaded_file)
 
   return partition
 
-def download_and_extract(urls: List[str], output_paths: List[str], downloader: DocumentDownloader, iterator: DocumentIterator, extractor: DocumentExtractor, output_format: dict, output_type: str="jsonl", keep_raw_download=False, force_download=False) -> DocumentDataset:
+
+def _write_downloaded_file(downloaded_file: str, output_path: str, iterator: DocumentIterator, extractor: DocumentExtractor, output_type: str, output_format: dict, records_per_chunk: int, extract_processes: int, extract_chunksize: int, byte_range: Tuple[int, int]=None) -> str:
+  """
+  Extracts a downloaded file to disk records_per_chunk records at a time.
+  Returns the path of the written file, or None if the file had no records.
+  """
+  records = _extract_records(downloaded_file, iterator, extractor, extract_processes, extract_chunksize, byte_range)
+  # Match the name single_partition_write_with_filename writes to
+  output_file = os.path.join(os.path.dirname(output_path), f"{Path(output_path).stem}.{output_type}")
+  num_records = _write_records_in_chunks(records, output_file, output_type, output_format, records_per_chunk)
+  if num_records == 0:
+    return None
+  return output_file
+
+
+def _download_and_extract_paths(paths: List[Tuple[str, str, int]], extract, read_existing, downloader: DocumentDownloader, iterator: DocumentIterator, keep_raw_download: bool, force_download: bool, prefetch_depth: int, prefetch_max_bytes: int, splits_per_file: int) -> list:
+  """
+  Downloads the (url, output_path, split) paths of a partition and calls
+  extract(downloaded_file, output_path, byte_range) on each of them.
+  The split of a path is None, or the byte range of its file that it extracts
+  when every file is split into splits_per_file byte ranges.
+  Paths whose output already exists are passed to read_existing instead.
+  Returns the results of extract and read_existing, in the order of paths.
+  """
+  results = [None] * len(paths)
+  to_download = []
+  for i, (url, output_path, split) in enumerate(paths):
+    if os.path.exists(output_path) and not force_download:
+      results[i] = read_existing(output_path)
+    else:
+      to_download.append(i)
+
+  if splits_per_file > 1:
+    download = partial(_download_and_split, downloader=downloader, iterator=iterator, num_splits=splits_per_file)
+  else:
+    download = downloader.download
+  downloaded_files = _prefetch_downloads([paths[i][0] for i in to_download], download, prefetch_depth, prefetch_max_bytes)
+  for i, downloaded_file in zip(to_download, downloaded_files):
+    url, output_path, split = paths[i]
+    byte_range = None
+    if split is not None:
+      byte_range = tuple(_read_splits(downloaded_file)["byte_ranges"][split])
+    results[i] = extract(downloaded_file, output_path, byte_range=byte_range)
+    if keep_raw_download:
+      continue
+    if split is None:
+      os.remove(downloaded_file)
+    else:
+      _remove_extracted_split(url, downloaded_file, split)
+
+  return results
+
+
+def _download_and_extract_single_partition(paths: List[Tuple[str, str, int]], downloader: DocumentDownloader, iterator: DocumentIterator, extractor: DocumentExtractor, output_type: str, keep_raw_download: bool, force_download: bool, extract_processes: int=None, extract_chunksize: int=64, prefetch_depth: int=0, prefetch_max_bytes: int=None, splits_per_file: int=1) -> pd.DataFrame:
+  """
+  Downloads and extracts the (url, output_path, split) paths of a partition
+  """
+  extract = partial(_extract_downloaded_file, iterator=iterator, extractor=extractor, output_type=output_type, extract_processes=extract_processes, extract_chunksize=extract_chunksize)
+  def read_existing(output_path):
+    return read_single_partition([output_path], backend="pandas", filetype=output_type, add_filename=True)
+
+  partitions = _download_and_extract_paths(paths, extract, read_existing, downloader, iterator, keep_raw_download, force_download, prefetch_depth, prefetch_max_bytes, splits_per_file)
+
+  # Files without any records would turn the dtypes of missing columns into object
+  non_empty = [partition for partition in partitions if len(partition) > 0]
+  if len(non_empty) == 0:
+    return partitions[0]
+  return pd.concat(non_empty, ignore_index=True)
+
+
+def _download_and_write_single_partition(paths: List[Tuple[str, str, int]], downloader: DocumentDownloader, iterator: DocumentIterator, extractor: DocumentExtractor, output_type: str, keep_raw_download: bool, force_download: bool, output_format: dict, records_per_chunk: int, extract_processes: int=None, extract_chunksize: int=64, prefetch_depth: int=0, prefetch_max_bytes: int=None, splits_per_file: int=1) -> List[str]:
+  """
+  Downloads and extracts the (url, output_path, split) paths of a partition to disk
+  records_per_chunk records at a time. Returns the paths of the non-empty output files.
+  """
+  extract = partial(_write_downloaded_file, iterator=iterator, extractor=extractor, output_type=output_type, output_format=output_format, records_per_chunk=records_per_chunk, extract_processes=extract_processes, extract_chunksize=extract_chunksize)
+  output_files = _download_and_extract_paths(paths, extract, lambda output_path: output_path, downloader, iterator, keep_raw_download, force_download, prefetch_depth, prefetch_max_bytes, splits_per_file)
+
+  return [output_file for output_file in output_files if output_file is not None]
+
+def download_and_extract(urls: List[str], output_paths: List[str], downloader: DocumentDownloader, iterator: DocumentIterator, extractor: DocumentExtractor, output_format: dict, output_type: str="jsonl", keep_raw_download=False, force_download=False, records_per_chunk: int=None, extract_processes: int=None, extract_chunksize: int=64, files_per_partition: int=1, prefetch_depth: int=0, prefetch_max_bytes: int=None, splits_per_file: int=1) -> DocumentDataset:
   """
   Downloads and extracts a dataset into a format accepted by the NeMo Curator
 
@@ -142,6 +456,30 @@ def download_and_extract(urls: List[str], output_paths: List[str], downloader: D
     keep_raw_download: Whether to keep the pre-extracted download file.
     force_download: If False, will skip processing all files in output_paths that already exist and
       directly read from them instead.
+    records_per_chunk: If specified, extracted records are written to disk in chunks of this many
+      records while the downloaded file is iterated over, instead of all at once after the whole
+      file has been extracted. This bounds the memory used by the extraction of large files.
+      The files are then extracted when download_and_extract is called, and the partitions
+      of the returned dataset lazily read the written files back from disk.
+    extract_processes: If specified, the records of each file are extracted by a pool of this many
+      processes instead of one record at a time in the Dask task, with the extracted records kept
+      in their original order. This lets a single task use every core of a node.
+      Dask workers are daemonic processes by default and cannot start a pool,
+      so the cluster must be created with the Dask config 'distributed.worker.daemon' set to False.
+    extract_chunksize: The number of records sent to an extraction process at a time.
+    files_per_partition: The number of consecutive urls downloaded and extracted by each partition.
+    prefetch_depth: The number of files of a partition that are downloaded in background threads
+      while an earlier file of the partition is extracted, overlapping download and extraction.
+      Requires files_per_partition to be greater than 1.
+    prefetch_max_bytes: If specified, no more files are prefetched while the files that were
+      downloaded ahead take up this many bytes on disk.
+    splits_per_file: The number of byte ranges each file is split into with iterator.split,
+      each of which is extracted as if it were a file of its own. This balances the partitions
+      of datasets made of a few large files. The output of the i-th range of a file is
+      written to "<output_path stem>-<i>-of-<splits_per_file>.<output_type>", so an
+      interrupted run only extracts the ranges that have no output yet. The first partition
+      of a file downloads and splits it, and the byte ranges are saved next to the
+      downloaded file in "<downloaded file>.splits.json".
   
   Returns:
     A DocumentDataset of the downloaded data
@@ -150,25 +488,75 @@ def download_and_extract(urls: List[str], output_paths: List[str], downloader: D
     raise ValueError("Different number of urls and output_paths")
 
   output_format = dict(sorted(output_format.items()))
-  df = dd.from_map(
-    _download_and_extract_single_partition,
-    zip(urls, output_paths),
+  if splits_per_file > 1:
+    paths = [
+      (url, _split_output_path(output_path, split, splits_per_file), split)
+      for url, output_path in zip(urls, output_paths)
+      for split in range(splits_per_file)
+    ]
+  else:
+    paths = [(url, output_path, None) for url, output_path in zip(urls, output_paths)]
+  partition_paths = [paths[i:i + files_per_partition] for i in range(0, len(paths), files_per_partition)]
+  download_kwargs = dict(
     downloader=downloader,
     iterator=iterator,
     extractor=extractor,
     output_type=output_type,
     keep_raw_download=keep_raw_download,
     force_download=force_download,
-    enforce_metadata=False,
-    meta=output_format,
+    extract_processes=extract_processes,
+    extract_chunksize=extract_chunksize,
+    prefetch_depth=prefetch_depth,
+    prefetch_max_bytes=prefetch_max_bytes,
+    splits_per_file=splits_per_file,
   )
+  if records_per_chunk is not None:
+    # The records are written while they are extracted, so the partitions only read them back once used
+    output_files = compute(*[
+      delayed(_download_and_write_single_partition)(paths, output_format=output_format, records_per_chunk=records_per_chunk, **download_kwargs)
+      for paths in partition_paths
+    ])
+    output_files = [files for files in output_files if len(files) > 0]
+    if len(output_files) == 0:
+      return DocumentDataset(dd.from_pandas(pd.DataFrame({"filename": []}), npartitions=1))
+    df = dd.from_map(
+      read_single_partition,
+      output_files,
+      backend="pandas",
+      filetype=output_type,
+      add_filename=True,
+      enforce_metadata=False,
+      meta=output_format,
+    )
+  else:
+    df = dd.from_map(
+      _download_and_extract_single_partition,
+      partition_paths,
+      **download_kwargs,
+      enforce_metadata=False,
+      meta=output_format,
+    )
 
   return DocumentDataset(df)
 
-def batch_download(urls: List[str], downloader: DocumentDownloader) -> List[str]:
+def batch_download(urls: List[str], downloader: DocumentDownloader, num_threads: int=None) -> List[str]:
   """
   Downloads all the urls using the downloader in parallel
+
+  Args:
+    urls: A list of urls to download
+    downloader: A DocumentDownloader that handles retrieving each file from its url and saving it to storage
+    num_threads: If specified, the urls are downloaded by a pool of this many threads in the
+      current process, bounding the number of concurrent downloads. Otherwise every url is a
+      Dask task, and the number of concurrent downloads is the number of threads of the cluster.
+
+  Returns:
+    The paths of the downloaded files, in the order of urls
   """
+  if num_threads is not None:
+    with ThreadPoolExecutor(num_threads) as pool:
+      return list(pool.map(downloader.download, urls))
+
   delayed_downloads = [delayed(downloader.download)(url) for url in urls]
   
-  return compute(*delayed_downloads)
\ No newline at end of file
+  return list(compute(*delayed_downloads))
\ No newline at end of file
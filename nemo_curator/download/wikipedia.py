@@ -14,12 +14,14 @@
 
 import os
 import re
-import subprocess
 import bz2
 import codecs
+import time
 import mwparserfromhell
+from bisect import bisect_left
+from mwparserfromhell.nodes import Tag, Wikilink
 from urllib.parse import urlparse, quote
-import xml.etree.cElementTree as etree
+from xml.sax.saxutils import unescape
 
 from nemo_curator.download.doc_builder import (
     DocumentDownloader,
@@ -28,7 +30,7 @@ from nemo_curator.download.doc_builder import (
     download_and_extract
 )
 from nemo_curator.datasets import DocumentDataset
-from nemo_curator.utils.download_utils import get_wikipedia_urls
+from nemo_curator.utils.download_utils import download_file, get_wikipedia_urls
 from nemo_curator.utils.file_utils import expand_outdir_and_mkdir
 from distributed import Lock
 
@@ -556,12 +558,33 @@ CAT_ALIASES = {
 }
 
 
+def _multistream_index_path(path):
+  """
+  Returns the path or url of the index of the bz2 stream offsets of a multistream dump file,
+  e.g. enwiki-20240201-pages-articles-multistream-index1.txt-p1p41242.bz2 for
+  enwiki-20240201-pages-articles-multistream1.xml-p1p41242.bz2
+  """
+  head, name = os.path.split(path)
+  name = name.replace("multistream", "multistream-index", 1).replace(".xml", ".txt", 1)
+  return f"{head}/{name}" if head else name
+
+
 class WikipediaDownloader(DocumentDownloader):
 
-  def __init__(self, download_dir, verbose=False):
+  def __init__(self, download_dir, verbose=False, download_index=False):
+    """
+    Creates a downloader
+
+    Args:
+      download_dir: Path to store the raw bz2 dump files
+      verbose: Not used by this downloader
+      download_index: If True, also downloads the index of the bz2 stream offsets of
+        every multistream dump file, which WikipediaIterator.split reads.
+    """
     super().__init__()
     self._download_dir = download_dir
     self._verbose = verbose
+    self._download_index = download_index
     self._lock = Lock(name="wikipedia_downloader")
 
   def download(self, url):
@@ -572,24 +595,83 @@ class WikipediaDownloader(DocumentDownloader):
       print(f"bz2 file: {output_file} exists. Not downloading")
     else:
       print(f"Downloading {url} and writing to {output_file}")
-      # Download with either wget or s5cmd (aws)
-      cmd = ["wget", url, "-O", output_file]
-      if self._verbose:
-        stdout, stderr = None, None
-      else:
-        stdout, stderr = subprocess.DEVNULL, subprocess.DEVNULL
+      # Wikipedia limits the number of downloads per ip address
+      with self._lock:
+        try:
+          download_file(url, output_file)
+        except RuntimeError as e:
+          print(f"Failed to download {url} to {output_file}: {e}")
+
+    index_file = _multistream_index_path(output_file)
+    if self._download_index and not os.path.exists(index_file):
+      index_url = _multistream_index_path(url)
+      print(f"Downloading {index_url} and writing to {index_file}")
       with self._lock:
-        p = subprocess.run(
-            cmd,
-            stdout=stdout,
-            stderr=stderr,
-        )
-      if p.returncode != 0:
-        print(f"Failed to download {url} to {output_file}")
+        try:
+          download_file(index_url, index_file)
+        except RuntimeError as e:
+          print(f"Failed to download {index_url} to {index_file}: {e}")
 
     return output_file
 
 
+def _decompress_streams(file_path, byte_range=None, chunk_size=1 << 20):
+  """
+  Yields the decompressed data of the consecutive bz2 streams of a file,
+  or only of the streams in byte_range. Each stream of a multistream dump
+  is decompressed on its own, so it can be read from its offset.
+  """
+  start, end = byte_range if byte_range is not None else (0, None)
+  decompressor = bz2.BZ2Decompressor()
+  with open(file_path, 'rb') as f:
+    f.seek(start)
+    remaining = end - start if end is not None else None
+    while remaining != 0:
+      data = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+      if not data:
+        break
+      if remaining is not None:
+        remaining -= len(data)
+      while data:
+        if decompressor.eof:
+          decompressor = bz2.BZ2Decompressor()
+        yield decompressor.decompress(data)
+        data = decompressor.unused_data if decompressor.eof else b""
+
+
+def _iterate_pages(file_path, byte_range=None):
+  """
+  Yields the XML of every <page> element of a dump as a string. Wiki text is
+  escaped in the dump, so the tags can be found without parsing the XML.
+  """
+  decoder = codecs.getincrementaldecoder("utf-8")()
+  buffer = ""
+  for data in _decompress_streams(file_path, byte_range):
+    buffer += decoder.decode(data)
+    end = 0
+    while True:
+      page_start = buffer.find("<page>", end)
+      if page_start == -1:
+        # Only keep what could be the beginning of the next "<page>" tag
+        end = max(end, len(buffer) - len("<page>") + 1)
+        break
+      page_end = buffer.find("</page>", page_start)
+      if page_end == -1:
+        end = page_start
+        break
+      end = page_end + len("</page>")
+      yield buffer[page_start:end]
+    buffer = buffer[end:]
+
+
+# The fields of a <page> element, the first <id> of which is the id of the page
+_TITLE_RE = re.compile(r"<title>(.*?)</title>", re.S)
+_NS_RE = re.compile(r"<ns>(.*?)</ns>")
+_ID_RE = re.compile(r"<id>(.*?)</id>")
+_TEXT_RE = re.compile(r"<text\b[^>]*?(?:/>|>(.*?)</text>)", re.S)
+_XML_ENTITIES = {"&quot;": '"', "&#039;": "'"}
+
+
 class WikipediaIterator(DocumentIterator):
 
   def __init__(self, language='en', log_frequency=1000):
@@ -598,40 +680,36 @@ class WikipediaIterator(DocumentIterator):
     self._log_frequency = log_frequency
     self._counter = 0
 
-  def iterate(self, file_path):
+  def iterate(self, file_path, byte_range=None):
+    """
+    Yields the articles of a pages-articles dump. If byte_range is given as a
+    (start, end) tuple from split, only the bz2 streams within it are read.
+    """
     self._counter = 0
     bname = os.path.split(file_path)[-1]
-    input_file = bz2.BZ2File(filename=file_path)
-    utf_f = codecs.getreader("utf-8")(input_file)
-    context = etree.iterparse(utf_f, events=("end",))
 
-    for i, (unused_event, elem) in enumerate(context):
-      if not elem.tag.endswith("page"):
-        continue
+    for page in _iterate_pages(file_path, byte_range):
       if self._counter > 0 and self._counter % self._log_frequency == 0:
         print(f"Extracted {self._counter} articles from {file_path}")
       self._counter += 1
 
-      namespace = elem.tag[:-4]
-      title = elem.find(f"./{namespace}title").text
-      ns = elem.find(f"./{namespace}ns").text
-      id_ = elem.find(f"./{namespace}id").text
-      red_ = elem.find(f"./{namespace}redirect")
-
-      url = f"https://{self._language}.wikipedia.org/wiki/{quote(title)}"
-
       # Filter pages that are not in the "main" namespace.
-      if ns != "0":
-        elem.clear()
+      if _NS_RE.search(page).group(1) != "0":
         continue
 
-      raw_content = elem.find(f"./{namespace}revision/{namespace}text").text
-      elem.clear()
-
+      revision_start = page.find("<revision>")
       # Filter redirects.
-      if raw_content is None or red_ is not None:
+      if "<redirect" in page[:revision_start]:
+        continue
+      text_match = _TEXT_RE.search(page, revision_start)
+      if text_match is None or text_match.group(1) is None:
         continue
 
+      title = unescape(_TITLE_RE.search(page).group(1), _XML_ENTITIES)
+      id_ = _ID_RE.search(page).group(1)
+      raw_content = unescape(text_match.group(1), _XML_ENTITIES)
+      url = f"https://{self._language}.wikipedia.org/wiki/{quote(title)}"
+
       yield {
           'title': title,
           'id': id_,
@@ -640,86 +718,136 @@ class WikipediaIterator(DocumentIterator):
           'source_id': f'{bname}',
       }, raw_content
 
+  def split(self, file_path, num_splits):
+    """
+    Splits a multistream dump into num_splits byte ranges of about the same size
+    at the bz2 stream offsets listed in its index, which WikipediaDownloader
+    downloads next to it when created with download_index=True.
+    """
+    size = os.path.getsize(file_path)
+    index_file = _multistream_index_path(file_path)
+    if not os.path.exists(index_file):
+      print(f"No stream index {index_file} for {file_path}. Reading the file in a single split")
+      return [(0, size)] + [(size, size)] * (num_splits - 1)
+
+    # Every line of the index is "<stream offset>:<page id>:<title>"
+    with bz2.open(index_file, "rt", encoding="utf-8") as f:
+      offsets = sorted({int(line.split(":", 1)[0]) for line in f})
+
+    # The stream before the first page only holds the site information
+    first = offsets[0] if offsets else 0
+    boundaries = [first]
+    for i in range(1, num_splits):
+      j = bisect_left(offsets, first + (size - first) * i / num_splits)
+      boundaries.append(offsets[j] if j < len(offsets) else size)
+    boundaries.append(size)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
 
 class WikipediaExtractor(DocumentExtractor):
 
-  def __init__(self, language='en', parser=mwparserfromhell):
+  def __init__(self, language='en', parser=mwparserfromhell, log_frequency=None):
+    """
+    Creates an extractor of the text of Wikipedia articles
+
+    Args:
+      language: The language of the articles, which selects the aliases of
+        media and category links that are removed or cleaned.
+      parser: The module parsing the wiki text of an article.
+      log_frequency: If specified, the time spent in each step of the extraction
+        is printed every log_frequency articles.
+    """
     super().__init__()
     self._language = language
     self._parser = parser
-
-  def extract(self, content):
-    wikicode = self._parser.parse(content)
+    self._log_frequency = log_frequency
 
     # Filters for magic words that are parser instructions -- e.g., __NOTOC__
-    re_rm_magic = re.compile("__[A-Z]*__", flags=re.UNICODE)
+    self._re_rm_magic = re.compile("__[A-Z]*__", flags=re.UNICODE)
 
     # Filters for file/image links.
     media_prefixes = "|".join(["File", "Image", "Media"] +
                               MEDIA_ALIASES.get(self._language, []))
-    re_rm_wikilink = re.compile(f"^(?:{media_prefixes}):",
-                                flags=re.IGNORECASE | re.UNICODE)
-
-    def rm_wikilink(obj):
-      return bool(re_rm_wikilink.match(str(obj.title)))
-
-    # Filters for references and tables
-    def rm_tag(obj):
-      return str(obj.tag) in {"ref", "table"}
+    self._re_rm_wikilink = re.compile(f"^(?:{media_prefixes}):",
+                                      flags=re.IGNORECASE | re.UNICODE)
 
     # Leave category links in-place but remove the category prefixes
     cat_prefixes = "|".join(["Category"] + CAT_ALIASES.get(self._language, []))
-    re_clean_wikilink = re.compile(f"^(?:{cat_prefixes}):",
-                                   flags=re.IGNORECASE | re.UNICODE)
-
-    def is_category(obj):
-      return bool(re_clean_wikilink.match(str(obj.title)))
-
-    def clean_wikilink(obj):
-      text = obj.__strip__()
-      text = re.sub(re_clean_wikilink, "", text)
-      obj.text = text
-
-    def try_replace_obj(obj):
-      try:
-        clean_wikilink(obj)
-      except ValueError:
-        # For unknown reasons, objects are sometimes not found.
-        pass
-
-    def try_remove_obj(obj, section):
-      try:
-        section.remove(obj)
-      except ValueError:
-        # For unknown reasons, objects are sometimes not found.
-        pass
+    self._re_clean_wikilink = re.compile(f"^(?:{cat_prefixes}):",
+                                         flags=re.IGNORECASE | re.UNICODE)
+
+    # Seconds spent parsing, cleaning and stripping the sections of the articles extracted so far
+    self.num_articles = 0
+    self.parse_time = 0.0
+    self.clean_time = 0.0
+    self.strip_time = 0.0
+
+  def _clean(self, wikicode):
+    """
+    Removes media links, references and tables from parsed wiki text and the
+    prefixes of its category links, in a single walk over the nodes of the text.
+    Nodes are deleted from the list that holds them, which is cheaper than
+    Wikicode.remove searching the whole text for every node.
+    """
+    nodes = wikicode.nodes
+    i = 0
+    while i < len(nodes):
+      node = nodes[i]
+      if isinstance(node, Tag):
+        # Filters for references and tables
+        if str(node.tag) in {"ref", "table"}:
+          del nodes[i]
+          continue
+      elif isinstance(node, Wikilink):
+        title = str(node.title)
+        if self._re_rm_wikilink.match(title):
+          del nodes[i]
+          continue
+        if self._re_clean_wikilink.match(title):
+          node.text = self._re_clean_wikilink.sub("", node.__strip__())
+          i += 1
+          continue
+      for child in node.__children__():
+        self._clean(child)
+      i += 1
+
+  def extract(self, content):
+    t0 = time.perf_counter()
+    wikicode = self._parser.parse(content)
+    t1 = time.perf_counter()
+
+    self._clean(wikicode)
+    t2 = time.perf_counter()
 
     section_text = []
-    # Filter individual sections to clean.
     wiki_code_kwargs = {
         'flat': True,
         'include_lead': True,
         'include_headings': True,
     }
     for section in wikicode.get_sections(**wiki_code_kwargs):
-      for obj in section.ifilter_wikilinks(recursive=True):
-        if rm_wikilink(obj):
-          try_remove_obj(obj, section)
-        elif is_category(obj):
-          try_replace_obj(obj)
-        for obj in section.ifilter_tags(matches=rm_tag, recursive=True):
-          try_remove_obj(obj, section)
-
-      section_text.append(re.sub(
-          re_rm_magic,
+      section_text.append(self._re_rm_magic.sub(
           "",
           section.strip_code().strip(),
       ))
+    t3 = time.perf_counter()
+
+    self.num_articles += 1
+    self.parse_time += t1 - t0
+    self.clean_time += t2 - t1
+    self.strip_time += t3 - t2
+    if self._log_frequency and self.num_articles % self._log_frequency == 0:
+      total_time = self.parse_time + self.clean_time + self.strip_time
+      print(f"Extracted {self.num_articles} articles in {total_time:.1f}s "
+            f"({self.num_articles / total_time:.1f} articles/s): parsing {self.parse_time:.1f}s, "
+            f"cleaning {self.clean_time:.1f}s, stripping {self.strip_time:.1f}s")
+
     # Don't return any meta here
     return {}, "\n\n".join(section_text)
 
 
-def download_wikipedia(output_path: str, language: str="en", dump_date=None, output_type: str="jsonl", raw_download_dir=None, keep_raw_download=False, force_download=False, url_limit=None) -> DocumentDataset:
+def download_wikipedia(output_path: str, language: str="en", dump_date=None, output_type: str="jsonl", raw_download_dir=None, keep_raw_download=False, force_download=False, url_limit=None, records_per_chunk=None, files_per_partition=1, prefetch_depth=0, splits_per_file=1) -> DocumentDataset:
   """
   Downloads the latest Wikipedia dumps and extracts them using mwparserfromhell
 
@@ -736,6 +864,14 @@ def download_wikipedia(output_path: str, language: str="en", dump_date=None, out
       directly read from them instead.
     url_limit: The maximum number of raw files to download from the snapshot. If None, all
       files from the range of snapshots are downloaded.
+    records_per_chunk: If specified, extracted records are written to disk in chunks of this
+      many records while each file is extracted, bounding the memory used per file.
+    files_per_partition: The number of dump files downloaded and extracted by each partition.
+    prefetch_depth: The number of files of a partition downloaded ahead in background threads
+      while an earlier file is extracted, overlapping download and extraction.
+    splits_per_file: The number of partitions each dump file is extracted by. The index of the
+      bz2 stream offsets of every file is downloaded with it, and the file is split at these
+      offsets into byte ranges of about the same size that are decompressed independently.
   """
   wikipedia_urls = get_wikipedia_urls(language=language, dump_date=dump_date)
   if url_limit:
@@ -746,7 +882,7 @@ def download_wikipedia(output_path: str, language: str="en", dump_date=None, out
     raw_download_dir = os.path.join(output_path, "downloads")
   expand_outdir_and_mkdir(raw_download_dir)
 
-  downloader = WikipediaDownloader(raw_download_dir)
+  downloader = WikipediaDownloader(raw_download_dir, download_index=splits_per_file > 1)
   iterator = WikipediaIterator(language=language)
   extractor = WikipediaExtractor(language=language)
 
@@ -759,6 +895,6 @@ def download_wikipedia(output_path: str, language: str="en", dump_date=None, out
     "source_id": str,
     "filename": str,
   }
-  dataset = download_and_extract(wikipedia_urls, output_paths, downloader, iterator, extractor, output_format, output_type=output_type, keep_raw_download=keep_raw_download, force_download=force_download)
+  dataset = download_and_extract(wikipedia_urls, output_paths, downloader, iterator, extractor, output_format, output_type=output_type, keep_raw_download=keep_raw_download, force_download=force_download, records_per_chunk=records_per_chunk, files_per_partition=files_per_partition, prefetch_depth=prefetch_depth, splits_per_file=splits_per_file)
 
   return dataset
\ No newline at end of file
@@ -20,6 +20,16 @@ from nemo_curator.filters import DocumentFilter
 from nemo_curator.utils.distributed_utils import load_object_on_worker, NoWorkerError
 
 
+def _predict_batched(model, texts, batch_size):
+  # FastText predicts a whole list of single line documents per call
+  labels, probs = [], []
+  for start in range(0, len(texts), batch_size):
+    batch_labels, batch_probs = model.predict(texts[start:start + batch_size], k=1)
+    labels.extend(batch_labels)
+    probs.extend(batch_probs)
+  return labels, probs
+
+
 class FastTextQualityFilter(DocumentFilter):
 
   def __init__(self, model_path=None, label='__label__hq', alpha=3, seed=42):
@@ -55,7 +65,7 @@ class FastTextQualityFilter(DocumentFilter):
 
 class BatchedFastTextQualityFilter(DocumentFilter):
 
-  def __init__(self, model_path=None, label='__label__hq', alpha=3, seed=42):
+  def __init__(self, model_path=None, label='__label__hq', alpha=3, seed=42, batch_size=4096):
     if model_path is None:
       raise ValueError("Must provide a valid path to a FastText model "
                        "to compute document scores with this filter")
@@ -63,6 +73,7 @@ class BatchedFastTextQualityFilter(DocumentFilter):
     self._label = label
     self._alpha = alpha
     self._seed = np.random.seed(seed)
+    self._batch_size = batch_size
     self._name = 'fasttext_quality_filter'
 
   def score_document(self, df):
@@ -70,18 +81,14 @@ class BatchedFastTextQualityFilter(DocumentFilter):
     try:
       model = load_object_on_worker(model_attr, self._load_model, {})
     except NoWorkerError:
-      return pd.Series(np.ones(len(df)), dtype=float)
-
-    def _score_document(text):
-      text = text.replace('\n', ' ').replace('__label__', ' ')
-      pred = model.predict(text)
-      document_score = pred[1][0]
-      if pred[0][0] != self._label:
-        document_score = 1 - document_score
+      return pd.Series(np.ones(len(df)), index=df.index, dtype=float)
 
-      return document_score
+    texts = df.str.replace('\n', ' ', regex=False).str.replace('__label__', ' ', regex=False)
+    labels, probs = _predict_batched(model, texts.tolist(), self._batch_size)
+    document_scores = np.array([prob[0] for prob in probs], dtype=float)
+    is_label = np.array([label[0] == self._label for label in labels], dtype=bool)
 
-    return df.apply(_score_document)
+    return pd.Series(np.where(is_label, document_scores, 1 - document_scores), index=df.index)
 
   def keep_document(self, df):
     return np.random.pareto(self._alpha, size=len(df)) > 1 - df
@@ -120,3 +127,35 @@ class FastTextLangId(DocumentFilter):
   
   def _load_model(self):
     return fasttext.load_model(self._model_path)
+
+
+class BatchedFastTextLangId(DocumentFilter):
+
+  def __init__(self, model_path=None, min_langid_score=0.3, batch_size=4096):
+    if model_path is None:
+      raise ValueError("Must provide a valid path to a FastText model "
+                       "to identify languages with this filter")
+    self._model_path = model_path
+    self._lang_code = None
+    self._cutoff = min_langid_score
+    self._batch_size = batch_size
+    self._name = "lang_id"
+
+  def score_document(self, df):
+    model_attr = f"{self._name}_{self._model_path}"
+    try:
+      model = load_object_on_worker(model_attr, self._load_model, {})
+    except NoWorkerError:
+      return pd.Series([[1.0, 'N/A'] for _ in range(len(df))], index=df.index, dtype=object)
+
+    texts = df.str.strip().str.replace('\n', ' ', regex=False)
+    labels, probs = _predict_batched(model, texts.tolist(), self._batch_size)
+    scores = [[prob[0], label[0][-2:].upper()] for label, prob in zip(labels, probs)]
+
+    return pd.Series(scores, index=df.index, dtype=object)
+
+  def keep_document(self, df):
+    return df.str[0] >= self._cutoff
+
+  def _load_model(self):
+    return fasttext.load_model(self._model_path)
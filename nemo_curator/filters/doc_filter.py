@@ -37,6 +37,24 @@ class DocumentFilter(ABC):
   def name(self):
     return self._name
 
+  def required_splits(self):
+    """
+    Returns the splits of a document that score_document reads from the
+    sentences, paragraphs or ngrams properties when they are set, as a dict
+    mapping each property name to a hashable key. Filters that return the same
+    key read the same split, so FusedScoreFilter computes it once per document
+    and shares it between them.
+    """
+    return {}
+
+  def split_document(self, name, text):
+    """
+    Computes the split that required_splits declares under name for a document.
+    Returning None leaves the property unset, so that score_document handles
+    the document on its own.
+    """
+    raise NotImplementedError
+
   @property
   def sentences(self):
     return self._sentences
@@ -12,6 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import string
+
+import numpy as np
+import pandas as pd
 import regex
 
 from nemo_curator.filters import DocumentFilter, import_filter
@@ -30,6 +34,7 @@ from nemo_curator.utils.constants import (
     common_english_words,
 )
 from nemo_curator.utils.text_utils import (
+    default_splitter,
     get_word_splitter,
     get_paragraphs,
     get_sentences,
@@ -38,6 +43,90 @@ from nemo_curator.utils.text_utils import (
 )
 
 
+def _char_lookup(chars):
+  # Boolean table indexed by codepoint, the last entry stands for every larger codepoint
+  lookup = np.zeros(max(map(ord, chars)) + 2, dtype=bool)
+  lookup[[ord(c) for c in chars]] = True
+  return lookup
+
+
+# Same characters as regex_alphanum, regex_digit and regex_paren
+_alphanum_lookup = _char_lookup(string.ascii_letters + string.digits + "\n?!,.")
+_digit_lookup = _char_lookup(string.digits)
+_paren_lookup = _char_lookup("{}⟨⟩[]()")
+_white_space_lookup = _char_lookup(white_space_list)
+
+
+def _codepoints(df):
+  """
+  Concatenates a pandas Series of documents into a single array of codepoints.
+  Returns the codepoints along with the offset and length of every document.
+  """
+  lengths = df.str.len().to_numpy(dtype=np.int64)
+  codepoints = np.frombuffer(
+      "".join(df.tolist()).encode("utf-32-le", errors="surrogatepass"),
+      dtype=np.uint32,
+  )
+  return codepoints, np.cumsum(lengths) - lengths, lengths
+
+
+def _lookup(lookup, codepoints):
+  return lookup[np.minimum(codepoints, len(lookup) - 1)]
+
+
+def _count_per_document(hits, offsets, lengths):
+  counts = np.zeros(len(lengths), dtype=np.int64)
+  # reduceat does not handle empty segments
+  non_empty = lengths > 0
+  if non_empty.any():
+    counts[non_empty] = np.add.reduceat(hits, offsets[non_empty], dtype=np.int64)
+  return counts
+
+
+def _char_ratio(df, lookup, complement=False):
+  # Ratio of characters of every document found in (or missing from) the lookup table
+  codepoints, offsets, lengths = _codepoints(df)
+  counts = _count_per_document(_lookup(lookup, codepoints), offsets, lengths)
+  if complement:
+    counts = lengths - counts
+  with np.errstate(divide="ignore", invalid="ignore"):
+    # Remove the document if it is empty
+    scores = np.where(lengths > 0, counts / lengths, 1.0)
+  return pd.Series(scores, index=df.index)
+
+
+class _SentencesFilter(DocumentFilter):
+  # Scores the lines of a document, which fused filters can share
+  def required_splits(self):
+    return {'sentences': 'sentences'}
+
+  def split_document(self, name, text):
+    return get_sentences(text)
+
+
+class _ParagraphsFilter(DocumentFilter):
+  # Scores the paragraphs of a document, which fused filters can share
+  def required_splits(self):
+    return {'paragraphs': 'paragraphs'}
+
+  def split_document(self, name, text):
+    return get_paragraphs(text)
+
+
+class _NGramsFilter(DocumentFilter):
+  # Scores the word n-grams of a document, which fused filters with the same
+  # word splitter and n can share
+  def required_splits(self):
+    return {'ngrams': ('ngrams', self._word_splitter, self._n)}
+
+  def split_document(self, name, text):
+    words = list(self._word_splitter(text.strip()))
+    # Too short documents are left to the fallback score of score_document
+    if len(words) < self._n:
+      return None
+    return get_ngrams(words, self._n)
+
+
 class NonAlphaNumericFilter(DocumentFilter):
   """
   If more than 25% of the document is non-alphanumeric then discard
@@ -63,6 +152,16 @@ class NonAlphaNumericFilter(DocumentFilter):
     return score <= self._cutoff
 
 
+class BatchedNonAlphaNumericFilter(NonAlphaNumericFilter):
+  """
+  Batched version of NonAlphaNumericFilter that scores
+  a whole pandas Series of documents at once
+  """
+
+  def score_document(self, df):
+    return _char_ratio(df, _alphanum_lookup, complement=True)
+
+
 class SymbolsToWordsFilter(DocumentFilter):
   """
   Remove any document with symbol-to-word ratio greater than
@@ -114,6 +213,16 @@ class NumbersFilter(DocumentFilter):
     return score <= self._cutoff
 
 
+class BatchedNumbersFilter(NumbersFilter):
+  """
+  Batched version of NumbersFilter that scores
+  a whole pandas Series of documents at once
+  """
+
+  def score_document(self, df):
+    return _char_ratio(df, _digit_lookup)
+
+
 class UrlsFilter(DocumentFilter):
   """
   If more than 20% of the document is comprised of URLs then discard
@@ -139,7 +248,22 @@ class UrlsFilter(DocumentFilter):
     return score <= self._cutoff
 
 
-class BulletsFilter(DocumentFilter):
+class BatchedUrlsFilter(UrlsFilter):
+  """
+  Batched version of UrlsFilter that scores
+  a whole pandas Series of documents at once
+  """
+
+  def score_document(self, df):
+    nchar = df.str.len()
+    # Removing the urls drops exactly the characters findall would match
+    url_chars = nchar - df.str.replace(regex_url, "", regex=True).str.len()
+    scores = url_chars / nchar
+    # Remove if the document is empty
+    return scores.where(nchar > 0, 1.0)
+
+
+class BulletsFilter(_SentencesFilter):
   """
   If more than 90% of the lines start with a bullet then discard
   Source: Gopher (Rae et al., 2021)
@@ -194,6 +318,16 @@ class WhiteSpaceFilter(DocumentFilter):
     return score <= self._cutoff
 
 
+class BatchedWhiteSpaceFilter(WhiteSpaceFilter):
+  """
+  Batched version of WhiteSpaceFilter that scores
+  a whole pandas Series of documents at once
+  """
+
+  def score_document(self, df):
+    return _char_ratio(df, _white_space_lookup)
+
+
 class ParenthesesFilter(DocumentFilter):
   """
   If more than 10% of the sentence is in parentheses then discard
@@ -217,6 +351,16 @@ class ParenthesesFilter(DocumentFilter):
     return score <= self._max_parentheses_ratio
 
 
+class BatchedParenthesesFilter(ParenthesesFilter):
+  """
+  Batched version of ParenthesesFilter that scores
+  a whole pandas Series of documents at once
+  """
+
+  def score_document(self, df):
+    return _char_ratio(df, _paren_lookup)
+
+
 class LongWordFilter(DocumentFilter):
   """
   If the document contains a word longer than 1000 characters then discard
@@ -258,6 +402,22 @@ class WordCountFilter(DocumentFilter):
     return self._min_words <= score <= self._max_words
 
 
+class BatchedWordCountFilter(WordCountFilter):
+  """
+  Batched version of WordCountFilter that scores
+  a whole pandas Series of documents at once
+  """
+
+  def score_document(self, df):
+    if self._word_splitter is default_splitter:
+      return df.str.strip().str.split().str.len()
+    # Language-specific splitters such as jieba only split one document at a time
+    return df.apply(lambda text: len(self._word_splitter(text.strip())))
+
+  def keep_document(self, scores):
+    return (self._min_words <= scores) & (scores <= self._max_words)
+
+
 class BoilerPlateStringFilter(DocumentFilter):
   """
   If more than 40% of paragraphs contain boilerplate strings then discard.
@@ -325,7 +485,7 @@ class MeanWordLengthFilter(DocumentFilter):
     return self._min_cutoff <= score <= self._max_cutoff
 
 
-class RepeatedLinesFilter(DocumentFilter):
+class RepeatedLinesFilter(_SentencesFilter):
   """
   If the document shrinks by > 30% in terms of number of lines after
   removing duplicate lines then discard
@@ -347,7 +507,7 @@ class RepeatedLinesFilter(DocumentFilter):
     return score >= self._cutoff
 
 
-class RepeatedParagraphsFilter(DocumentFilter):
+class RepeatedParagraphsFilter(_ParagraphsFilter):
   """
   If the document shrinks by > 30% in terms of number of lines after
   removing duplicate paragraphs then discard.
@@ -369,7 +529,7 @@ class RepeatedParagraphsFilter(DocumentFilter):
     return score >= self._max_repeated_paragraphs_ratio
 
 
-class RepeatedLinesByCharFilter(DocumentFilter):
+class RepeatedLinesByCharFilter(_SentencesFilter):
   """
   If the document shrinks by > 20% in terms of number of lines
   after removing duplicate lines then discard
@@ -392,7 +552,7 @@ class RepeatedLinesByCharFilter(DocumentFilter):
     return score >= self._cutoff
 
 
-class RepeatedParagraphsByCharFilter(DocumentFilter):
+class RepeatedParagraphsByCharFilter(_ParagraphsFilter):
   """
   If the document shrinks by > 10% in terms of number of lines after
   removing duplicate paragraphs then discard.
@@ -415,7 +575,7 @@ class RepeatedParagraphsByCharFilter(DocumentFilter):
     return score >= self._cutoff
 
 
-class RepeatingTopNGramsFilter(DocumentFilter):
+class RepeatingTopNGramsFilter(_NGramsFilter):
   """
   If the document shrinks by > x% in terms of number of characters after
   removing the top n-grams then discard.
@@ -463,7 +623,7 @@ class RepeatingTopNGramsFilter(DocumentFilter):
     return score <= self._cutoff
 
 
-class RepeatingDuplicateNGramsFilter(DocumentFilter):
+class RepeatingDuplicateNGramsFilter(_NGramsFilter):
   """
   If the document shrinks by > x% in terms of number of characters
   after removing all duplicate n-grams then discard.
@@ -512,7 +672,7 @@ class RepeatingDuplicateNGramsFilter(DocumentFilter):
     return score <= self._cutoff
 
 
-class PunctuationFilter(DocumentFilter):
+class PunctuationFilter(_SentencesFilter):
   """
   If more than 85% of the sentences do not end with a
   punctuation mark then discard.
@@ -536,7 +696,7 @@ class PunctuationFilter(DocumentFilter):
     return score <= self._cutoff
 
 
-class EllipsisFilter(DocumentFilter):
+class EllipsisFilter(_SentencesFilter):
   """
   If more than 30% of the sentences end with an elipsis then discard.
   Source: Google C4 processing
@@ -12,9 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from .distributed_data_classifier import DomainClassifier, QualityClassifier
+from .distributed_data_classifier import (
+    DomainClassifier,
+    MultipleModelQualityClassifier,
+    QualityClassifier,
+)
 from .exact_dedup import ExactDuplicates
-from .filter import Filter, Score, ScoreFilter
+from .filter import Filter, FirstFailingFilter, FusedScoreFilter, Score, ScoreFilter
 from .fuzzy_dedup import LSH, MinHash
 from .meta import Sequential
 from .modify import Modify
@@ -25,9 +29,12 @@ __all__ = [
     "DomainClassifier",
     "ExactDuplicates",
     "Filter",
+    "FirstFailingFilter",
+    "FusedScoreFilter",
     "LSH",
     "MinHash",
     "Modify",
+    "MultipleModelQualityClassifier",
     "QualityClassifier",
     "Score",
     "ScoreFilter",
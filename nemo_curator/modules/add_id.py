@@ -20,14 +20,49 @@ from nemo_curator.datasets import DocumentDataset
 
 
 class AddId:
-    def __init__(self, id_field, id_prefix="doc_id", start_index=0) -> None:
+    def __init__(self, id_field, id_prefix="doc_id", start_index=0, dataset_id=None, dataset_id_field="dataset_id", partition_lengths=None) -> None:
+        """
+        Adds a unique id to every document in a dataset.
+
+        Args:
+            id_field: The column that will hold the id of each document.
+            id_prefix: The prefix of string ids, e.g. "doc_id-0000000000".
+            start_index: The number of the first document.
+            dataset_id: If given, ids are stored as integers instead of strings:
+                the dataset_id_field column holds this number (uint32) and
+                id_field holds the int64 document number. These are the
+                "dataset_id"/"doc_id" columns the deduplication modules work on,
+                so no string ids need to be parsed or shuffled.
+            dataset_id_field: The column that holds the dataset id of integer ids.
+            partition_lengths: The number of documents in each partition of the dataset,
+                e.g. from nemo_curator.utils.distributed_utils.get_partition_lengths.
+                If given, ids are assigned while the dataset is read, instead of
+                reading every partition once more to count its documents.
+        """
         self.id_field = id_field
         self.id_prefix = id_prefix
         self.start_index = start_index
+        self.dataset_id = dataset_id
+        self.dataset_id_field = dataset_id_field
+        self.partition_lengths = partition_lengths
     
     def __call__(self, dataset: DocumentDataset) -> DocumentDataset:
         original_meta = dataset.df.dtypes.to_dict()
-        original_meta[self.id_field] = "object"
+        if self.dataset_id is None:
+            original_meta[self.id_field] = "object"
+        else:
+            original_meta[self.dataset_id_field] = "uint32"
+            original_meta[self.id_field] = "int64"
+
+        if self.partition_lengths is not None:
+            if len(self.partition_lengths) != dataset.df.npartitions:
+                raise ValueError(
+                    f"Got {len(self.partition_lengths)} partition lengths for a dataset with {dataset.df.npartitions} partitions"
+                )
+            lower_id_bounds = np.cumsum([0] + list(self.partition_lengths[:-1])).tolist()
+            id_df = dataset.df.map_partitions(self._add_id_to_counted_partition, lower_id_bounds, meta=original_meta)
+            return DocumentDataset(dataset_df=id_df)
+
         delayed_dataset = dataset.df.to_delayed()
 
         parition_lengths = [0]
@@ -43,7 +78,20 @@ class AddId:
 
         return id_dataset
     
+    def _add_id_to_counted_partition(self, partition, lower_id_bounds, partition_info=None):
+        partition_number = partition_info["number"]
+        if len(partition) != self.partition_lengths[partition_number]:
+            raise ValueError(
+                f"Partition {partition_number} has {len(partition)} documents, but {self.partition_lengths[partition_number]} were counted"
+            )
+        return self._add_id_to_partition(partition, lower_id_bounds[partition_number])
+
     def _add_id_to_partition(self, partition, partition_start_id):
+        if self.dataset_id is not None:
+            partition[self.dataset_id_field] = np.full(len(partition), self.dataset_id, dtype=np.uint32)
+            partition[self.id_field] = np.arange(len(partition), dtype=np.int64) + int(partition_start_id + self.start_index)
+            return partition
+
         id_column = [f"{self.id_prefix}-{int(i + self.start_index):010d}" for i in range(partition_start_id, len(partition) + partition_start_id)]
         partition[self.id_field] = id_column
 
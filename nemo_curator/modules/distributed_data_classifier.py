@@ -17,6 +17,7 @@ import os
 from packaging import version
 
 import torch
+from dask.distributed import get_worker
 from transformers import __version__ as TRANSFORMERS_VERSION
 from transformers.models.deberta_v2 import DebertaV2TokenizerFast
 
@@ -24,8 +25,15 @@ from nemo_curator.datasets import DocumentDataset
 from nemo_curator.distributed_data_classification.pytorch_utils import (
     CFG,
     CustomModel,
+    StreamingTestDataset,
     TestDataset,
     collate,
+    get_data_loader,
+    init_empty_weights,
+    load_mmap_state_dict,
+    prefetch,
+    quantize_dynamic,
+    restore_order,
 )
 from nemo_curator.utils.distributed_utils import (
     load_object_on_worker,
@@ -48,7 +56,17 @@ class DistributedDataClassifier(ABC):
         num_workers,
         device_type,
         autocast,
+        max_tokens_per_batch=None,
+        quantize=False,
+        num_threads=None,
+        stream_tokenization=False,
+        mmap_dir=None,
     ):
+        if quantize and device_type != "cpu":
+            raise ValueError(
+                f"Dynamic quantization is only supported on the CPU, not {device_type}"
+            )
+
         self.model_file_name = model_file_name
         self.labels = labels
         self.filter_by = filter_by
@@ -59,6 +77,11 @@ class DistributedDataClassifier(ABC):
         self.num_workers = num_workers
         self.device_type = device_type
         self.autocast = autocast
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self.quantize = quantize
+        self.num_threads = num_threads
+        self.stream_tokenization = stream_tokenization
+        self.mmap_dir = mmap_dir
 
     def __call__(self, dataset: DocumentDataset):
         result_doc_dataset = self._run_classifier(dataset)
@@ -72,6 +95,88 @@ class DistributedDataClassifier(ABC):
     def _run_classifier(self):
         pass
 
+    def _set_num_threads(self):
+        """
+        On the CPU, splits the cores of the machine between the threads of the
+        Dask worker, so that partitions classified at the same time do not
+        compete for the same cores.
+        """
+        if self.device_type != "cpu":
+            return
+
+        num_threads = self.num_threads
+        if num_threads is None:
+            try:
+                worker_threads = get_worker().nthreads
+            except ValueError:
+                # Outside of a Dask worker, e.g. with the local threaded scheduler
+                worker_threads = 1
+            num_threads = max(1, (os.cpu_count() or 1) // worker_threads)
+        torch.set_num_threads(num_threads)
+
+    def _read_checkpoint(self, model_file_name):
+        return torch.load(model_file_name, map_location="cpu")
+
+    def _build_model(self, cfg, device, model_file_name):
+        if self.mmap_dir is None:
+            sd = self._read_checkpoint(model_file_name)
+        else:
+            sd = load_mmap_state_dict(
+                model_file_name, self._read_checkpoint, self.mmap_dir
+            )
+
+        if self.mmap_dir is not None and device.type == "cpu":
+            # The encoder is built from its config without any weights, and its parameters
+            # are the tensors of the mapped file instead of copies, so the workers of a node
+            # share them rather than each loading the pretrained weights
+            with init_empty_weights():
+                model = CustomModel(
+                    cfg, out_dim=self.out_dim, config_path=None, pretrained=False
+                )
+            model.load_state_dict(sd, strict=True, assign=True)
+        else:
+            model = CustomModel(
+                cfg, out_dim=self.out_dim, config_path=None, pretrained=True
+            )
+            model = model.to(device)
+            model.load_state_dict(sd, strict=True)
+        return self._prepare_model(model)
+
+    def _prepare_model(self, model):
+        model.eval()
+        if self.quantize:
+            model = quantize_dynamic(model)
+        return model
+
+    def _run_model(self, batch, model):
+        return self._forward(collate(batch, device=self.device_type), model)
+
+    def _forward(self, batch, model):
+        # Quantized layers run in int8, so they are not autocast
+        if self.autocast and not self.quantize:
+            with torch.autocast(device_type=self.device_type):
+                return model(batch)[:, 0, :]
+        return model(batch)[:, 0, :]
+
+    def _dataset(self, cfg, df):
+        if self.stream_tokenization:
+            return StreamingTestDataset(cfg, df, self.max_chars)
+        return TestDataset(cfg, df, self.max_chars)
+
+    def _data_loader(self, dataset):
+        return get_data_loader(
+            dataset,
+            batch_size=self.batch_size,
+            num_workers=self.num_workers,
+            max_tokens_per_batch=self.max_tokens_per_batch,
+        )
+
+    def _batches(self, loader):
+        # Tokenizes the next batch while the model runs on the current one
+        if self.stream_tokenization and self.num_workers == 0:
+            return prefetch(loader)
+        return loader
+
     def _cfg_per_partition(self):
         return load_object_on_worker(
             "cfg_with_tokenizer",
@@ -109,6 +214,11 @@ class DomainClassifier(DistributedDataClassifier):
         num_workers=0,
         device_type="cuda",
         autocast=True,
+        max_tokens_per_batch=None,
+        quantize=False,
+        num_threads=None,
+        stream_tokenization=False,
+        mmap_dir=None,
     ):
         if out_dim is None:
             out_dim = len(labels)
@@ -124,6 +234,11 @@ class DomainClassifier(DistributedDataClassifier):
             num_workers=num_workers,
             device_type=device_type,
             autocast=autocast,
+            max_tokens_per_batch=max_tokens_per_batch,
+            quantize=quantize,
+            num_threads=num_threads,
+            stream_tokenization=stream_tokenization,
+            mmap_dir=mmap_dir,
         )
 
     def _run_classifier(self, dataset: DocumentDataset):
@@ -143,27 +258,23 @@ class DomainClassifier(DistributedDataClassifier):
         return DocumentDataset(df)
 
     def _inference_per_partition(self, df):
+        self._set_num_threads()
         cfg = self._cfg_per_partition()
 
-        dataset_valid = TestDataset(cfg, df, self.max_chars)
-        loader_valid = torch.utils.data.DataLoader(
-            dataset_valid,
-            batch_size=self.batch_size,
-            shuffle=False,
-            num_workers=self.num_workers,
-        )
+        dataset_valid = self._dataset(cfg, df)
+        loader_valid = self._data_loader(dataset_valid)
 
         device = torch.device(self.device_type)
         load_model_kwargs = {"cfg": cfg, "device": device}
 
         preds = process_all_batches(
-            loader_valid,
+            self._batches(loader_valid),
             self._load_model,
             load_model_kwargs,
             self._run_inference,
             {},
         )
-        preds = preds.cpu().numpy()
+        preds = restore_order(preds, loader_valid).cpu().numpy()
         df[self.pred_column] = [self.labels[i] for i in preds]
 
         return df
@@ -175,33 +286,23 @@ class DomainClassifier(DistributedDataClassifier):
         return cfg
 
     def _load_model(self, cfg, device):
-        model = CustomModel(
-            cfg, out_dim=self.out_dim, config_path=None, pretrained=True
-        )
-        model = model.to(device)
-        sd = torch.load(os.path.join(self.model_file_name), map_location="cpu")
+        return self._build_model(cfg, device, self.model_file_name)
+
+    def _read_checkpoint(self, model_file_name):
+        sd = torch.load(os.path.join(model_file_name), map_location="cpu")
         sd = {k[7:] if k.startswith("module.") else k: sd[k] for k in sd.keys()}
         if version.parse(TRANSFORMERS_VERSION) >= version.parse("4.31.0"):
             sd.pop("model.embeddings.position_ids", None)
-
-        model.load_state_dict(sd, strict=True)
-        model.eval()
-        return model
+        return sd
 
     def _run_inference(self, batch, model):
         with torch.no_grad():
-            batch = collate(batch)
-            if self.autocast:
-                with torch.autocast(device_type=self.device_type):
-                    out = model(batch)[:, 0, :]
-            else:
-                out = model(batch)[:, 0, :]
+            out = self._run_model(batch, model)
             pred_idx = torch.sigmoid(out).argmax(1)
 
         return pred_idx
 
 
-# TODO: Implement MultipleModelQualityClassifier class
 class QualityClassifier(DistributedDataClassifier):
     def __init__(
         self,
@@ -217,6 +318,11 @@ class QualityClassifier(DistributedDataClassifier):
         device_type="cuda",
         autocast=True,
         max_len=1024,
+        max_tokens_per_batch=None,
+        quantize=False,
+        num_threads=None,
+        stream_tokenization=False,
+        mmap_dir=None,
     ):
         # Binary case
         if len(labels) == 2:
@@ -241,6 +347,11 @@ class QualityClassifier(DistributedDataClassifier):
             num_workers=num_workers,
             device_type=device_type,
             autocast=autocast,
+            max_tokens_per_batch=max_tokens_per_batch,
+            quantize=quantize,
+            num_threads=num_threads,
+            stream_tokenization=stream_tokenization,
+            mmap_dir=mmap_dir,
         )
 
     def _run_classifier(self, dataset: DocumentDataset):
@@ -261,15 +372,11 @@ class QualityClassifier(DistributedDataClassifier):
         return DocumentDataset(df)
 
     def _inference_per_partition(self, df):
+        self._set_num_threads()
         cfg = self._cfg_per_partition()
 
-        dataset_valid = TestDataset(cfg, df, self.max_chars)
-        loader_valid = torch.utils.data.DataLoader(
-            dataset_valid,
-            batch_size=self.batch_size,
-            shuffle=False,
-            num_workers=self.num_workers,
-        )
+        dataset_valid = self._dataset(cfg, df)
+        loader_valid = self._data_loader(dataset_valid)
         device = torch.device(self.device_type)
         if len(self.labels) == 1:
             raise ValueError("Labels must be more than 1")
@@ -280,22 +387,25 @@ class QualityClassifier(DistributedDataClassifier):
         }
 
         probs = process_all_batches(
-            loader_valid,
+            self._batches(loader_valid),
             self._load_model,
             load_model_kwargs,
             self._run_inference,
             {},
         )
+        probs = restore_order(probs, loader_valid)
+        self._assign_predictions(df, probs, self.pred_column, self.prob_column)
+
+        return df
 
+    def _assign_predictions(self, df, probs, pred_column, prob_column):
         if self.binary_classification:
             preds = (probs > 0.5).to(torch.int64).squeeze()
         else:
             preds = torch.argmax(probs, dim=1)
 
-        df[self.pred_column] = [self.labels[i] for i in preds.to("cpu").numpy().tolist()]
-        df[self.prob_column] = probs.to("cpu").numpy().tolist()
-
-        return df
+        df[pred_column] = [self.labels[i] for i in preds.to("cpu").numpy().tolist()]
+        df[prob_column] = probs.to("cpu").numpy().tolist()
 
     def _load_cfg_with_tokenizer(self):
         cfg = CFG(max_len=self.max_len)
@@ -303,27 +413,134 @@ class QualityClassifier(DistributedDataClassifier):
         cfg.tokenizer = tokenizer
         return cfg
 
-    def _load_model(self, cfg, device):
-        model = CustomModel(cfg, out_dim=self.out_dim, config_path=None, pretrained=True)
-        model = model.to(device)
-        sd = torch.load(self.model_file_name, map_location="cpu")
+    def _load_model(self, cfg, device, model_file_name=None):
+        if model_file_name is None:
+            model_file_name = self.model_file_name
+        return self._build_model(cfg, device, model_file_name)
+
+    def _read_checkpoint(self, model_file_name):
+        sd = torch.load(model_file_name, map_location="cpu")
         if "model_state_dict" in sd:
             sd = sd["model_state_dict"]
         sd = {k[7:] if k.startswith("module.") else k: sd[k] for k in sd.keys()}
-        model.load_state_dict(sd, strict=True)
-        model.eval()
-        return model
+        return sd
 
     def _run_inference(self, batch, model):
         with torch.no_grad():
-            batch = collate(batch)
-            if self.autocast:
-                with torch.autocast(device_type=self.device_type):
-                    out = model(batch)[:, 0, :]
-            else:
-                out = model(batch)[:, 0, :]
-            if self.binary_classification:
-                probs = torch.sigmoid(out)
-            else:
-                probs = torch.softmax(out, dim=1)
-        return probs
+            out = self._run_model(batch, model)
+            return self._probabilities(out)
+
+    def _probabilities(self, out):
+        if self.binary_classification:
+            return torch.sigmoid(out)
+        return torch.softmax(out, dim=1)
+
+
+class MultipleModelQualityClassifier(QualityClassifier):
+    """
+    Runs an ensemble of quality classifier checkpoints that share the same
+    tokenizer and labels. Each partition is tokenized once, and every batch
+    goes through all of the models before the next one is loaded. Each
+    model adds its own prediction and probability columns, named after the
+    pred_column and prob_column followed by the file name of its checkpoint.
+    All of the models must fit on a single GPU at the same time.
+    """
+
+    def __init__(
+        self,
+        model_file_names,
+        labels,
+        batch_size=256,
+        out_dim=None,
+        pred_column="quality_pred",
+        prob_column="quality_prob",
+        max_chars=6000,
+        num_workers=0,
+        device_type="cuda",
+        autocast=True,
+        max_len=1024,
+        max_tokens_per_batch=None,
+        quantize=False,
+        num_threads=None,
+        stream_tokenization=False,
+        mmap_dir=None,
+    ):
+        model_names = [os.path.basename(f) for f in model_file_names]
+        if len(set(model_names)) != len(model_names):
+            raise ValueError("The model files must have different file names")
+
+        super().__init__(
+            model_file_name=None,
+            labels=labels,
+            batch_size=batch_size,
+            out_dim=out_dim,
+            pred_column=pred_column,
+            prob_column=prob_column,
+            max_chars=max_chars,
+            num_workers=num_workers,
+            device_type=device_type,
+            autocast=autocast,
+            max_len=max_len,
+            max_tokens_per_batch=max_tokens_per_batch,
+            quantize=quantize,
+            num_threads=num_threads,
+            stream_tokenization=stream_tokenization,
+            mmap_dir=mmap_dir,
+        )
+        self.model_file_names = model_file_names
+        self.model_names = model_names
+
+    def _columns(self, model_name):
+        return f"{self.pred_column}_{model_name}", f"{self.prob_column}_{model_name}"
+
+    def _run_classifier(self, dataset: DocumentDataset):
+        print("Starting multiple model quality classifier inference", flush=True)
+
+        df = dataset.df
+
+        meta_df = df._meta.copy()
+        for model_name in self.model_names:
+            pred_column, prob_column = self._columns(model_name)
+            meta_df[pred_column] = ["low"] * len(meta_df)
+            meta_df[prob_column] = [[0, 0, 1]] * len(meta_df)
+
+        df = df.map_partitions(
+            self._inference_per_partition,
+            meta=meta_df,
+            enforce_metadata=False,
+        )
+
+        return DocumentDataset(df)
+
+    def _inference_per_partition(self, df):
+        self._set_num_threads()
+        cfg = self._cfg_per_partition()
+
+        dataset_valid = self._dataset(cfg, df)
+        loader_valid = self._data_loader(dataset_valid)
+        device = torch.device(self.device_type)
+        if len(self.labels) == 1:
+            raise ValueError("Labels must be more than 1")
+
+        # Each checkpoint is kept on the worker under its own attribute
+        models = [
+            load_object_on_worker(
+                f"model_{model_file_name}",
+                self._load_model,
+                {"cfg": cfg, "device": device, "model_file_name": model_file_name},
+            )
+            for model_file_name in self.model_file_names
+        ]
+
+        probs = [[] for _ in models]
+        with torch.no_grad():
+            for batch in self._batches(loader_valid):
+                batch = collate(batch, device=self.device_type)
+                for model_probs, model in zip(probs, models):
+                    model_probs.append(self._probabilities(self._forward(batch, model)))
+
+        for model_name, model_probs in zip(self.model_names, probs):
+            model_probs = restore_order(torch.cat(model_probs), loader_valid)
+            self._assign_predictions(df, model_probs, *self._columns(model_name))
+
+        return df
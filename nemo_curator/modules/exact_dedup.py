@@ -38,7 +38,7 @@ class ExactDuplicates:
     def __init__(
         self,
         logger: Union[logging.LoggerAdapter, str] = "./",
-        id_field: str = "id",
+        id_field: Union[str, list] = "id",
         text_field: str = "text",
         hash_method: str = "md5",
         profile_dir: str = None,
@@ -48,7 +48,8 @@ class ExactDuplicates:
         Parameters
         ----------
         logger: Existing logger to log to, or a path to a log directory.
-        id_field: Column in the Dataset denoting document ID.
+        id_field: Column(s) in the Dataset denoting document ID,
+          e.g. ["dataset_id", "doc_id"] for integer ids added by AddId.
         text_field: Column in the Dataset denoting document content.
         hash_method: The hashing algorithm used for identifying exact duplicates. Currently supports {"md5"}
         profile_dir: str, Default None
@@ -63,6 +64,7 @@ class ExactDuplicates:
             )
         self.hash_method = hash_method
         self.id_field = id_field
+        self.id_fields = [id_field] if isinstance(id_field, str) else id_field
         self.text_field = text_field
         if cache_dir is None and profile_dir is not None:
             warnings.warn(
@@ -113,7 +115,7 @@ class ExactDuplicates:
         containing the id_column and relevant hashes in the _hashes column.
         """
         self._logger.info("Starting lazy hash generation")
-        res = df[[self.id_field]]
+        res = df[self.id_fields]
         res["_hashes"] = df[self.text_field].map_partitions(self.hash_documents)
         self._logger.info(
             f"Lazy hash generation complete for {res.npartitions} partitions"
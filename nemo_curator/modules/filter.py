@@ -12,22 +12,31 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
+
+import numpy as np
+import pandas as pd
+
 from nemo_curator.datasets import DocumentDataset
+from nemo_curator.utils.score_cache import ScoreCache
 from dask.typing import no_default
 
 class Score:
-  def __init__(self, score_fn, score_field, text_field="text", batched=False, score_type=None):
+  def __init__(self, score_fn, score_field, text_field="text", batched=False, score_type=None, score_cache_dir=None):
     """
     Args:
       score_fn: The score function that takes in a document string and outputs a score for the document
       score_field: The field the score will be stored in.
       text_field: The field the documents will be read from
+      score_cache_dir: If set, scores are cached in Parquet files under this directory keyed by
+        the document hash, and documents scored by a previous run are not scored again.
     """
     self.score_fn = score_fn
     self.score_field = score_field
     self.text_field = text_field
     self.batched = batched
     self.score_type = score_type
+    self.score_cache_dir = score_cache_dir
 
   def __call__(self, dataset):
     # Set the metadata for the function calls if provided
@@ -36,13 +45,18 @@ class Score:
     else:
       meta = no_default
 
-    if self.batched:
+    if self.score_cache_dir is not None:
+      dataset.df[self.score_field] = self._score_cache()(dataset.df[self.text_field], meta=meta)
+    elif self.batched:
       dataset.df[self.score_field] = dataset.df[self.text_field].map_partitions(self.score_fn, meta=meta)
     else:
       dataset.df[self.score_field] = dataset.df[self.text_field].apply(self.score_fn, meta=meta)
 
     return dataset
 
+  def _score_cache(self):
+    return ScoreCache(self.score_cache_dir, self.score_fn, batched=self.batched, name=self.score_field)
+
 
 class Filter:
   def __init__(self, filter_fn, filter_field, invert=False, batched=False):
@@ -70,10 +84,12 @@ class Filter:
 
 
 class ScoreFilter:
-  def __init__(self, filter_obj, text_field="text", score_field=None, score_type=None, invert=False, batched=False):
+  def __init__(self, filter_obj, text_field="text", score_field=None, score_type=None, invert=False, batched=False, score_cache_dir=None):
     """
     Args:
       score_field: The field to which the scores will be written. If None, scores will be immediately discarded after use.
+      score_cache_dir: If set, scores are cached in Parquet files under this directory keyed by the document hash
+        and the filter parameters that affect the score. Rerunning with only different thresholds reuses the scores.
     """
     self.filter_obj = filter_obj
     self.text_field = text_field
@@ -81,6 +97,7 @@ class ScoreFilter:
     self.score_type = score_type
     self.invert = invert
     self.batched = batched
+    self.score_cache_dir = score_cache_dir
   
   def __call__(self, dataset):
     # Set the metadata for the function calls if provided
@@ -89,7 +106,9 @@ class ScoreFilter:
     else:
       meta = no_default
 
-    if self.batched:
+    if self.score_cache_dir is not None:
+      scores = self._score_cache()(dataset.df[self.text_field], meta=meta)
+    elif self.batched:
       scores = dataset.df[self.text_field].map_partitions(self.filter_obj.score_document, meta=meta)
     else:
       scores = dataset.df[self.text_field].apply(self.filter_obj.score_document, meta=meta)
@@ -105,3 +124,235 @@ class ScoreFilter:
       bool_mask = ~bool_mask
 
     return DocumentDataset(dataset.df[bool_mask])
+
+  def _score_cache(self):
+    return ScoreCache(self.score_cache_dir, self.filter_obj.score_document, batched=self.batched, name=self.filter_obj.name)
+
+
+def _score_dtype(texts, score_fn, score_type, batched):
+  """
+  Returns the dtype of the scores of a module, which is score_type if given.
+  Otherwise it is inferred from a sample document, as Dask does for the unfused modules.
+  """
+  if score_type:
+    return pd.Series(dtype=score_type).dtype
+  sample = texts._meta_nonempty
+  sample_scores = score_fn(sample) if batched else sample.apply(score_fn)
+  return sample_scores.dtype
+
+
+class FusedScoreFilter:
+  def __init__(self, score_filters):
+    """
+    Applies a list of non-batched ScoreFilters in a single pass over each partition.
+    Every document is split into sentences, paragraphs and word n-grams at most once,
+    and the splits declared by DocumentFilter.required_splits are shared between the filters.
+    Scoring of a document stops at the first filter that rejects it.
+    Args:
+      score_filters: The ScoreFilter modules to apply, in order.
+    """
+    for score_filter in score_filters:
+      if score_filter.batched or score_filter.score_cache_dir is not None:
+        raise ValueError(f"Cannot fuse batched or cached ScoreFilter using {score_filter.filter_obj.name}")
+    self.score_filters = score_filters
+
+  def __call__(self, dataset):
+    dtypes = [
+        _score_dtype(dataset.df[score_filter.text_field], score_filter.filter_obj.score_document, score_filter.score_type, batched=False)
+        for score_filter in self.score_filters
+    ]
+    meta = dataset.df._meta
+    score_fields = {
+        score_filter.score_field: pd.Series(dtype=dtype)
+        for score_filter, dtype in zip(self.score_filters, dtypes)
+        if score_filter.score_field is not None
+    }
+    if score_fields:
+      meta = meta.assign(**score_fields)
+
+    return DocumentDataset(dataset.df.map_partitions(self._score_filter_partition, dtypes, meta=meta))
+
+  def _score_filter_partition(self, partition, dtypes):
+    failed, scores = self._score_documents(partition)
+    keep = failed == -1
+    partition = partition[keep]
+    # Cast to the dtypes of the meta, which partitions without any kept document would not have
+    score_fields = {
+        score_filter.score_field: pd.Series(column[keep].tolist(), index=partition.index, dtype=dtype)
+        for score_filter, column, dtype in zip(self.score_filters, scores, dtypes)
+        if score_filter.score_field is not None
+    }
+    return partition.assign(**score_fields)
+
+  def _score_documents(self, partition):
+    """
+    Scores every document of a partition up to the first filter that rejects it.
+    Returns the position of that filter for each document (-1 if the document is kept)
+    and an object array of scores per filter, holding None where no score was computed.
+    """
+    text_fields = {score_filter.text_field for score_filter in self.score_filters}
+    texts = {field: partition[field].tolist() for field in text_fields}
+    failed = np.full(len(partition), -1, dtype=np.int64)
+    scores = [np.full(len(partition), None, dtype=object) for _ in self.score_filters]
+    # The splits are handed to the filters through their sentences, paragraphs and ngrams
+    # properties, so each call works on its own copies in case partitions are scored concurrently
+    filter_objs = [copy.copy(score_filter.filter_obj) for score_filter in self.score_filters]
+    required_splits = [filter_obj.required_splits() for filter_obj in filter_objs]
+
+    for i in range(len(partition)):
+      splits = {}
+      for position, score_filter in enumerate(self.score_filters):
+        filter_obj = filter_objs[position]
+        text = texts[score_filter.text_field][i]
+        for name, key in required_splits[position].items():
+          if (key, score_filter.text_field) not in splits:
+            splits[key, score_filter.text_field] = filter_obj.split_document(name, text)
+          setattr(filter_obj, name, splits[key, score_filter.text_field])
+        score = filter_obj.score_document(text)
+        scores[position][i] = score
+        if filter_obj.keep_document(score) == score_filter.invert:
+          failed[i] = position
+          break
+
+    return failed, scores
+
+
+class FirstFailingFilter:
+  def __init__(self, modules, label_field="first_failing_filter"):
+    """
+    Evaluates a list of Score, Filter and ScoreFilter modules in a single pass without removing any documents.
+    As in Sequential, each module only scores the documents kept by the modules before it,
+    and runs of non-batched, uncached ScoreFilters are fused. Numeric scores are held in nullable
+    dtypes, and are missing (or None for other scores) for documents a module never saw.
+    Args:
+      modules: The modules to evaluate, in order.
+      label_field: The field to which the position of the first module that rejected
+        each document will be written, or -1 if the document passes every module.
+    """
+    self.modules = modules
+    self.label_field = label_field
+
+    # Group runs of non-batched ScoreFilters, remembering the position of their first module
+    self._stages = []
+    run_start = None
+    for position, module in enumerate(modules + [None]):
+      if isinstance(module, ScoreFilter) and not module.batched and module.score_cache_dir is None:
+        if run_start is None:
+          run_start = position
+        continue
+      if run_start is not None:
+        self._stages.append((run_start, FusedScoreFilter(modules[run_start:position])))
+        run_start = None
+      if module is None:
+        break
+      if not isinstance(module, (Score, Filter, ScoreFilter)):
+        raise ValueError(f"{type(module).__name__} modules cannot be labelled by FirstFailingFilter")
+      self._stages.append((position, module))
+
+  def __call__(self, dataset):
+    # The partitions score through the caches directly, so they are compacted here
+    for module in self.modules:
+      if isinstance(module, (Score, ScoreFilter)) and module.score_cache_dir is not None:
+        module._score_cache().compact()
+
+    dtypes = {}
+    for module in self.modules:
+      if isinstance(module, (Score, ScoreFilter)) and module.score_field is not None:
+        score_fn = module.score_fn if isinstance(module, Score) else module.filter_obj.score_document
+        dtype = _score_dtype(dataset.df[module.text_field], score_fn, module.score_type, module.batched)
+        dtypes[module.score_field] = self._nullable_dtype(dtype)
+    meta = dataset.df._meta.assign(**{field: pd.Series(dtype=dtype) for field, dtype in dtypes.items()})
+    meta[self.label_field] = pd.Series(dtype=np.int64)
+
+    return DocumentDataset(dataset.df.map_partitions(self._label_partition, dtypes, meta=meta))
+
+  def kept(self, dataset):
+    """
+    Returns the documents of a dataset labelled by this module that passed every module.
+    All of their scores are set, so numeric score fields are turned back into numpy dtypes.
+    """
+    df = dataset.df[dataset.df[self.label_field] == -1].drop(columns=[self.label_field])
+    dtypes = {
+        field: df[field].dtype.numpy_dtype
+        for field in self._score_fields()
+        if isinstance(df[field].dtype, pd.api.extensions.ExtensionDtype)
+    }
+    return DocumentDataset(df.astype(dtypes))
+
+  def _score_fields(self):
+    fields = []
+    for module in self.modules:
+      if isinstance(module, (Score, ScoreFilter)) and module.score_field is not None:
+        fields.append(module.score_field)
+    return fields
+
+  @staticmethod
+  def _nullable_dtype(dtype):
+    # Documents a module never saw have no score, which numpy integer, float and bool dtypes cannot hold
+    if dtype.kind in "iu":
+      return pd.Int64Dtype()
+    if dtype.kind == "f":
+      return pd.Float64Dtype()
+    if dtype.kind == "b":
+      return pd.BooleanDtype()
+    return np.dtype(object)
+
+  def _label_partition(self, partition, dtypes):
+    labels = np.full(len(partition), -1, dtype=np.int64)
+    partition = partition.assign(**{
+        field: np.full(len(partition), None, dtype=object) for field in self._score_fields()
+    })
+
+    for position, module in self._stages:
+      alive = np.flatnonzero(labels == -1)
+      if len(alive) == 0:
+        break
+      subset = partition.iloc[alive]
+
+      if isinstance(module, FusedScoreFilter):
+        failed, scores = module._score_documents(subset)
+        for score_filter, column in zip(module.score_filters, scores):
+          if score_filter.score_field is not None:
+            partition[score_filter.score_field] = self._fill(partition[score_filter.score_field], alive, column)
+        rejected = failed >= 0
+        labels[alive[rejected]] = position + failed[rejected]
+        continue
+
+      if isinstance(module, Filter):
+        values = subset[module.filter_field]
+        if module.batched:
+          bool_mask = module.filter_fn(values)
+        else:
+          bool_mask = values.apply(module.filter_fn)
+      else:
+        score_fn = module.score_fn if isinstance(module, Score) else module.filter_obj.score_document
+        if module.score_cache_dir is not None:
+          scores = module._score_cache().score_partition(subset[module.text_field])
+        elif module.batched:
+          scores = score_fn(subset[module.text_field])
+        else:
+          scores = subset[module.text_field].apply(score_fn)
+        if module.score_field is not None:
+          partition[module.score_field] = self._fill(partition[module.score_field], alive, scores)
+        if isinstance(module, Score):
+          continue
+        if module.batched:
+          bool_mask = module.filter_obj.keep_document(scores)
+        else:
+          bool_mask = scores.apply(module.filter_obj.keep_document)
+
+      bool_mask = np.asarray(bool_mask, dtype=bool)
+      if module.invert:
+        bool_mask = ~bool_mask
+      labels[alive[~bool_mask]] = position
+
+    for field, dtype in dtypes.items():
+      partition[field] = pd.Series(partition[field].to_numpy(), index=partition.index, dtype=dtype)
+    partition[self.label_field] = labels
+    return partition
+
+  @staticmethod
+  def _fill(column, positions, values):
+    column = column.to_numpy(dtype=object, copy=True)
+    column[positions] = pd.Series(values).to_numpy(dtype=object)
+    return column
@@ -28,6 +28,8 @@ import cugraph.dask.comms.comms as Comms
 import cupy as cp
 import dask_cudf
 import numpy as np
+import pandas as pd
+import pyarrow as pa
 from dask import dataframe as dd
 from dask.dataframe.shuffle import shuffle as dd_shuffle
 from dask.utils import M
@@ -41,6 +43,10 @@ from nemo_curator.gpu_deduplication.jaccard_utils.merge_utils import (
 )
 from nemo_curator.gpu_deduplication.utils import create_logger, performance_report_if
 from nemo_curator.utils.distributed_utils import get_current_client, get_num_workers
+from nemo_curator.utils.fuzzy_dedup_utils.hash_utils import (
+    lsh_bucket_ids,
+    minhash_pandas,
+)
 from nemo_curator.utils.fuzzy_dedup_utils.id_mapping import convert_str_id_to_int, int_ids_to_str
 from nemo_curator.utils.fuzzy_dedup_utils.io_utils import (
     aggregated_anchor_docs_with_bk_read,
@@ -59,7 +65,9 @@ from nemo_curator.utils.fuzzy_dedup_utils.shuffle_utils import (
 
 class MinHash:
     """
-    Computes minhash signatures of a document corpus
+    Computes minhash signatures of a document corpus.
+    Datasets with a cuDF backend are hashed on the GPU,
+    datasets with a pandas backend are hashed on the CPU.
     """
 
     def __init__(
@@ -69,7 +77,7 @@ class MinHash:
         char_ngrams: int = 5,
         use_64bit_hash: bool = False,
         logger: Union[logging.LoggerAdapter, str] = "./",
-        id_field: str = "id",
+        id_field: Union[str, list] = "id",
         text_field: str = "text",
         profile_dir: str = None,
         cache_dir: str = None,
@@ -82,7 +90,8 @@ class MinHash:
         char_ngrams: Width of text window (in characters) while computing minhashes.
         use_64bit_hash: Whether to use a 64 bit hash function.
         logger: Existing logger to log to, or a path to a log directory.
-        id_field: Column in the Dataset denoting document ID.
+        id_field: Column(s) in the Dataset denoting document ID,
+          e.g. ["dataset_id", "doc_id"] for integer ids added by AddId.
         text_field: Column in the Dataset denoting document content.
         profile_dir: str, Default None
           If specified directory to write dask profile
@@ -92,8 +101,10 @@ class MinHash:
         self.num_hashes = num_hashes
         self.char_ngram = char_ngrams
         self.seeds = self.generate_seeds(n_seeds=self.num_hashes, seed=seed)
+        self.use_64bit_hash = use_64bit_hash
         self.minhash_method = self.minhash64 if use_64bit_hash else self.minhash32
         self.id_field = id_field
+        self.id_fields = [id_field] if isinstance(id_field, str) else id_field
         self.text_field = text_field
 
         if cache_dir is None and profile_dir is not None:
@@ -120,24 +131,30 @@ class MinHash:
         return gen.randint(0, 1e6, size=n_seeds)
 
     def minhash32(
-        self, ser: cudf.Series, seeds: np.ndarray, char_ngram: int
-    ) -> cudf.Series:
+        self, ser: Union[cudf.Series, pd.Series], seeds: np.ndarray, char_ngram: int
+    ) -> Union[cudf.Series, pd.Series]:
         """
         Compute 32bit minhashes based on the MurmurHash3 algorithm
         """
+        if isinstance(ser, pd.Series):
+            return minhash_pandas(ser, seeds=seeds, char_ngram=char_ngram)
         if not isinstance(ser, cudf.Series):
-            raise TypeError("Expected data of type cudf.Series")
+            raise TypeError("Expected data of type cudf.Series or pd.Series")
         seeds = cudf.Series(seeds, dtype="uint32")
         return ser.str.minhash(seeds=seeds, width=char_ngram)
 
     def minhash64(
-        self, ser: cudf.Series, seeds: np.ndarray, char_ngram: int
-    ) -> cudf.Series:
+        self, ser: Union[cudf.Series, pd.Series], seeds: np.ndarray, char_ngram: int
+    ) -> Union[cudf.Series, pd.Series]:
         """
         Compute 64bit minhashes based on the MurmurHash3 algorithm
         """
+        if isinstance(ser, pd.Series):
+            return minhash_pandas(
+                ser, seeds=seeds, char_ngram=char_ngram, use_64bit_hash=True
+            )
         if not isinstance(ser, cudf.Series):
-            raise TypeError("Expected data of type cudf.Series")
+            raise TypeError("Expected data of type cudf.Series or pd.Series")
         seeds = cudf.Series(seeds, dtype="uint64")
         return ser.str.minhash64(seeds=seeds, width=char_ngram)
 
@@ -152,7 +169,7 @@ class MinHash:
         -------
         DocumentDataset containing IDs of all documents and the corresponding MinHash Signature
         """
-        result = dataset.df[[self.id_field]]
+        result = dataset.df[self.id_fields]
         result["_minhash_signature"] = dataset.df[self.text_field].map_partitions(
             self.minhash_method,
             seeds=self.seeds,
@@ -173,18 +190,33 @@ class MinHash:
             self.profile_dir,
             f"minhash-profile-{datetime.now().strftime('%Y%m%d_%H%M%S')}.html",
         ):
-            result.to_parquet(write_path, write_index=False, overwrite=True)
+            if isinstance(result, dask_cudf.DataFrame):
+                result.to_parquet(write_path, write_index=False, overwrite=True)
+            else:
+                # Signatures are an object column of arrays on the CPU,
+                # so the list type cannot be inferred from the metadata.
+                hash_type = pa.uint64() if self.use_64bit_hash else pa.uint32()
+                result.to_parquet(
+                    write_path,
+                    write_index=False,
+                    overwrite=True,
+                    schema={"_minhash_signature": pa.list_(hash_type)},
+                )
         self._logger.info(
             f"Minhash signature computation for dataset took {time.time() - t0}s complete at {write_path}"  # noqa:E501
         )
-        return DocumentDataset(
-            dask_cudf.read_parquet(write_path, blocksize="2GB", aggregate_files=True)
-        )
+        if isinstance(result, dask_cudf.DataFrame):
+            return DocumentDataset(
+                dask_cudf.read_parquet(write_path, blocksize="2GB", aggregate_files=True)
+            )
+        return DocumentDataset(dd.read_parquet(write_path))
 
 
 class LSH:
     """
-    Performs LSH on a MinhashSignatures
+    Performs LSH on a MinhashSignatures.
+    On the GPU each band is hashed to a string which is later mapped to an integer,
+    on the CPU each band is hashed directly to a uint64 bucket id.
     """
 
     def __init__(
@@ -263,10 +295,20 @@ class LSH:
 
     def minhash_to_buckets(
         self,
-        df: cudf.DataFrame,
+        df: Union[cudf.DataFrame, pd.DataFrame],
         bucket_ranges: List[List[int]],
-    ) -> cudf.DataFrame:
+    ) -> Union[cudf.DataFrame, pd.DataFrame]:
         df2 = df[self.id_fields]
+        if isinstance(df, pd.DataFrame):
+            if len(df) > 0:
+                signatures = np.stack(df[self.minhash_field].values)
+            else:
+                signatures = np.empty((0, self.minhash_length), dtype=np.uint64)
+            bucket_ids = lsh_bucket_ids(signatures, bucket_ranges)
+            return df2.assign(
+                **{f"_bucket_{i}": bucket_ids[:, i] for i in range(len(bucket_ranges))}
+            )
+
         for i, h in enumerate(bucket_ranges):
             indices = cudf.Series([h]).repeat(len(df2))
             df2[f"_bucket_{i}"] = f"b{i}_" + df[self.minhash_field].list.take(
@@ -301,8 +343,8 @@ class LSH:
         return (bucket_ddf, end_bucket_id)
 
     def _minhash_to_bucket_meta(
-        self, df: dask_cudf.DataFrame
-    ) -> Tuple[cudf.DataFrame, int]:
+        self, df: Union[dask_cudf.DataFrame, dd.DataFrame]
+    ) -> Union[cudf.DataFrame, pd.DataFrame]:
         meta = df._meta_nonempty[self.id_fields]
         meta[self.minhash_field] = [np.ones(self.minhash_length)] * len(meta)
         return self.minhash_to_buckets(meta, self.bucket_ranges)
@@ -339,13 +381,15 @@ class LSH:
             ).map_partitions(lambda x: x[x["_bucket_id"].duplicated(keep=False)])
 
             df2 = df2.reset_index(drop=True)
-            df2, end_id = self.bucket_id_to_int(
-                df2, bucket_col_name="_bucket_id", start_id=bucket_start_id
-            )
-            # If bucketing return empty dataframe
-            if end_id < bucket_start_id:
-                continue
-            bucket_start_id = end_id + 1
+            # CPU bucket ids are already unique integers across all bands
+            if isinstance(df2, dask_cudf.DataFrame):
+                df2, end_id = self.bucket_id_to_int(
+                    df2, bucket_col_name="_bucket_id", start_id=bucket_start_id
+                )
+                # If bucketing return empty dataframe
+                if end_id < bucket_start_id:
+                    continue
+                bucket_start_id = end_id + 1
 
             # Workaround for dtype mismatches with empty partitions
             dtypes = df2.dtypes.to_dict()
@@ -374,7 +418,10 @@ class LSH:
             self.lsh(write_path=write_path, df=df)
         self._logger.info(f"Computing and writing buckets took {time.time() - t0} s")
 
-        buckets_df = dask_cudf.read_parquet(write_path, split_row_groups=False)
+        if isinstance(df, dask_cudf.DataFrame):
+            buckets_df = dask_cudf.read_parquet(write_path, split_row_groups=False)
+        else:
+            buckets_df = dd.read_parquet(write_path, split_row_groups=False)
         return DocumentDataset(buckets_df)
 
 
@@ -1076,11 +1123,31 @@ class ConnectedComponents:
         convert_str_ids=False,
         jaccard_threshold: int = 0.8,
     ):
+        """
+        Parameters
+        ----------
+        cache_dir: Directory to write intermediate outputs to.
+        jaccard_pairs_path: Path to the pairs of documents and their jaccard similarity.
+        id_column: Column(s) denoting document ID. Pairs hold the ID of each document
+          suffixed with "_x" and "_y". A list such as ["dataset_id", "doc_id"]
+          consumes integer ids added by AddId without any string parsing.
+        convert_str_ids: Whether ids are "{dataset_id}-{doc_id}" strings
+          that need to be split into integer dataset_id and doc_id columns.
+        jaccard_threshold: Pairs above this similarity are considered duplicates.
+        """
         self.cache_dir = cache_dir
         self.jaccard_pairs_path = jaccard_pairs_path
         self.id_column = id_column
-        self.left_id = f"{id_column}_x"
-        self.right_id = f"{id_column}_y"
+        if convert_str_ids:
+            self.id_columns = ["dataset_id", "doc_id"]
+        elif isinstance(id_column, str):
+            self.id_columns = [id_column]
+        else:
+            self.id_columns = id_column
+        # Columns holding the encoded (uint64) ids of each pair
+        id_name = id_column if isinstance(id_column, str) else "id"
+        self.left_id = f"{id_name}_x"
+        self.right_id = f"{id_name}_y"
         self.convert_str_ids = convert_str_ids
         self.jaccard_threshold = jaccard_threshold
 
@@ -1131,10 +1198,7 @@ class ConnectedComponents:
         labels_df = labels_df.merge(
             result, left_on=["uid"], right_on=["vertex"], how="inner"
         )
-        id_columns = (
-            ["dataset_id", "doc_id"] if self.convert_str_ids else [self.id_column]
-        )
-        labels_df = labels_df[id_columns + ["labels"]]
+        labels_df = labels_df[self.id_columns + ["labels"]]
         labels_df = labels_df.rename(columns={"labels": "group"})
         labels_df = labels_df.persist()
         # Doing an inner merge above
@@ -1213,14 +1277,19 @@ class ConnectedComponents:
 
     def _write_dedup_parsed_id(self):
         dedup_parsed_id_path = f"{self.cache_dir}/dedup_parsed_id.parquet"
+        if self.convert_str_ids:
+            pair_columns = [self.left_id, self.right_id]
+        else:
+            pair_columns = [
+                f"{id_col}_{tag}" for tag in ["x", "y"] for id_col in self.id_columns
+            ]
         ddf = dask_cudf.read_parquet(
             self.jaccard_pairs_path,
-            columns=[self.left_id, self.right_id],
+            columns=pair_columns,
             blocksize="1GB",
             aggregate_files=True,
         )
 
-        id_columns = [self.id_column]
         if self.convert_str_ids:
             ddf = ddf.map_partitions(
                 self._convert_str_id_pair_to_int,
@@ -1231,10 +1300,10 @@ class ConnectedComponents:
                     "doc_id_y": "int64",
                 },
             )
-            id_columns = ["dataset_id", "doc_id"]
 
         unique_docs = ddf.map_partitions(
-            ConnectedComponents._get_unique_ids_per_partition, id_columns=id_columns
+            ConnectedComponents._get_unique_ids_per_partition,
+            id_columns=self.id_columns,
         )
         unique_docs = unique_docs.drop_duplicates(split_out=ddf.npartitions // 4)
         unique_docs["uid"] = np.uint64(1)
@@ -1255,7 +1324,6 @@ class ConnectedComponents:
             blocksize="256MB",
             aggregate_files=True,
         )
-        id_columns = [self.id_column]
         if self.convert_str_ids:
             ddf = ddf.map_partitions(
                 self._convert_str_id_pair_to_int,
@@ -1267,14 +1335,13 @@ class ConnectedComponents:
                     "doc_id_y": "int64",
                 },
             )
-            id_columns = ["dataset_id", "doc_id"]
 
         num_workers = get_num_workers(get_current_client())
         self._batched_merge_and_write(
             ddf=ddf,
             ddf_id=ddf_id,
             output_path=output_path,
-            id_columns=id_columns,
+            id_columns=self.id_columns,
             batch_size=num_workers,
         )
         return output_path
@@ -1297,11 +1364,9 @@ class ConnectedComponents:
                     how="inner",
                     broadcast=True,
                 )
+                subset_ddf = subset_ddf.drop(columns=pair_ids)
                 subset_ddf = subset_ddf.rename(
-                    columns={"uid": f"{self.id_column}_{tag}"}
-                )
-                subset_ddf = subset_ddf.drop(
-                    columns=[f"dataset_id_{tag}", f"doc_id_{tag}"]
+                    columns={"uid": self.left_id if tag == "x" else self.right_id}
                 )
 
             subset_ddf = subset_ddf[[self.left_id, self.right_id, "jaccard"]]
@@ -12,11 +12,38 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from nemo_curator.modules.filter import FusedScoreFilter, ScoreFilter
+
+
 class Sequential:
-    def __init__(self, modules):
+    def __init__(self, modules, fused=False):
+        """
+        Args:
+          modules: The modules to apply to the dataset, in order.
+          fused: Whether to compile consecutive non-batched, uncached ScoreFilters
+            into a single FusedScoreFilter pass over each partition.
+        """
         self.modules = modules
-    
+        self.fused = fused
+
     def __call__(self, dataset):
-        for module in self.modules:
+        modules = self._fuse_modules() if self.fused else self.modules
+        for module in modules:
             dataset = module(dataset)
-        return dataset
\ No newline at end of file
+        return dataset
+
+    def _fuse_modules(self):
+        modules = []
+        run = []
+        for module in self.modules + [None]:
+            if isinstance(module, ScoreFilter) and not module.batched and module.score_cache_dir is None:
+                run.append(module)
+                continue
+            if len(run) > 1:
+                modules.append(FusedScoreFilter(run))
+            else:
+                modules.extend(run)
+            run = []
+            if module is not None:
+                modules.append(module)
+        return modules
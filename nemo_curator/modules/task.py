@@ -15,9 +15,11 @@
 from typing import Iterable, Union, List
 from collections import defaultdict
 from functools import reduce, partial
+from itertools import repeat
 
 from dask import delayed
 import dask.dataframe as dd
+import numpy as np
 
 from nemo_curator.tasks.downstream_task import DownstreamTask
 from nemo_curator.datasets import DocumentDataset
@@ -25,7 +27,7 @@ from nemo_curator.utils.text_utils import get_words
 from nemo_curator.utils.distributed_utils import single_partition_write_with_filename
 
 class TaskDecontamination:
-    def __init__(self, tasks: Union[DownstreamTask, Iterable[DownstreamTask]], text_field="text", max_ngram_size=13, max_matches=10, min_document_length=200, remove_char_each_side=200, max_splits=10, removed_dir=None) -> None:
+    def __init__(self, tasks: Union[DownstreamTask, Iterable[DownstreamTask]], text_field="text", max_ngram_size=13, max_matches=10, min_document_length=200, remove_char_each_side=200, max_splits=10, removed_dir=None, ngram_matcher="hash") -> None:
         """
         Removes segments of downstream evaluation tasks from a dataset
         Args:
@@ -35,7 +37,14 @@ class TaskDecontamination:
             remove_char_each_side: The number of characters to remove on either side of the matching ngram
             max_splits: The maximum number of times a document may be split before being entirely discarded.
             removed_dir: If not None, the documents split too many times will be written to this directory using the filename in the dataset.
+            ngram_matcher: How documents are searched for task n-grams. Either "hash" or "loop".
+                "hash" compiles the task n-grams once into per-length tables of word-level rolling hashes
+                and scans each document without building n-gram strings.
+                "loop" joins the words at every position for every n-gram length and looks the string up.
+                Both find the same matches.
         """
+        if ngram_matcher not in NGRAM_MATCHERS:
+            raise ValueError(f"Unknown ngram_matcher: {ngram_matcher}. Must be one of {list(NGRAM_MATCHERS.keys())}")
         if isinstance(tasks, DownstreamTask):
             tasks = [tasks]
         self.tasks = tasks
@@ -46,6 +55,7 @@ class TaskDecontamination:
         self.remove_char_each_side = remove_char_each_side
         self.max_splits = max_splits
         self.removed_dir = removed_dir
+        self.ngram_matcher = ngram_matcher
 
     def __call__(self, dataset: DocumentDataset) -> DocumentDataset:
 
@@ -97,16 +107,21 @@ class TaskDecontamination:
     
     def _find_matching_ngrams(self, task_ngrams: dict, delayed_dataset) -> dict:
         task_ngrams_frequency_sorted = delayed(self._compute_ngram_freq_sorted)(task_ngrams)
-        delayed_counts = [delayed(self._find_ngrams_partition)(partition, task_ngrams, task_ngrams_frequency_sorted) for partition in delayed_dataset]
+        # The matcher is built once and shared by all partitions
+        matcher = delayed(self._build_ngram_matcher)(task_ngrams, task_ngrams_frequency_sorted)
+        delayed_counts = [delayed(self._find_ngrams_partition)(partition, matcher) for partition in delayed_dataset]
         combined_counts = delayed(reduce)(self._merge_counts, delayed_counts)
         formatted_result = delayed(self._format_matching_ngrams_result)(combined_counts, task_ngrams_frequency_sorted)
 
         return formatted_result
 
-    def _find_ngrams_partition(self, dataset_partition, task_ngrams, ngrams_freq_sorted):
+    def _build_ngram_matcher(self, ngrams, ngrams_freq_sorted):
+        return NGRAM_MATCHERS[self.ngram_matcher](ngrams, ngrams_freq_sorted, self.max_ngram_size)
+
+    def _find_ngrams_partition(self, dataset_partition, matcher):
         partition_count = defaultdict(int)
         for document in dataset_partition[self.text_field]:
-            doc_result = self._find_ngrams(document, task_ngrams, ngrams_freq_sorted)
+            doc_result = self._find_ngrams(document, matcher)
             partition_count = TaskDecontamination._merge_counts(partition_count, doc_result)
         
         return partition_count
@@ -125,7 +140,7 @@ class TaskDecontamination:
             "ngrams-freq": ngram_freq,
         }
 
-    def _find_ngrams(self, document, task_ngrams, ngrams_freq_sorted):
+    def _find_ngrams(self, document, matcher):
         """
         Searches for matching n-grams in a document
         """
@@ -138,84 +153,20 @@ class TaskDecontamination:
             text = text_buf.pop(0)
             words, positions = get_words(text)
 
-            ngram_free = True
-            # First, loop over all n-grams in document
-            for i in range(len(words) - self.max_ngram_size + 1):
-                # Check if we found a matching n-gram
-                check_ngram_free = TaskDecontamination._check_text(
-                    words[i:i + self.max_ngram_size],
-                    task_ngrams,
+            match = matcher.search(words)
+            # If we found a match, the remainder of the text
+            # is appended to text_buf for futher processing
+            if match is not None:
+                start, ngram_len = match
+                TaskDecontamination._check_text(
+                    words[start:start + ngram_len],
+                    matcher.ngrams,
                     text,
-                    positions[i],
+                    positions[start],
                     text_buf,
                     local_ngram,
                 )
 
-                # If we found a match, break
-                # the remainder of the text is appended to text_buf
-                # for futher processing
-                if not check_ngram_free:
-                    ngram_free = False
-                    break
-
-                # Continue searching for the remaining dominant n-grams
-                for ngram_len, _ in ngrams_freq_sorted:
-                    # Check if we found a matching n-gram
-                    check_ngram_free = TaskDecontamination._check_text(
-                        words[i:i + ngram_len],
-                        task_ngrams,
-                        text,
-                        positions[i],
-                        text_buf,
-                        local_ngram,
-                    )
-
-                    # Again, if we find match, break
-                    # the remainder of the text is appended to text_buf
-                    # for futher processing
-                    if not check_ngram_free:
-                        ngram_free = False
-                        break
-
-                # Additional break to break out of both loops
-                if not ngram_free:
-                    break
-
-            # If did not find a match for the max_ngram_size
-            # check the ending n-gram
-            if ngram_free and len(words) - self.max_ngram_size > 0:
-                # get the last words of the lax max ngram
-                last_seq_words = words[len(words) - self.max_ngram_size:len(words)]
-                last_seq_start_position = len(words) - self.max_ngram_size
-
-                # check all n-grams lower than max ngram-len
-                for pos, (ngram_len, _) in enumerate(ngrams_freq_sorted):
-
-                    # ignore the max ngram as has been considered already
-                    if ngram_len == self.max_ngram_size:
-                        continue
-
-                    # find each ngram of ngram_len in max n-grams and check
-                    for i in range(len(last_seq_words) - ngram_len + 1):
-                        # Check for matching n-grams
-                        check_ngram_free = TaskDecontamination._check_text(
-                            last_seq_words[i:i + ngram_len],
-                            task_ngrams,
-                            text,
-                            positions[last_seq_start_position + i],
-                            text_buf,
-                            local_ngram,
-                        )
-
-                        # If we find a match, break
-                        if not check_ngram_free:
-                            ngram_free = False
-                            break
-
-                    # Break from both loops
-                    if not ngram_free:
-                        break
-
         return local_ngram
 
     @staticmethod
@@ -243,7 +194,8 @@ class TaskDecontamination:
     
     def _remove_matching_ngrams(self, matched_ngrams: dict, ngram_freq: List[tuple], delayed_dataset):
         threshhold_ngrams = delayed(self._threshold_ngram_count)(matched_ngrams)
-        delayed_removed_dataset = [delayed(self._remove_ngrams_partition)(partition, threshhold_ngrams, ngram_freq) for partition in delayed_dataset]
+        matcher = delayed(self._build_ngram_matcher)(threshhold_ngrams, ngram_freq)
+        delayed_removed_dataset = [delayed(self._remove_ngrams_partition)(partition, matcher) for partition in delayed_dataset]
 
         return delayed_removed_dataset
 
@@ -255,8 +207,8 @@ class TaskDecontamination:
         
         return filtered_ngrams
 
-    def _remove_ngrams_partition(self, partition, task_ngrams, ngrams_freq_sorted):
-        document_fn = partial(self._remove_ngrams, task_ngrams=task_ngrams, ngrams_freq_sorted=ngrams_freq_sorted)
+    def _remove_ngrams_partition(self, partition, matcher):
+        document_fn = partial(self._remove_ngrams, matcher=matcher)
         split_text = partition[self.text_field].apply(document_fn)
         num_splits = split_text.apply(len)
 
@@ -271,7 +223,7 @@ class TaskDecontamination:
         return filtered_partition.explode(self.text_field, ignore_index=True)
 
 
-    def _remove_ngrams(self, document, task_ngrams, ngrams_freq_sorted):
+    def _remove_ngrams(self, document, matcher):
         """
         Searches for matching n-grams in a document
         """
@@ -283,84 +235,21 @@ class TaskDecontamination:
             text = text_buf.pop(0)
             words, positions = get_words(text)
 
-            ngram_free = True
-            # First, loop over all n-grams in document
-            for i in range(len(words) - self.max_ngram_size + 1):
-                # Check if we found a matching n-gram
-                check_ngram_free = self._clean_text(
-                    words[i:i + self.max_ngram_size],
-                    task_ngrams,
+            match = matcher.search(words)
+            # If we found a match, the text is split around it
+            # and the remainder is appended to text_buf
+            ngram_free = match is None
+            if not ngram_free:
+                start, ngram_len = match
+                self._clean_text(
+                    words[start:start + ngram_len],
+                    matcher.ngrams,
                     text,
-                    positions[i],
+                    positions[start],
                     text_buf,
                     text_buf_ngram_free,
                 )
 
-                # If we found a match, break
-                # the remainder of the text is appended to text_buf
-                # for futher processing
-                if not check_ngram_free:
-                    ngram_free = False
-                    break
-
-                # Continue searching for the remaining dominant n-grams
-                for ngram_len, _ in ngrams_freq_sorted:
-                    # Check if we found a matching n-gram
-                    check_ngram_free = self._clean_text(
-                        words[i:i + ngram_len],
-                        task_ngrams,
-                        text,
-                        positions[i],
-                        text_buf,
-                        text_buf_ngram_free,
-                    )
-
-                    # Again, if we find match, break
-                    # the remainder of the text is appended to text_buf
-                    # for futher processing
-                    if not check_ngram_free:
-                        ngram_free = False
-                        break
-
-                # Additional break to break out of both loops
-                if not ngram_free:
-                    break
-
-            # If did not find a match for the max_ngram_size
-            # check the ending n-gram
-            if ngram_free and len(words) - self.max_ngram_size > 0:
-                # get the last words of the lax max ngram
-                last_seq_words = words[len(words) - self.max_ngram_size:len(words)]
-                last_seq_start_position = len(words) - self.max_ngram_size
-
-                # check all n-grams lower than max ngram-len
-                for pos, (ngram_len, _) in enumerate(ngrams_freq_sorted):
-
-                    # ignore the max ngram as has been considered already
-                    if ngram_len == self.max_ngram_size:
-                        continue
-
-                    # find each ngram of ngram_len in max n-grams and check
-                    for i in range(len(last_seq_words) - ngram_len + 1):
-                        # Check for matching n-grams
-                        check_ngram_free = self._clean_text(
-                            last_seq_words[i:i + ngram_len],
-                            task_ngrams,
-                            text,
-                            positions[last_seq_start_position + i],
-                            text_buf,
-                            text_buf_ngram_free,
-                        )
-
-                        # If we find a match, break
-                        if not check_ngram_free:
-                            ngram_free = False
-                            break
-
-                    # Break from both loops
-                    if not ngram_free:
-                        break
-
             # texts are ngram free
             if ngram_free:
                 text_buf_ngram_free.append(text)
@@ -427,4 +316,161 @@ class TaskDecontamination:
         if pos + 1 < len(text):
             text_second = text[pos + 1:len(text)]
 
-        return text_first, text_second
\ No newline at end of file
+        return text_first, text_second
+
+
+class LoopNgramMatcher:
+    """
+    Finds the first task n-gram in a list of words by joining the words
+    at every position for every n-gram length and looking the string up.
+    """
+
+    def __init__(self, ngrams, ngrams_freq_sorted, max_ngram_size):
+        self.ngrams = ngrams
+        self.ngram_lengths = [ngram_len for ngram_len, _ in ngrams_freq_sorted]
+        self.max_ngram_size = max_ngram_size
+
+    def _match(self, words):
+        return " ".join(words) in self.ngrams
+
+    def search(self, words):
+        """
+        Returns the (start, length) of the first matching n-gram in words, or None.
+        Positions are scanned left to right, checking the max_ngram_size n-gram
+        and then all other n-gram lengths in increasing order at each position.
+        The tail of the document is checked last for n-grams shorter than max_ngram_size.
+        """
+        # First, loop over all n-grams in document
+        for i in range(len(words) - self.max_ngram_size + 1):
+            if self._match(words[i:i + self.max_ngram_size]):
+                return i, self.max_ngram_size
+
+            # Continue searching for the remaining dominant n-grams
+            for ngram_len in self.ngram_lengths:
+                if self._match(words[i:i + ngram_len]):
+                    return i, ngram_len
+
+        # If did not find a match for the max_ngram_size
+        # check the ending n-gram
+        if len(words) - self.max_ngram_size > 0:
+            last_seq_start_position = len(words) - self.max_ngram_size
+
+            # check all n-grams lower than max ngram-len
+            for ngram_len in self.ngram_lengths:
+
+                # ignore the max ngram as has been considered already
+                if ngram_len == self.max_ngram_size:
+                    continue
+
+                # find each ngram of ngram_len in max n-grams and check
+                for i in range(self.max_ngram_size - ngram_len + 1):
+                    start = last_seq_start_position + i
+                    if self._match(words[start:start + ngram_len]):
+                        return start, ngram_len
+
+        return None
+
+
+class HashNgramMatcher(LoopNgramMatcher):
+    """
+    Finds the same n-gram as LoopNgramMatcher without building n-gram strings.
+    The task n-grams are compiled once into a word vocabulary and a sorted table
+    of word-level rolling hashes per n-gram length, fronted by a bitmap filter.
+    A document is mapped to word ids and the hashes of all its windows are
+    computed in one vectorized pass. Hash hits are verified against the n-gram
+    strings, so collisions never produce false matches.
+    """
+
+    _PRIME = np.uint64(0x100000001B3)
+    _OFFSET = np.uint64(0xCBF29CE484222325)
+
+    def __init__(self, ngrams, ngrams_freq_sorted, max_ngram_size):
+        super().__init__(ngrams, ngrams_freq_sorted, max_ngram_size)
+        self.vocab = {}
+        ngram_ids = defaultdict(list)
+        for ngram in ngrams:
+            words = ngram.split(" ")
+            ngram_ids[len(words)].append([self.vocab.setdefault(word, len(self.vocab) + 1) for word in words])
+
+        self.hash_tables = {}
+        for ngram_len in set(self.ngram_lengths) | {max_ngram_size}:
+            if ngram_len in ngram_ids:
+                ids = np.array(ngram_ids[ngram_len], dtype=np.uint64)
+                self.hash_tables[ngram_len] = np.unique(self._fold(ids))
+
+        # Bitmap over the high bits of every hash, about 8 bits per n-gram
+        num_hashes = sum(len(table) for table in self.hash_tables.values())
+        filter_bits = max(10, int(np.ceil(np.log2(max(num_hashes, 1) * 8))))
+        self._filter_shift = np.uint64(64 - filter_bits)
+        self.hash_filter = np.zeros(1 << filter_bits, dtype=bool)
+        for table in self.hash_tables.values():
+            self.hash_filter[table >> self._filter_shift] = True
+
+    @classmethod
+    def _fold(cls, windows):
+        hashes = np.full(len(windows), cls._OFFSET, dtype=np.uint64)
+        for i in range(windows.shape[1]):
+            hashes = (hashes ^ windows[:, i]) * cls._PRIME
+        return hashes
+
+    def _window_hashes(self, word_ids):
+        """
+        Hashes every window of every n-gram length in one pass.
+        The hashes of length n windows are extended by one word to get length n + 1.
+        """
+        window_hashes = {}
+        hashes = np.full(len(word_ids), self._OFFSET, dtype=np.uint64)
+        for i in range(min(max(self.hash_tables), len(word_ids))):
+            hashes = (hashes[:len(word_ids) - i] ^ word_ids[i:]) * self._PRIME
+            if i + 1 in self.hash_tables:
+                window_hashes[i + 1] = hashes
+        return window_hashes
+
+    def _candidates(self, words, window_hashes, ngram_len):
+        """
+        Yields the verified start positions of all n-grams of ngram_len in increasing order.
+        """
+        hashes = window_hashes.get(ngram_len)
+        if hashes is None:
+            return
+        starts = np.flatnonzero(self.hash_filter[hashes >> self._filter_shift])
+        if len(starts) == 0:
+            return
+        table = self.hash_tables[ngram_len]
+        idx = np.minimum(np.searchsorted(table, hashes[starts]), len(table) - 1)
+        for start in starts[table[idx] == hashes[starts]]:
+            if self._match(words[start:start + ngram_len]):
+                yield int(start)
+
+    def search(self, words):
+        num_words = len(words)
+        if num_words < self.max_ngram_size or not self.hash_tables:
+            return None
+        word_ids = np.fromiter(map(self.vocab.get, words, repeat(0)), dtype=np.uint64, count=num_words)
+        window_hashes = self._window_hashes(word_ids)
+
+        # Earliest start wins, ties are broken by the order LoopNgramMatcher checks lengths in
+        last_start = num_words - self.max_ngram_size
+        best = None
+        for priority, ngram_len in enumerate([self.max_ngram_size] + self.ngram_lengths):
+            start = next(self._candidates(words, window_hashes, ngram_len), None)
+            if start is not None and start <= last_start and (best is None or (start, priority) < best[0]):
+                best = ((start, priority), (start, ngram_len))
+        if best is not None:
+            return best[1]
+
+        if last_start > 0:
+            for ngram_len in self.ngram_lengths:
+                if ngram_len == self.max_ngram_size:
+                    continue
+                for start in self._candidates(words, window_hashes, ngram_len):
+                    if start >= last_start:
+                        return start, ngram_len
+
+        return None
+
+
+NGRAM_MATCHERS = {
+    "hash": HashNgramMatcher,
+    "loop": LoopNgramMatcher,
+}
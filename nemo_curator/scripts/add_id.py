@@ -27,6 +27,7 @@ from nemo_curator.utils.file_utils import (
 )
 from nemo_curator.utils.distributed_utils import (
     get_client,
+    get_partition_lengths,
     read_data,
     write_to_disk
 )
@@ -42,7 +43,17 @@ def main(args):
     random.shuffle(files)
 
   dataset = DocumentDataset(read_data(files, file_type=args.input_file_type, backend="pandas", add_filename=True))
-  add_id = nemo_curator.AddId(args.id_field_name, id_prefix=args.id_prefix, start_index=args.starting_index)
+  partition_lengths = None
+  if args.input_file_type in ["jsonl", "parquet"]:
+    # Counting documents up front lets ids be assigned in a single read of the data
+    partition_lengths = get_partition_lengths(files, file_type=args.input_file_type, cache_file=args.row_count_cache)
+  add_id = nemo_curator.AddId(
+      args.id_field_name,
+      id_prefix=args.id_prefix,
+      start_index=args.starting_index,
+      dataset_id=args.dataset_id,
+      partition_lengths=partition_lengths,
+  )
   id_dataset = add_id(dataset)
 
   write_to_disk(id_dataset.df, output_dir, write_to_filename=True, output_type=args.output_file_type)
@@ -101,6 +112,22 @@ these ids must be added prior to performing fuzzy/exact deduplication
       "document belongs to a particular dataset (e.g., wiki for documents"
       "that come from the wikipedia dataset)",
   )
+  parser.add_argument(
+      "--dataset-id",
+      type=int,
+      default=None,
+      help="If specified, integer ids are added instead of prefixed "
+      "strings: a \"dataset_id\" field holding this value and an integer "
+      "document number in the \"--id-field-name\" field. These can be used "
+      "directly as the id fields of the deduplication modules",
+  )
+  parser.add_argument(
+      "--row-count-cache",
+      type=str,
+      default=None,
+      help="A JSON file caching the number of documents in each input file. "
+      "Files that did not change since a previous run are not counted again",
+  )
   attach_bool_arg(
       parser,
       "shuffle",
@@ -77,7 +77,8 @@ def main(args):
             backend="cudf",
             files_per_partition=args.files_per_partition,
             add_filename=False,
-        )[[id_field, text_field]]
+            columns=[id_field, text_field],
+        )
 
         if num_files is not None:
             num_files -= len(files)
@@ -14,11 +14,12 @@
 
 import argparse
 import os
+import dask
 from nemo_curator.download import batch_download, download_and_extract
 from nemo_curator.utils.distributed_utils import get_client
 from nemo_curator.utils.script_utils import attach_bool_arg, add_distributed_args
 from nemo_curator.utils.config_utils import build_downloader
-from nemo_curator.utils.file_utils import get_all_files_paths_under, expand_outdir_and_mkdir
+from nemo_curator.utils.file_utils import get_all_files_paths_under, expand_outdir_and_mkdir, parse_str_of_num_bytes
 
 def read_urls(file_path):
   with open(file_path, 'r') as fp:
@@ -26,6 +27,9 @@ def read_urls(file_path):
   return [url.strip() for url in urls]
 
 def main(args):
+  if args.extract_processes:
+    # Local Dask workers must not be daemonic to start extraction processes
+    dask.config.set({"distributed.worker.daemon": False})
   client = get_client(args, args.device)
 
   if args.input_url_file:
@@ -48,11 +52,12 @@ def main(args):
   downloader, iterator, extractor, output_format = build_downloader(args.builder_config_file, default_download_dir=raw_download_dir)
 
   if args.download_only:
-    output_paths = batch_download(urls, downloader)
+    output_paths = batch_download(urls, downloader, num_threads=args.download_threads)
     print(f"{len(output_paths)} were downloaded")
     return
 
-  dataset = download_and_extract(urls, output_paths, downloader, iterator, extractor, output_format, keep_raw_download=args.keep_downloaded_files, force_download=args.overwrite_existing_json)
+  prefetch_max_bytes = parse_str_of_num_bytes(args.prefetch_max_size) if args.prefetch_max_size else None
+  dataset = download_and_extract(urls, output_paths, downloader, iterator, extractor, output_format, keep_raw_download=args.keep_downloaded_files, force_download=args.overwrite_existing_json, records_per_chunk=args.records_per_chunk, extract_processes=args.extract_processes, files_per_partition=args.files_per_partition, prefetch_depth=args.prefetch_depth, prefetch_max_bytes=prefetch_max_bytes, splits_per_file=args.splits_per_file)
 
   # Sample to trigger the dask computation
   sample = dataset.df.sample(frac=10 / len(dataset)).compute()
@@ -128,12 +133,66 @@ such that it simply returns the pre-downloaded file
       "in 'download-only' mode. Specify this argument only when "
       "the '--download-only flag is specified'.",
   )
+  parser.add_argument(
+      "--files-per-partition",
+      type=int,
+      default=1,
+      help="The number of consecutive urls downloaded and extracted by each task",
+  )
+  parser.add_argument(
+      "--prefetch-depth",
+      type=int,
+      default=0,
+      help="The number of files of a task downloaded in the background "
+      "while an earlier file of the task is extracted. Requires "
+      "--files-per-partition to be greater than 1",
+  )
+  parser.add_argument(
+      "--prefetch-max-size",
+      type=str,
+      default=None,
+      help="If specified, no more files are downloaded ahead while the "
+      "prefetched files take up this much disk space (e.g., 10G)",
+  )
+  parser.add_argument(
+      "--splits-per-file",
+      type=int,
+      default=1,
+      help="The number of tasks each file is extracted by. Every file is "
+      "split into byte ranges of about the same size, which requires an "
+      "iterator that implements DocumentIterator.split",
+  )
+  parser.add_argument(
+      "--download-threads",
+      type=int,
+      default=None,
+      help="In 'download-only' mode, the number of threads that download "
+      "files concurrently from this process. By default, every file is "
+      "downloaded by a task of the Dask cluster",
+  )
   attach_bool_arg(
       parser,
       "overwrite-existing-json",
       help_str="If this flag is specified, then the json data will be "
       "overwritten if downloading from the the same file.",
   )
+  parser.add_argument(
+      "--records-per-chunk",
+      type=int,
+      default=None,
+      help="If specified, the extracted records of each file are written "
+      "to disk in chunks of this many records during extraction, "
+      "bounding the memory needed to extract large files",
+  )
+  parser.add_argument(
+      "--extract-processes",
+      type=int,
+      default=None,
+      help="If specified, the records of each file are extracted by a pool "
+      "of this many processes, so that a single worker can use all cores of a node. "
+      "Workers of a cluster started outside of this script must have the Dask config "
+      "'distributed.worker.daemon' set to False",
+  )
 
   parser = add_distributed_args(parser)
 
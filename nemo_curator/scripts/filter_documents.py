@@ -26,17 +26,6 @@ from nemo_curator.utils.distributed_utils import read_data, write_to_disk, get_c
 from nemo_curator.utils.config_utils import build_filter_pipeline
 
 
-def get_dataframe_complement(original_df, filtered_df):
-  def partition_complement(part_original_df, partition_info=None):
-    if not partition_info:
-      return part_original_df
-    part_filtered_df = filtered_df.get_partition(partition_info["number"])
-    complement_mask = ~part_original_df.index.isin(part_filtered_df.index.persist())
-    complement_df = part_original_df[complement_mask]
-    return complement_df
-
-  return original_df.map_partitions(partition_complement)
-
 def get_score_fields(pipeline):
   score_fields = []
   for nc_module in pipeline.modules:
@@ -68,33 +57,38 @@ def main(args):
   if removed_document_dir:
     expand_outdir_and_mkdir(removed_document_dir)
   
-  filter_pipeline = build_filter_pipeline(args.filter_config_file)
+  filter_pipeline = build_filter_pipeline(args.filter_config_file, score_cache_dir=args.score_cache_dir)
   score_fields = get_score_fields(filter_pipeline)
 
+  # Evaluate the whole pipeline once and label each document with the first filter that removed it
+  label_field = "_first_failing_filter"
+  labeler = nemo_curator.FirstFailingFilter(filter_pipeline.modules, label_field=label_field)
+
   for files in get_batched_files(args.input_data_dir, kept_document_dir, args.input_file_type, batch_size=args.batch_size):
     # Load the data and filter
     dataset = DocumentDataset(read_data(files, file_type=args.input_file_type, backend=backend, add_filename=True))
-    curr_dataset = prev_dataset = dataset
+    labeled_df = labeler(dataset).df.persist()
 
-    # Process each filter individually so we can track which documents are removed at each step
-    for filter_module in filter_pipeline.modules:
-      curr_dataset = filter_module(curr_dataset).persist()
-      
+    # Save the documents removed by each filter along with the scores of the filters before it
+    later_score_fields = list(score_fields)
+    for position, filter_module in enumerate(filter_pipeline.modules):
       filter_field = None
       if isinstance(filter_module, nemo_curator.Filter):
         filter_field = filter_module.filter_field
       elif isinstance(filter_module, nemo_curator.ScoreFilter):
         filter_field = filter_module.score_field
-      
-      # Save the documents removed by the filter
+
       if removed_document_dir and filter_field:
-        removed_df = get_dataframe_complement(prev_dataset.df, curr_dataset.df)
+        removed_df = labeled_df[labeled_df[label_field] == position]
+        removed_df = removed_df.drop(columns=[label_field, *later_score_fields])
         removed_filter_dir = os.path.join(removed_document_dir, filter_field)
         expand_outdir_and_mkdir(removed_filter_dir)
         write_to_disk(removed_df, removed_filter_dir, write_to_filename=True, output_type=args.output_file_type)
-        prev_dataset = curr_dataset
-    filtered_dataset = curr_dataset
-    filtered_dataset = filter_pipeline(dataset).persist()
+
+      if isinstance(filter_module, (nemo_curator.Score, nemo_curator.ScoreFilter)) and filter_module.score_field:
+        later_score_fields.remove(filter_module.score_field)
+
+    filtered_dataset = labeler.kept(DocumentDataset(labeled_df))
 
     # Write scores to separate directory
     if args.output_document_score_dir:
@@ -205,6 +199,16 @@ def attach_args(parser=argparse.ArgumentParser(
       "filters with 'log_score: True' in the config. If this directory is not "
       "specified, then filter scores will not be written",
   )
+  parser.add_argument(
+      "--score-cache-dir",
+      type=str,
+      default=None,
+      help="Directory in which document scores are cached between runs. "
+      "Scores are keyed by a hash of the document and by the filter "
+      "parameters that affect the score, so rerunning a config in which "
+      "only the thresholds changed does not recompute any score. "
+      "Overrides the 'score_cache_dir' key of the filter config file",
+  )
   parser.add_argument(
       "--id-field",
       type=str,
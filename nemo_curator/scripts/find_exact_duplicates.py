@@ -62,7 +62,8 @@ def main(args):
         backend="pandas" if args.no_gpu else "cudf",
         files_per_partition=args.files_per_partition,
         add_filename=False,
-    )[[id_field, text_field]]
+        columns=[id_field, text_field],
+    )
     if num_files is not None:
       num_files -= len(files)
     dfs.append(df)
@@ -29,7 +29,7 @@ def main(args):
   with open(args.input_task_ngrams, 'rb') as fp:
     task_ngrams = pickle.load(fp)
 
-  decontaminator = nemo_curator.TaskDecontamination([], text_field=args.input_text_field, max_ngram_size=args.max_ngram_size)
+  decontaminator = nemo_curator.TaskDecontamination([], text_field=args.input_text_field, max_ngram_size=args.max_ngram_size, ngram_matcher=args.ngram_matcher)
 
   files = get_all_files_paths_under(args.input_data_dir)
   dataset = DocumentDataset(read_data(files, file_type=args.input_file_type, backend="pandas"))
@@ -103,6 +103,16 @@ def attach_args(parser=argparse.ArgumentParser(
       " include 'jsonl' (default), 'pickle', or 'parquet'.",
   )
 
+  parser.add_argument(
+      "--ngram-matcher",
+      type=str,
+      default="hash",
+      choices=["hash", "loop"],
+      help="How documents are searched for task n-grams. 'hash' scans "
+      "each document once against precompiled word-level hashes of the "
+      "task n-grams, 'loop' looks up the joined words at every position.",
+  )
+
   parser = add_distributed_args(parser)
 
   return parser
@@ -53,7 +53,8 @@ def main(args):
                                            max_ngram_size=max_ngram_size,
                                            max_matches=args.match_threshold,
                                            max_splits=args.max_document_splits,
-                                           removed_dir=output_rm_doc_dir
+                                           removed_dir=output_rm_doc_dir,
+                                           ngram_matcher=args.ngram_matcher,
                                            )
 
   files = list(get_all_files_paths_under(args.input_data_dir))
@@ -154,6 +155,16 @@ def attach_args(parser=argparse.ArgumentParser(
       help="Number of files to read into memory at a time.",
   )
 
+  parser.add_argument(
+      "--ngram-matcher",
+      type=str,
+      default="hash",
+      choices=["hash", "loop"],
+      help="How documents are searched for task n-grams. 'hash' scans "
+      "each document once against precompiled word-level hashes of the "
+      "task n-grams, 'loop' looks up the joined words at every position.",
+  )
+
   parser = add_distributed_args(parser)
 
   return parser
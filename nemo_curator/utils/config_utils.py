@@ -34,27 +34,36 @@ def build_filter(filter_config):
   doc_filter = filter_class(**filter_config["params"])
 
   if filter_config.get("filter_only", False):
-    filter_stage = nemo_curator.Filter(doc_filter.keep_document, filter_field=doc_filter.name)
+    filter_stage = nemo_curator.Filter(doc_filter.keep_document, filter_field=doc_filter.name, batched=filter_config.get("batched", False))
   else:
     score_field = doc_filter._name if filter_config.get("log_score", False) else None
-    filter_stage = nemo_curator.ScoreFilter(doc_filter, filter_config.get("input_field"), score_field=score_field)
+    filter_stage = nemo_curator.ScoreFilter(
+        doc_filter,
+        filter_config.get("input_field"),
+        score_field=score_field,
+        batched=filter_config.get("batched", False),
+        score_cache_dir=filter_config.get("score_cache_dir"),
+    )
 
   return filter_stage
 
-def build_filter_pipeline(filter_config_file):
+def build_filter_pipeline(filter_config_file, fused=False, score_cache_dir=None):
   # Get the filter config file
   with open(filter_config_file, 'r') as config_file:
     filter_params = yaml.load(config_file, Loader=yaml.FullLoader)
 
   filters = []
   text_field = filter_params.get("input_field")
+  score_cache_dir = score_cache_dir or filter_params.get("score_cache_dir")
   for nc_filter_config in filter_params.get("filters"):
     if "input_field" not in nc_filter_config or nc_filter_config["input_field"] is None:
       nc_filter_config["input_field"] = text_field
+    if nc_filter_config.get("score_cache_dir") is None:
+      nc_filter_config["score_cache_dir"] = score_cache_dir
     new_filter = build_filter(nc_filter_config)
     filters.append(new_filter)
 
-  return nemo_curator.Sequential(filters)
+  return nemo_curator.Sequential(filters, fused=fused)
 
 def build_downloader(downloader_config_file, default_download_dir=None):
   # Get the downloader config file
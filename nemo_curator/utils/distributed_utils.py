@@ -12,14 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import os
 
 os.environ["RAPIDS_NO_INITIALIZE"] = "1"
 import warnings
 import cudf
+import dask
 import dask.dataframe as dd
 import dask_cudf
 import pandas as pd
+import pyarrow.parquet as pq
 from dask.distributed import Client, LocalCluster, get_worker
 from dask_cuda import LocalCUDACluster
 from typing import Union
@@ -167,8 +170,69 @@ def _enable_spilling():
     cudf.set_option("spill", True)
 
 
+_FILTER_OPS = {
+    "=": lambda column, value: column == value,
+    "==": lambda column, value: column == value,
+    "!=": lambda column, value: column != value,
+    "<": lambda column, value: column < value,
+    "<=": lambda column, value: column <= value,
+    ">": lambda column, value: column > value,
+    ">=": lambda column, value: column >= value,
+    "in": lambda column, value: column.isin(value),
+    "not in": lambda column, value: ~column.isin(value),
+}
+
+
+def apply_filters(df, filters):
+    """
+    This function keeps the rows of a DataFrame that match filters given in the
+    disjunctive normal form used by pyarrow and cuDF when reading Parquet files:
+    a list of (column, op, value) tuples that must all match, or a list of such
+    lists any of which must match.
+
+    Args:
+        df: A cudf DataFrame or a pandas DataFrame.
+        filters: The filters, e.g. [("language", "==", "EN")].
+    Returns:
+        The rows of the DataFrame that match the filters.
+
+    """
+    if not filters:
+        return df
+    if isinstance(filters[0], tuple):
+        filters = [filters]
+
+    mask = None
+    for conjunction in filters:
+        conjunction_mask = None
+        for column, op, value in conjunction:
+            if op not in _FILTER_OPS:
+                raise ValueError(f"Unknown filter operator: {op}")
+            predicate_mask = _FILTER_OPS[op](df[column], value)
+            conjunction_mask = (
+                predicate_mask
+                if conjunction_mask is None
+                else conjunction_mask & predicate_mask
+            )
+        mask = conjunction_mask if mask is None else mask | conjunction_mask
+    return df[mask].reset_index(drop=True)
+
+
+def _select(df, columns=None, filters=None):
+    # Filters may use columns that are not selected
+    df = apply_filters(df, filters)
+    if columns is not None:
+        df = df[columns]
+    return df
+
+
 def read_single_partition(
-    files, backend="cudf", filetype="jsonl", add_filename=False
+    files,
+    backend="cudf",
+    filetype="jsonl",
+    add_filename=False,
+    columns=None,
+    filters=None,
 ) -> Union[cudf.DataFrame, pd.DataFrame]:
     """
     This function reads a file with cuDF, sorts the columns of the DataFrame
@@ -178,6 +242,12 @@ def read_single_partition(
         files: The path to the jsonl files to read.
         backend: The backend to use for reading the data. Either "cudf" or "pandas".
         add_filename: Whether to add a "filename" column to the DataFrame.
+        columns: If specified, only these columns are read.
+            Only these columns are decoded from Parquet files, while JSONL files
+            are parsed completely before the other columns are dropped.
+        filters: If specified, only the rows matching these filters are read.
+            See apply_filters for their format. Parquet readers use them to skip the
+            row groups that cannot match, while JSONL files are filtered after parsing.
     Returns:
         A cudf DataFrame or a pandas DataFrame.
 
@@ -190,7 +260,7 @@ def read_single_partition(
             read_kwargs["dtype"] = False
             read_f = pd.read_json
     elif filetype == "parquet":
-        read_kwargs = {}
+        read_kwargs = {"columns": columns, "filters": filters}
         if backend == "cudf":
             read_f = cudf.read_parquet
         else:
@@ -216,30 +286,37 @@ def read_single_partition(
         df_ls = []
         for file in files:
             df = read_f(file, **read_kwargs)
+            if filetype == "jsonl":
+                df = _select(df, columns, filters)
             if add_filename:
                 df["filename"] = os.path.basename(file)
             df_ls.append(df)
         df = concat_f(df_ls, ignore_index=True)
     else:
         df = read_f(files, **read_kwargs)
+        if filetype == "jsonl":
+            df = _select(df, columns, filters)
     df = df[sorted(df.columns)]
     return df
 
 
-def read_pandas_pickle(file, add_filename=False) -> pd.DataFrame:
+def read_pandas_pickle(file, add_filename=False, columns=None, filters=None) -> pd.DataFrame:
     """
     This function reads a pickle file with pandas and adds a "filename" column.
 
     Args:
         file: The path to the pickle file to read.
         add_filename: Whether to add a "filename" column to the DataFrame.
+        columns: If specified, only these columns are kept.
+        filters: If specified, only the rows matching these filters are kept.
+            See apply_filters for their format.
     Returns:
         A pandas DataFrame.
 
     """
     if add_filename:
         warnings.warn("add_filename is not supported for pickle files")
-    return pd.read_pickle(file)
+    return _select(pd.read_pickle(file), columns, filters)
 
 
 def read_data(
@@ -248,6 +325,8 @@ def read_data(
     backend="cudf",
     files_per_partition=1,
     add_filename=False,
+    columns=None,
+    filters=None,
 ) -> Union[dd.DataFrame, dask_cudf.DataFrame]:
     """
     This function can read multiple data formats and returns a Dask-cuDF DataFrame.
@@ -258,13 +337,19 @@ def read_data(
         backend: The backend to use for reading the data.
         files_per_partition: The number of files to read per partition.
         add_filename: Whether to add a "filename" column to the DataFrame.
+        columns: If specified, only these columns are read. Reading only the columns
+            a stage needs saves decoding the other columns of Parquet files.
+        filters: If specified, only the rows matching these filters are read,
+            e.g. [("language", "==", "EN")]. See apply_filters for their format.
 
     Returns:
         A Dask-cuDF or a Dask-pandas DataFrame.
 
     """
     if file_type == "pickle":
-        df = read_pandas_pickle(input_files[0], add_filename=add_filename)
+        df = read_pandas_pickle(
+            input_files[0], add_filename=add_filename, columns=columns, filters=filters
+        )
         df = dd.from_pandas(df, npartitions=16)
         if backend == "cudf":
             df = df.to_backend("cudf")
@@ -285,6 +370,8 @@ def read_data(
             filetype=file_type,
             backend=backend,
             add_filename=add_filename,
+            columns=columns,
+            filters=filters,
             enforce_metadata=False,
         )
     else:
@@ -292,6 +379,86 @@ def read_data(
     return df
 
 
+def count_rows(file, file_type="jsonl") -> int:
+    """
+    This function counts the documents in a file without decoding them.
+    The row count of a Parquet file is read from its footer,
+    and the documents of a JSONL file are counted as its non-blank lines.
+
+    Args:
+        file: The path to the file.
+        file_type: The type of the file. Either "jsonl" or "parquet".
+    Returns:
+        The number of documents in the file.
+
+    """
+    if file_type == "parquet":
+        return pq.read_metadata(file).num_rows
+    elif file_type == "jsonl":
+        with open(file, "rb") as f:
+            return sum(1 for line in f if not line.isspace())
+    else:
+        raise RuntimeError("Could not count rows, please check file type")
+
+
+def get_partition_lengths(
+    input_files,
+    file_type="jsonl",
+    files_per_partition=1,
+    cache_file=None,
+) -> list:
+    """
+    This function returns the number of documents in each partition of the
+    DataFrame that read_data creates for the same arguments.
+    Files are counted in parallel with count_rows.
+
+    Args:
+        input_files: The path of the input file(s).
+        file_type: The type of the input file(s). Either "jsonl" or "parquet".
+        files_per_partition: The number of files to read per partition.
+        cache_file: An optional JSON file caching the row count of every file,
+            keyed by its path, size and modification time.
+            Only new or modified files are counted again.
+    Returns:
+        A list with the number of documents in each partition.
+
+    """
+    input_files = sorted(input_files)
+    cache = {}
+    if cache_file is not None and os.path.exists(cache_file):
+        with open(cache_file) as f:
+            cache = json.load(f)
+
+    file_rows = {}
+    missing = []
+    for file in input_files:
+        stat = os.stat(file)
+        key = os.path.abspath(file)
+        entry = cache.get(key)
+        if entry is not None and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+            file_rows[file] = entry[2]
+        else:
+            missing.append((file, key, stat))
+
+    if missing:
+        counts = dask.compute(
+            *[dask.delayed(count_rows)(file, file_type) for file, _, _ in missing]
+        )
+        for (file, key, stat), rows in zip(missing, counts):
+            file_rows[file] = rows
+            cache[key] = [stat.st_size, stat.st_mtime_ns, rows]
+        if cache_file is not None:
+            # Write under a temporary name so readers never see a partial file
+            with open(cache_file + ".tmp", "w") as f:
+                json.dump(cache, f)
+            os.replace(cache_file + ".tmp", cache_file)
+
+    return [
+        sum(file_rows[file] for file in input_files[i : i + files_per_partition])
+        for i in range(0, len(input_files), files_per_partition)
+    ]
+
+
 def process_batch(
     load_model_function, load_model_kwargs, run_inference_function, run_inference_kwargs
 ):
@@ -346,7 +513,57 @@ def process_all_batches(
     )
 
 
-def single_partition_write_with_filename(df, output_file_dir, output_type="jsonl"):
+def _write_jsonl(df, output_file_path, records_per_chunk=None):
+    """
+    Writes a DataFrame to a JSONL file. If records_per_chunk is specified, the
+    DataFrame is converted to JSON and written that many rows at a time, so the
+    JSON string of the whole DataFrame is never held in memory.
+    """
+    # See open issue here: https://github.com/rapidsai/cudf/issues/15211
+    # df.to_json(
+    #     output_file_path, orient="records", lines=True, engine="cudf", force_ascii=False
+    # )
+    if records_per_chunk is None:
+        df.to_json(output_file_path, orient="records", lines=True, force_ascii=False)
+        return
+
+    with open(output_file_path, "w", encoding="utf-8") as f:
+        for start in range(0, len(df), records_per_chunk):
+            chunk = df.iloc[start : start + records_per_chunk]
+            chunk.to_json(f, orient="records", lines=True, force_ascii=False)
+
+
+def _write_parquet(
+    df, output_file_path, row_group_size=None, compression="snappy", use_dictionary=True
+):
+    """
+    Writes a DataFrame to a Parquet file with at most row_group_size rows per row group
+    """
+    if isinstance(df, pd.DataFrame):
+        df.to_parquet(
+            output_file_path,
+            compression=compression,
+            row_group_size=row_group_size,
+            use_dictionary=use_dictionary,
+        )
+    else:
+        df.to_parquet(
+            output_file_path,
+            compression=compression,
+            row_group_size_rows=row_group_size,
+            use_dictionary=use_dictionary,
+        )
+
+
+def single_partition_write_with_filename(
+    df,
+    output_file_dir,
+    output_type="jsonl",
+    records_per_chunk=None,
+    row_group_size=None,
+    compression="snappy",
+    use_dictionary=True,
+):
     """
     This function processes a DataFrame and writes it to disk
 
@@ -354,6 +571,12 @@ def single_partition_write_with_filename(df, output_file_dir, output_type="jsonl
         df: A DataFrame.
         output_file_dir: The output file path.
         output_type="jsonl": The type of output file to write.
+        records_per_chunk: If specified, JSONL files are written this many records at a time,
+            instead of converting the whole DataFrame to a single JSON string.
+        row_group_size: The maximum number of rows in a row group of Parquet files.
+            If None, the default of the Parquet writer is used.
+        compression: The compression codec of Parquet files, e.g. "snappy", "zstd" or None.
+        use_dictionary: Whether to dictionary encode the columns of Parquet files.
     Returns:
         If the DataFrame is non-empty, return a Series containing a single element, True.
         If the DataFrame is empty, return a Series containing a single element, False.
@@ -383,26 +606,32 @@ def single_partition_write_with_filename(df, output_file_dir, output_type="jsonl
         output_file_path = os.path.join(output_file_dir, filename)
         if output_type == "jsonl":
             output_file_path = output_file_path + ".jsonl"
-            if isinstance(df, pd.DataFrame):
-                df.to_json(output_file_path, orient="records", lines=True, force_ascii=False)
-            else:
-                # See open issue here: https://github.com/rapidsai/cudf/issues/15211
-                # df.to_json(
-                #     output_file_path, orient="records", lines=True, engine="cudf", force_ascii=False
-                # )
-                df.to_json(
-                    output_file_path, orient="records", lines=True, force_ascii=False
-                )
+            _write_jsonl(df, output_file_path, records_per_chunk=records_per_chunk)
         elif output_type == "parquet":
             output_file_path = output_file_path + ".parquet"
-            df.to_parquet(output_file_path)
+            _write_parquet(
+                df,
+                output_file_path,
+                row_group_size=row_group_size,
+                compression=compression,
+                use_dictionary=use_dictionary,
+            )
         else:
             raise ValueError(f"Unknown output type: {output_type}")
 
     return success_ser
 
 
-def write_to_disk(df, output_file_dir, write_to_filename=False, output_type="jsonl"):
+def write_to_disk(
+    df,
+    output_file_dir,
+    write_to_filename=False,
+    output_type="jsonl",
+    records_per_chunk=None,
+    row_group_size=None,
+    compression="snappy",
+    use_dictionary=True,
+):
     """
     This function writes a Dask DataFrame to the specified file path.
     If write_to_filename is True, then it expects the
@@ -413,6 +642,14 @@ def write_to_disk(df, output_file_dir, write_to_filename=False, output_type="jso
         output_file_dir: The output file path.
         write_to_filename: Whether to write the filename using the "filename" column.
         output_type="jsonl": The type of output file to write.
+        records_per_chunk: If specified, the JSONL file of each "filename" is written
+            this many records at a time, which bounds the memory used to write
+            large partitions. Only used if write_to_filename is True.
+        row_group_size: The maximum number of rows in a row group of Parquet files.
+            Smaller row groups let readers skip more data using the statistics of
+            the row groups, larger ones compress better.
+        compression: The compression codec of Parquet files, e.g. "snappy", "zstd" or None.
+        use_dictionary: Whether to dictionary encode the columns of Parquet files.
 
     """
     if write_to_filename and "filename" not in df.columns:
@@ -430,6 +667,10 @@ def write_to_disk(df, output_file_dir, write_to_filename=False, output_type="jso
             single_partition_write_with_filename,
             output_file_dir,
             output_type=output_type,
+            records_per_chunk=records_per_chunk,
+            row_group_size=row_group_size,
+            compression=compression,
+            use_dictionary=use_dictionary,
             meta=output_meta,
             enforce_metadata=False,
         )
@@ -443,7 +684,22 @@ def write_to_disk(df, output_file_dir, write_to_filename=False, output_type="jso
             else:
                 df.to_json(output_file_dir, orient="records", lines=True, force_ascii=False)
         elif output_type == "parquet":
-            df.to_parquet(output_file_dir, write_index=False)
+            if isinstance(df, dask_cudf.DataFrame):
+                df.to_parquet(
+                    output_file_dir,
+                    write_index=False,
+                    compression=compression,
+                    row_group_size_rows=row_group_size,
+                    use_dictionary=use_dictionary,
+                )
+            else:
+                df.to_parquet(
+                    output_file_dir,
+                    write_index=False,
+                    compression=compression,
+                    row_group_size=row_group_size,
+                    use_dictionary=use_dictionary,
+                )
         else:
             raise ValueError(f"Unknown output type: {output_type}")
 
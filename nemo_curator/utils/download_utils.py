@@ -14,8 +14,12 @@
 
 import os
 import requests
+import urllib3
 import json
+import threading
+import time
 import zlib
+from hashlib import md5 as md5_hash
 from urllib.parse import urljoin
 from datetime import datetime, timedelta
 from collections import OrderedDict
@@ -23,6 +27,9 @@ from typing import List, Optional
 from bs4 import BeautifulSoup
 import subprocess
 
+# Every thread keeps its own session, since sessions are not thread-safe
+_thread_local = threading.local()
+
 
 def get_main_warc_paths(
     snapshot_index,
@@ -183,4 +190,107 @@ def get_arxiv_urls():
   urls = result.stdout.split()[3::4]
   urls.sort()
   
-  return urls
\ No newline at end of file
+  return urls
+
+
+def get_http_session() -> requests.Session:
+  """
+  Returns the requests Session of the calling thread, so that all downloads
+  made by a thread reuse its HTTP keep-alive connections
+  """
+  session = getattr(_thread_local, "session", None)
+  if session is None:
+    session = requests.Session()
+    _thread_local.session = session
+  return session
+
+
+def _total_size(content_range):
+  # Content-Range headers look like "bytes 100-199/200" or "bytes */200"
+  total = content_range.rsplit("/", 1)[-1]
+  return int(total) if total.isdigit() else None
+
+
+def _download_to_part_file(session, url, part_file, timeout, chunk_size):
+  """
+  Downloads url to part_file, resuming from the end of an existing part_file.
+  Returns the full size of the file according to the server, or None if unknown.
+  """
+  offset = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+  headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+  with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+    if response.status_code == 416:
+      # Nothing is left to download after the offset
+      return _total_size(response.headers.get("Content-Range", ""))
+    response.raise_for_status()
+    if response.status_code == 206:
+      mode = "ab"
+      total_size = _total_size(response.headers.get("Content-Range", ""))
+    else:
+      # The server ignored the range, so the download starts over
+      mode = "wb"
+      content_length = response.headers.get("Content-Length")
+      total_size = int(content_length) if content_length is not None else None
+    with open(part_file, mode) as f:
+      # Write the raw bytes, since Content-Length counts bytes before any decoding
+      for chunk in response.raw.stream(chunk_size, decode_content=False):
+        f.write(chunk)
+  return total_size
+
+
+def _file_md5(path, chunk_size=1 << 20):
+  digest = md5_hash()
+  with open(path, "rb") as f:
+    for chunk in iter(lambda: f.read(chunk_size), b""):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+def download_file(url, output_file, md5=None, max_retries=5, backoff=1.0, timeout=60, chunk_size=1 << 20, session=None) -> str:
+  """
+  Downloads a file over HTTP(S), reusing the keep-alive connections of the calling thread.
+  Data is written to "<output_file>.part", and a partial download left behind by
+  a failed attempt or an earlier run is resumed with an HTTP Range request.
+  The file is only moved to output_file once its size matches the size reported
+  by the server and, if given, its md5 checksum matches.
+
+  Args:
+    url: The url of the file.
+    output_file: The path to write the file to.
+    md5: The expected md5 hex digest of the file.
+    max_retries: The number of times a failed download is retried.
+    backoff: Retry number i waits backoff * 2**i seconds before starting.
+    timeout: The timeout in seconds of connecting to and reading from the server.
+    chunk_size: The number of bytes written to disk at a time.
+    session: The requests Session to download with. Defaults to the session of the calling thread.
+
+  Returns:
+    The path to the downloaded file.
+  """
+  session = session or get_http_session()
+  part_file = output_file + ".part"
+  for attempt in range(max_retries + 1):
+    if attempt > 0:
+      time.sleep(backoff * 2**(attempt - 1))
+    try:
+      total_size = _download_to_part_file(session, url, part_file, timeout, chunk_size)
+    except (requests.RequestException, urllib3.exceptions.HTTPError) as e:
+      # Any data received so far is kept and resumed by the next attempt
+      error = e
+      continue
+
+    size = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+    if total_size is not None and size != total_size:
+      error = f"expected {total_size} bytes, got {size}"
+      if size > total_size:
+        os.remove(part_file)
+      continue
+    if md5 is not None and _file_md5(part_file) != md5:
+      error = "md5 checksum mismatch"
+      os.remove(part_file)
+      continue
+
+    os.replace(part_file, output_file)
+    return output_file
+
+  raise RuntimeError(f"Failed to download {url} after {max_retries + 1} attempts: {error}")
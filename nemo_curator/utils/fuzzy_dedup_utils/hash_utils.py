@@ -0,0 +1,131 @@
+# Copyright (c) 2024, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 64 bit FNV-1a prime used to fold characters of a shingle together
+_FNV_PRIME = np.uint64(0x100000001B3)
+_FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+
+
+def fmix64(x: np.ndarray) -> np.ndarray:
+    """
+    MurmurHash3 64 bit finalizer. Mixes every bit of the input
+    into every bit of the output. Operates on (and wraps around) uint64 arrays.
+    """
+    x = x ^ (x >> np.uint64(33))
+    x = x * np.uint64(0xFF51AFD7ED558CCD)
+    x = x ^ (x >> np.uint64(33))
+    x = x * np.uint64(0xC4CEB93FE1A85EC5)
+    x = x ^ (x >> np.uint64(33))
+    return x
+
+
+def shingle_hashes(ser: pd.Series, char_ngram: int):
+    """
+    Hashes every character n-gram of every document in a pandas Series.
+    Documents shorter than `char_ngram` are hashed as a single shingle.
+
+    Returns a tuple of
+      - uint64 array of shingle hashes for the whole Series
+      - int64 array with the index of the document each shingle belongs to
+    """
+    lengths = ser.str.len().to_numpy(dtype=np.int64)
+    padded = ser.where(lengths >= char_ngram, ser.str.pad(char_ngram, side="right", fillchar="\0"))
+    lengths = np.maximum(lengths, char_ngram)
+
+    codepoints = np.frombuffer(
+        "".join(padded.tolist()).encode("utf-32-le", errors="surrogatepass"),
+        dtype=np.uint32,
+    ).astype(np.uint64)
+
+    # Fold the characters of every window in the concatenated text into one hash.
+    # Windows that straddle two documents are computed but never selected.
+    windows = sliding_window_view(codepoints, char_ngram)
+    hashes = np.full(len(windows), _FNV_OFFSET, dtype=np.uint64)
+    for i in range(char_ngram):
+        hashes = (hashes ^ windows[:, i]) * _FNV_PRIME
+
+    num_shingles = lengths - char_ngram + 1
+    doc_offsets = np.cumsum(lengths) - lengths
+    shingle_offsets = np.cumsum(num_shingles) - num_shingles
+    doc_idx = np.repeat(np.arange(len(lengths)), num_shingles)
+    positions = np.arange(num_shingles.sum()) + (doc_offsets - shingle_offsets)[doc_idx]
+    return fmix64(hashes[positions]), doc_idx
+
+
+def minhash_pandas(
+    ser: pd.Series,
+    seeds: np.ndarray,
+    char_ngram: int,
+    use_64bit_hash: bool = False,
+    batch_size: int = 1 << 24,
+) -> pd.Series:
+    """
+    Computes minhash signatures for a pandas Series of strings on the CPU.
+    Shingles of the partition are hashed all at once and permuted for every seed
+    as a 2D (shingles x seeds) array, processed `batch_size` elements at a time,
+    before taking the per document minimum for each seed.
+
+    Signatures are not bit-identical to the cuDF implementation,
+    but approximate Jaccard similarity equally well.
+    """
+    if len(ser) == 0:
+        return pd.Series([], index=ser.index, dtype=object, name=ser.name)
+
+    # One multiply-add permutation of the (already mixed) shingle hashes per seed
+    multipliers = fmix64(np.asarray(seeds, dtype=np.uint64) + _FNV_OFFSET) | np.uint64(1)
+    increments = fmix64(multipliers)
+    hashes, doc_idx = shingle_hashes(ser, char_ngram)
+
+    signatures = np.full(
+        (len(ser), len(multipliers)), np.iinfo(np.uint64).max, dtype=np.uint64
+    )
+    step = max(1, batch_size // len(multipliers))
+    for start in range(0, len(hashes), step):
+        batch_docs = doc_idx[start : start + step]
+        permuted = hashes[start : start + step, None] * multipliers[None, :]
+        permuted += increments[None, :]
+        if not use_64bit_hash:
+            permuted >>= np.uint64(32)
+        doc_starts = np.flatnonzero(np.diff(batch_docs, prepend=-1))
+        docs = batch_docs[doc_starts]
+        signatures[docs] = np.minimum(
+            signatures[docs], np.minimum.reduceat(permuted, doc_starts, axis=0)
+        )
+
+    if not use_64bit_hash:
+        signatures = signatures.astype(np.uint32)
+    return pd.Series(list(signatures), index=ser.index, name=ser.name)
+
+
+def lsh_bucket_ids(signatures: np.ndarray, bucket_ranges) -> np.ndarray:
+    """
+    Hashes every band of a (documents x minhash_length) signature matrix
+    directly into a uint64 bucket id. The band index is folded into the hash,
+    so identical bands at different positions land in different buckets.
+
+    Returns a (documents x bands) uint64 array.
+    """
+    signatures = signatures.astype(np.uint64, copy=False)
+    bucket_ids = np.empty((len(signatures), len(bucket_ranges)), dtype=np.uint64)
+    band_seeds = fmix64(np.arange(len(bucket_ranges), dtype=np.uint64) + _FNV_OFFSET)
+    for i, band in enumerate(bucket_ranges):
+        hashes = np.full(len(signatures), band_seeds[i])
+        for col in band:
+            hashes = fmix64(hashes ^ signatures[:, col])
+        bucket_ids[:, i] = hashes
+    return bucket_ids
@@ -0,0 +1,272 @@
+# Copyright (c) 2024, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import functools
+import inspect
+import os
+import pickle
+import threading
+import uuid
+from hashlib import md5
+
+import pandas as pd
+from dask.typing import no_default
+
+from nemo_curator.utils.distributed_utils import NoWorkerError, load_object_on_worker
+from nemo_curator.utils.file_utils import expand_outdir_and_mkdir
+
+# Types whose repr is stable across runs and can be part of a cache key
+_SIMPLE_TYPES = (str, int, float, bool, type(None))
+
+
+def _referenced_names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _referenced_names(const)
+    return names
+
+
+def _keep_only_attributes(filter_obj):
+    """
+    Returns the attributes of a DocumentFilter that are only read by keep_document,
+    i.e. the thresholds that can change without invalidating cached scores.
+    """
+    cls = type(filter_obj)
+    keep_names = _referenced_names(inspect.unwrap(cls.keep_document).__code__)
+    other_names = set()
+    for klass in cls.__mro__:
+        for attr, value in vars(klass).items():
+            if attr in ("__init__", "keep_document"):
+                continue
+            if isinstance(value, (staticmethod, classmethod)):
+                value = value.__func__
+            if isinstance(value, property):
+                value = value.fget
+            if inspect.isfunction(value):
+                other_names |= _referenced_names(inspect.unwrap(value).__code__)
+    return keep_names - other_names
+
+
+def _stable_repr(value, strict=False, seen=frozenset()):
+  """
+  Returns a representation of value that is stable across runs.
+  Objects without one, such as models or tokenizers, are only identified
+  by their type, unless strict is set, in which case a ValueError is raised.
+  """
+  if isinstance(value, _SIMPLE_TYPES):
+    return repr(value)
+  if isinstance(value, (list, tuple, set, frozenset)):
+    items = [_stable_repr(item, strict, seen) for item in value]
+    if isinstance(value, (set, frozenset)):
+      items = sorted(items)
+    return f"{type(value).__name__}({', '.join(items)})"
+  if isinstance(value, dict):
+    items = sorted(f"{_stable_repr(k, strict, seen)}: {_stable_repr(v, strict, seen)}" for k, v in value.items())
+    return f"dict({', '.join(items)})"
+  if isinstance(value, type):
+    return f"{value.__module__}.{value.__qualname__}"
+  if inspect.ismodule(value):
+    return value.__name__
+  if isinstance(value, functools.partial) or inspect.isroutine(value):
+    return f"callable({', '.join(_callable_parts(value, seen))})"
+  if strict:
+    raise ValueError(f"Cannot build a cache key from a {type(value).__qualname__} object")
+  return type(value).__qualname__
+
+
+def _code_repr(code):
+  # The constants hold the literals of the function, which the bytecode only indexes
+  consts = [_code_repr(const) if inspect.iscode(const) else _stable_repr(const) for const in code.co_consts]
+  return f"{code.co_code.hex()}:{','.join(code.co_names)}:{','.join(consts)}"
+
+
+def _callable_parts(score_fn, seen=frozenset()):
+  if id(score_fn) in seen:
+    # A recursive closure refers to itself
+    return ["recursive"]
+  seen = seen | {id(score_fn)}
+
+  if isinstance(score_fn, functools.partial):
+    return [
+        "partial",
+        *_callable_parts(score_fn.func, seen),
+        f"args={_stable_repr(score_fn.args, True, seen)}",
+        f"keywords={_stable_repr(score_fn.keywords, True, seen)}",
+    ]
+  if not inspect.isroutine(score_fn):
+    raise ValueError(f"Cannot build a cache key from a {type(score_fn).__qualname__} object, use a function or method instead")
+
+  parts = [f"{getattr(score_fn, '__module__', None)}.{score_fn.__qualname__}"]
+  func = inspect.unwrap(getattr(score_fn, "__func__", score_fn))
+  if inspect.isfunction(func):
+    # Editing the scoring code, or calling it with other captured values, invalidates its cache
+    parts.append(_code_repr(func.__code__))
+    parts.append(f"defaults={_stable_repr(func.__defaults__, True, seen)}")
+    parts.append(f"kwdefaults={_stable_repr(func.__kwdefaults__, True, seen)}")
+    for name, cell in zip(func.__code__.co_freevars, func.__closure__ or ()):
+      try:
+        contents = cell.cell_contents
+      except ValueError:
+        # The variable is not assigned yet
+        contents = None
+      parts.append(f"{name}={_stable_repr(contents, True, seen)}")
+
+  owner = getattr(score_fn, "__self__", None)
+  if inspect.isbuiltin(score_fn) and not (owner is None or inspect.ismodule(owner)):
+    # e.g. the bound methods of a builtin object such as a str
+    parts.append(f"self={_stable_repr(owner, True, seen)}")
+  elif inspect.ismethod(score_fn) and not isinstance(owner, type):
+    thresholds = _keep_only_attributes(owner) if hasattr(type(owner), "keep_document") else set()
+    for attr, value in sorted(vars(owner).items()):
+      # The DocumentFilter slots only hold the document currently being scored
+      if attr in thresholds or attr in ("_sentences", "_paragraphs", "_ngrams"):
+        continue
+      parts.append(f"{attr}={_stable_repr(value, False, seen)}")
+  return parts
+
+
+def score_fingerprint(score_fn):
+  """
+  Builds a cache key for a scoring function from its name, its code, and the values
+  it captures in closures, default arguments or functools.partial arguments.
+  For the score_document method of a DocumentFilter the key also covers every parameter
+  of the filter except those only used by keep_document, so changing a threshold
+  keeps the same key. Raises a ValueError for functions whose captured values
+  have no stable representation, since they cannot be cached safely.
+  """
+  return md5("\n".join(_callable_parts(score_fn)).encode()).hexdigest()
+
+
+class _CacheState:
+  """
+  The scores of a cache directory loaded by a process, and the files they were read from
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.files = set()
+    self.scores = {}
+
+
+# Cache states of the process when scoring outside of a Dask worker
+_local_states = {}
+_local_states_lock = threading.Lock()
+
+
+class ScoreCache:
+  def __init__(self, cache_dir, score_fn, batched=False, name=None):
+    """
+    Parquet cache mapping the md5 hash of a document to its score.
+    Every partition that computes new scores writes them to a new Parquet file
+    under a directory keyed by the scoring function and its parameters.
+    Each process keeps the scores it has read, and only reads the files
+    that appeared since, so reruns on a long-lived cluster see the scores
+    written by the previous runs. The files are compacted into one before each run.
+
+    Args:
+      cache_dir: The directory holding the caches of all scoring functions.
+      score_fn: The function computing the score of a document (or a pandas Series if batched).
+      batched: Whether score_fn scores a pandas Series of documents at once.
+      name: A readable name prefixed to the cache directory.
+    """
+    self.score_fn = score_fn
+    self.batched = batched
+    name = name or getattr(score_fn, "__name__", "score")
+    self.path = os.path.join(cache_dir, f"{name}-{score_fingerprint(score_fn)}")
+
+  def __call__(self, texts, meta=no_default):
+    self.compact()
+    if meta is no_default:
+      # Infer the output type here, since Dask would run (and cache) the sample itself
+      sample = texts._meta_nonempty
+      sample_scores = self.score_fn(sample) if self.batched else sample.apply(self.score_fn)
+      meta = sample_scores.iloc[:0]
+    return texts.map_partitions(self.score_partition, meta=meta)
+
+  def score_partition(self, texts):
+    hashes = [md5(text.encode("utf-8")).hexdigest() for text in texts]
+    cached = self._load()
+    missing = [i for i, doc_hash in enumerate(hashes) if doc_hash not in cached]
+
+    scores = [cached.get(doc_hash) for doc_hash in hashes]
+    if missing:
+      missing_texts = texts.iloc[missing]
+      if self.batched:
+        new_scores = self.score_fn(missing_texts)
+      else:
+        new_scores = missing_texts.apply(self.score_fn)
+      new_scores = list(new_scores)
+      for i, score in zip(missing, new_scores):
+        scores[i] = score
+      self._write([hashes[i] for i in missing], new_scores)
+
+    return pd.Series(scores, index=texts.index, dtype=None if scores else object)
+
+  def compact(self):
+    """
+    Merges the Parquet files of the cache into a single file.
+    It must not run while partitions are being scored with this cache.
+    """
+    files = self._list_files()
+    if len(files) <= 1:
+      return
+    df = pd.concat([pd.read_parquet(os.path.join(self.path, f)) for f in files], ignore_index=True)
+    df = df.drop_duplicates("doc_hash", ignore_index=True)
+    self._write_file(df)
+    for f in files:
+      os.remove(os.path.join(self.path, f))
+
+  def _state(self):
+    try:
+      return load_object_on_worker(f"score_cache_{self.path}", _CacheState, {})
+    except NoWorkerError:
+      with _local_states_lock:
+        return _local_states.setdefault(self.path, _CacheState())
+
+  def _load(self):
+    state = self._state()
+    with state.lock:
+      for f in sorted(set(self._list_files()) - state.files):
+        try:
+          df = pd.read_parquet(os.path.join(self.path, f))
+        except FileNotFoundError:
+          # Compacted away since it was listed, its scores are in the compacted file
+          continue
+        state.scores.update(zip(df["doc_hash"], map(pickle.loads, df["score"])))
+        state.files.add(f)
+    return state.scores
+
+  def _list_files(self):
+    if not os.path.isdir(self.path):
+      return []
+    return [f for f in os.listdir(self.path) if f.endswith(".parquet")]
+
+  def _write(self, hashes, scores):
+    df = pd.DataFrame({"doc_hash": hashes, "score": [pickle.dumps(score) for score in scores]})
+    output_file = self._write_file(df)
+    # The process already holds these scores, so it does not read its own file back
+    state = self._state()
+    with state.lock:
+      state.scores.update(zip(hashes, scores))
+      state.files.add(output_file)
+
+  def _write_file(self, df):
+    expand_outdir_and_mkdir(self.path)
+    # Write under a temporary name so readers never see a partial file
+    output_file = f"{uuid.uuid4().hex}.parquet"
+    output_path = os.path.join(self.path, output_file)
+    df.to_parquet(output_path + ".tmp", index=False)
+    os.replace(output_path + ".tmp", output_path)
+    return output_file
@@ -16,7 +16,7 @@ import os
 import ast
 import warnings
 import tokenize
-from itertools import groupby
+from itertools import accumulate, groupby
 from io import StringIO
 import string
 
@@ -167,21 +167,15 @@ def remove_punctuation(str_in):
 
 
 def get_words(text):
-  word_start_char_positions = []
-  prev = 0
-  words = []
-
   text = text.lower()
   text = remove_punctuation(text)
-  if len(text) > 0:
-    for i in range(len(text)):
-      if text[i] != ' ':
-        if i == 0 or text[i - 1] == ' ':
-          word_start_char_positions.append(i)
-          if i != 0:
-            words.append(text[prev:i].strip())
-          prev = i
-    words.append(text[prev:i + 1].strip())
-    if words[0] == '':
-      words = words[1:]
+  # Words are the non-empty pieces between single spaces,
+  # each piece starts one character after the end of the previous one
+  pieces = text.split(' ')
+  offsets = [0] + list(accumulate(map(len, pieces)))
+  word_start_char_positions = [offsets[i] + i for i, piece in enumerate(pieces) if piece]
+  words = [piece.strip() for piece in pieces if piece]
+  # A piece of only other whitespace at the very start does not count as a word
+  if len(words) > 0 and text[0] != ' ' and words[0] == '':
+    words = words[1:]
   return words, word_start_char_positions
@@ -18,6 +18,7 @@ import pytest
 
 import nemo_curator
 from nemo_curator.datasets import DocumentDataset
+from nemo_curator.utils.distributed_utils import get_partition_lengths, read_data
 
 def list_to_dataset(documents, col_name="text", npartitions=2):
     data = {col_name: documents}
@@ -70,4 +71,50 @@ class TestPrepareTaskData:
         actual_ids = id_dataset.df[id_field].compute()
         expected_ids = pd.Series(["doc_id-0000000013", "doc_id-0000000014", "doc_id-0000000015", "doc_id-0000000016", "doc_id-0000000017"])
 
-        assert all(expected_ids == actual_ids), f"Expected: {expected_ids}, got: {actual_ids}"
\ No newline at end of file
+        assert all(expected_ids == actual_ids), f"Expected: {expected_ids}, got: {actual_ids}"
+    def test_integer_ids(self, two_partition_dataset):
+        add_id = nemo_curator.AddId("doc_id", start_index=13, dataset_id=7)
+        id_dataset = add_id(two_partition_dataset)
+        assert id_dataset.df["dataset_id"].dtype == "uint32"
+        assert id_dataset.df["doc_id"].dtype == "int64"
+        actual_df = id_dataset.df.compute()
+        assert actual_df["dataset_id"].dtype == "uint32"
+        assert actual_df["doc_id"].dtype == "int64"
+        assert list(actual_df["dataset_id"]) == [7] * 5
+        assert list(actual_df["doc_id"]) == [13, 14, 15, 16, 17]
+
+    def test_partition_lengths(self, two_partition_dataset):
+        add_id = nemo_curator.AddId("id", partition_lengths=[3, 2])
+        id_dataset = add_id(two_partition_dataset)
+        actual_ids = id_dataset.df["id"].compute()
+        expected_ids = pd.Series(["doc_id-0000000000", "doc_id-0000000001", "doc_id-0000000002", "doc_id-0000000003", "doc_id-0000000004"])
+
+        assert all(expected_ids == actual_ids), f"Expected: {expected_ids}, got: {actual_ids}"
+
+    def test_wrong_partition_lengths(self, two_partition_dataset):
+        with pytest.raises(ValueError):
+            nemo_curator.AddId("id", partition_lengths=[5])(two_partition_dataset)
+
+        with pytest.raises(ValueError):
+            nemo_curator.AddId("id", partition_lengths=[2, 3])(two_partition_dataset).df.compute()
+
+    @pytest.mark.parametrize("file_type", ["jsonl", "parquet"])
+    def test_get_partition_lengths(self, tmpdir, file_type):
+        files = []
+        for i, num_docs in enumerate([3, 0, 4]):
+            df = pd.DataFrame({"text": [f"doc {j}" for j in range(num_docs)]})
+            path = str(tmpdir / f"{i}.{file_type}")
+            if file_type == "jsonl":
+                df.to_json(path, orient="records", lines=True)
+            else:
+                df.to_parquet(path)
+            files.append(path)
+
+        cache_file = str(tmpdir / "row_counts.json")
+        assert get_partition_lengths(files, file_type=file_type, cache_file=cache_file) == [3, 0, 4]
+        assert get_partition_lengths(files, file_type=file_type, files_per_partition=2, cache_file=cache_file) == [3, 4]
+
+        dataset = DocumentDataset(read_data(files, file_type=file_type, backend="pandas", files_per_partition=2))
+        partition_lengths = get_partition_lengths(files, file_type=file_type, files_per_partition=2, cache_file=cache_file)
+        id_dataset = nemo_curator.AddId("id", partition_lengths=partition_lengths)(dataset)
+        assert list(id_dataset.df["id"].compute()) == [f"doc_id-{i:010d}" for i in range(7)]
@@ -0,0 +1,445 @@
+# Copyright (c) 2024, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+import torch.nn as nn
+from dask import dataframe as dd
+from torch.utils.data import Dataset
+
+import nemo_curator.modules.distributed_data_classifier as distributed_data_classifier
+import nemo_curator.utils.distributed_utils as distributed_utils
+from nemo_curator import MultipleModelQualityClassifier, QualityClassifier
+from nemo_curator.datasets import DocumentDataset
+from nemo_curator.distributed_data_classification.pytorch_utils import (
+    CFG,
+    CustomModel,
+    StreamingTestDataset,
+    TokenBudgetBatchSampler,
+    collate,
+    get_data_loader,
+    init_empty_weights,
+    load_mmap_state_dict,
+    prefetch,
+    quantize_dynamic,
+    restore_order,
+)
+
+
+class PaddedDataset(Dataset):
+    """
+    Holds token ids padded to a fixed length, like TestDataset.
+    """
+
+    def __init__(self, lengths, max_len=16):
+        self.lengths = torch.tensor(lengths)
+        positions = torch.arange(max_len)
+        self.tokens = {
+            "input_ids": torch.stack(
+                [torch.where(positions < n, i + 1, 0) for i, n in enumerate(lengths)]
+            ),
+            "attention_mask": (positions < self.lengths[:, None]).to(torch.int64),
+        }
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, item):
+        return {k: v[item] for k, v in self.tokens.items()}
+
+
+class WhitespaceTokenizer:
+    """
+    Maps every word to its length, between a start and an end token.
+    """
+
+    pad_token_id = 0
+
+    def __init__(self):
+        self.num_texts = 0
+
+    def batch_encode_plus(self, texts, max_length, truncation, **kwargs):
+        self.num_texts += len(texts)
+        input_ids = []
+        for text in texts:
+            ids = [1] + [len(word) + 2 for word in text.split()] + [2]
+            input_ids.append(ids[:max_length] if truncation else ids)
+        if not kwargs.get("pad_to_max_length"):
+            return {"input_ids": input_ids}
+
+        # Padded tensors, as TestDataset asks for
+        input_ids = torch.tensor(
+            [ids + [self.pad_token_id] * (max_length - len(ids)) for ids in input_ids]
+        )
+        return {
+            "input_ids": input_ids,
+            "attention_mask": (input_ids != self.pad_token_id).to(torch.int64),
+        }
+
+
+class TinyModel(nn.Module):
+    """
+    Classifies the mean embedding of the tokens of a document, so that
+    its outputs do not depend on how the batch was padded.
+    """
+
+    def __init__(self, out_dim, vocab_size=16, hidden_size=8):
+        super().__init__()
+        self.embedding = nn.Embedding(vocab_size, hidden_size)
+        self.fc = nn.Linear(hidden_size, out_dim)
+
+    def forward(self, batch):
+        mask = batch["attention_mask"].unsqueeze(-1)
+        embeddings = (self.embedding(batch["input_ids"]) * mask).sum(1) / mask.sum(1)
+        return self.fc(embeddings).unsqueeze(1)
+
+
+@pytest.fixture
+def cfg():
+    cfg = CFG(max_len=6)
+    cfg.tokenizer = WhitespaceTokenizer()
+    return cfg
+
+
+@pytest.fixture
+def stub_models(monkeypatch, cfg, tmp_path):
+    """
+    Saves two tiny checkpoints, and runs the classifiers on them
+    with the stub tokenizer and without a Dask worker.
+    """
+
+    def load_object(attr, load_object_function, load_object_kwargs):
+        return load_object_function(**load_object_kwargs)
+
+    monkeypatch.setattr(distributed_data_classifier, "load_object_on_worker", load_object)
+    monkeypatch.setattr(distributed_utils, "load_object_on_worker", load_object)
+    monkeypatch.setattr(
+        distributed_data_classifier,
+        "CustomModel",
+        lambda cfg, out_dim, config_path, pretrained: TinyModel(out_dim),
+    )
+    monkeypatch.setattr(QualityClassifier, "_load_cfg_with_tokenizer", lambda self: cfg)
+
+    model_files = []
+    for seed in range(2):
+        torch.manual_seed(seed)
+        model_file = str(tmp_path / f"model_{seed}.pth")
+        torch.save({"model_state_dict": TinyModel(out_dim=3).state_dict()}, model_file)
+        model_files.append(model_file)
+    return model_files
+
+
+def classify(classifier, texts, npartitions=2):
+    dataset = DocumentDataset(dd.from_pandas(texts, npartitions=npartitions))
+    return classifier(dataset).df.compute(scheduler="threads")
+
+
+@pytest.fixture
+def texts():
+    return pd.DataFrame(
+        {
+            "text": [
+                "a bb",
+                "a bb ccc dddd eeeee ffffff",
+                "a",
+                "a bb",
+                "a bb ccc",
+            ]
+        }
+    )
+
+
+class TestTokenBudgetBatching:
+    def test_batches(self):
+        lengths = [3, 10, 4, 10, 1, 8, 3]
+        sampler = TokenBudgetBatchSampler(lengths, max_tokens=20)
+        batches = list(sampler)
+
+        assert sorted(i for batch in batches for i in batch) == list(range(7))
+        for batch in batches:
+            assert [lengths[i] for i in batch] == sorted(
+                (lengths[i] for i in batch), reverse=True
+            )
+            assert len(batch) == 1 or len(batch) * lengths[batch[0]] <= 20
+        assert batches == [[1, 3], [5, 2], [0, 6, 4]]
+
+    def test_long_sequence_gets_own_batch(self):
+        sampler = TokenBudgetBatchSampler([50, 2, 2], max_tokens=8)
+        assert list(sampler) == [[0], [1, 2]]
+
+    def test_restore_order(self):
+        dataset = PaddedDataset([3, 10, 4, 10, 1, 8, 3])
+        loader = get_data_loader(
+            dataset, batch_size=2, num_workers=0, max_tokens_per_batch=20
+        )
+        outputs = torch.cat([batch["input_ids"][:, 0] for batch in loader])
+
+        assert not torch.equal(outputs, torch.arange(1, 8))
+        assert torch.equal(restore_order(outputs, loader), torch.arange(1, 8))
+
+    def test_fixed_batch_size(self):
+        dataset = PaddedDataset([3, 10, 4, 10, 1, 8, 3])
+        loader = get_data_loader(dataset, batch_size=2, num_workers=0)
+        outputs = torch.cat([batch["input_ids"][:, 0] for batch in loader])
+
+        assert len(loader) == 4
+        assert torch.equal(restore_order(outputs, loader), torch.arange(1, 8))
+
+
+class TestCPUInference:
+    def test_collate(self):
+        batch = PaddedDataset([3, 5, 2])[[0, 1, 2]]
+        batch = collate(batch, device="cpu")
+
+        assert batch["input_ids"].device.type == "cpu"
+        assert batch["input_ids"].shape == (3, 5)
+
+    def test_quantize_dynamic(self):
+        model = nn.Sequential(nn.Linear(8, 16), nn.ReLU(), nn.Linear(16, 2)).eval()
+        quantized = quantize_dynamic(model)
+        inputs = torch.randn(4, 8)
+
+        assert not any(type(m) is nn.Linear for m in quantized.modules())
+        assert torch.allclose(quantized(inputs), model(inputs), atol=0.05)
+
+    def test_quantize_requires_cpu(self):
+        with pytest.raises(ValueError):
+            QualityClassifier("model.pth", ["High", "Low"], quantize=True)
+
+        classifier = QualityClassifier(
+            "model.pth", ["High", "Low"], device_type="cpu", quantize=True
+        )
+        assert classifier.quantize
+
+    @pytest.mark.parametrize("stream_tokenization", [False, True])
+    def test_quality_classifier(self, stub_models, cfg, texts, stream_tokenization):
+        labels = ["High", "Medium", "Low"]
+        classifier = QualityClassifier(
+            stub_models[0],
+            labels,
+            batch_size=2,
+            device_type="cpu",
+            autocast=False,
+            stream_tokenization=stream_tokenization,
+        )
+        result_df = classify(classifier, texts)
+
+        model = TinyModel(out_dim=3)
+        model.load_state_dict(torch.load(stub_models[0])["model_state_dict"])
+        tokens = cfg.tokenizer.batch_encode_plus(
+            texts["text"].tolist(),
+            max_length=cfg.max_len,
+            truncation=True,
+            pad_to_max_length=True,
+        )
+        with torch.no_grad():
+            expected_probs = torch.softmax(model(tokens)[:, 0, :], dim=1)
+
+        assert np.allclose(result_df["quality_prob"].tolist(), expected_probs.numpy())
+        assert result_df["quality_pred"].tolist() == [
+            labels[i] for i in expected_probs.argmax(1).tolist()
+        ]
+
+
+class TestStreamingTestDataset:
+    def test_batches(self, cfg, texts):
+        dataset = StreamingTestDataset(cfg, texts, max_chars=100)
+        batch = dataset[[0, 2, 1]]
+
+        assert len(dataset) == 5
+        assert batch["input_ids"].tolist() == [
+            [1, 3, 4, 2, 0, 0],
+            [1, 3, 2, 0, 0, 0],
+            [1, 3, 4, 5, 6, 7],
+        ]
+        assert batch["attention_mask"].sum(axis=1).tolist() == [4, 3, 6]
+
+    def test_max_chars(self, cfg, texts):
+        dataset = StreamingTestDataset(cfg, texts, max_chars=3)
+        assert dataset[[1]]["input_ids"].tolist() == [[1, 3, 3, 2]]
+
+    def test_cache(self, cfg, texts):
+        dataset = StreamingTestDataset(cfg, texts, max_chars=100, cache_size=2)
+        dataset[[0, 1, 3]]
+        # The duplicated document is tokenized once
+        assert cfg.tokenizer.num_texts == 2
+        dataset[[3, 0]]
+        assert cfg.tokenizer.num_texts == 2
+        dataset[[2, 4]]
+        assert cfg.tokenizer.num_texts == 4
+        assert len(dataset.cache) == 2
+
+    def test_lengths(self, cfg, texts):
+        dataset = StreamingTestDataset(cfg, texts, max_chars=100, cache_size=2)
+        assert dataset.lengths.tolist() == [4, 6, 3, 4, 5]
+
+    @pytest.mark.parametrize("max_tokens_per_batch,num_batches", [(None, 3), (12, 2)])
+    def test_data_loader(self, cfg, texts, max_tokens_per_batch, num_batches):
+        dataset = StreamingTestDataset(cfg, texts, max_chars=100)
+        loader = get_data_loader(
+            dataset,
+            batch_size=2,
+            num_workers=0,
+            max_tokens_per_batch=max_tokens_per_batch,
+        )
+        outputs = torch.cat(
+            [batch["attention_mask"].sum(axis=1) for batch in prefetch(loader)]
+        )
+
+        assert len(loader) == num_batches
+        assert restore_order(outputs, loader).tolist() == [4, 6, 3, 4, 5]
+
+
+class TestMultipleModelQualityClassifier:
+    def test_columns(self):
+        classifier = MultipleModelQualityClassifier(
+            ["models/a.pth", "models/b.pth"], ["High", "Medium", "Low"]
+        )
+        assert classifier.model_names == ["a.pth", "b.pth"]
+        assert classifier._columns("a.pth") == ("quality_pred_a.pth", "quality_prob_a.pth")
+
+    @pytest.mark.parametrize("max_tokens_per_batch", [None, 12])
+    def test_matches_single_models(self, stub_models, texts, max_tokens_per_batch):
+        kwargs = dict(
+            labels=["High", "Medium", "Low"],
+            batch_size=2,
+            device_type="cpu",
+            autocast=False,
+            max_tokens_per_batch=max_tokens_per_batch,
+        )
+        ensemble = MultipleModelQualityClassifier(stub_models, **kwargs)
+        result_df = ensemble._inference_per_partition(texts.copy())
+
+        for model_file, model_name in zip(stub_models, ensemble.model_names):
+            classifier = QualityClassifier(model_file, **kwargs)
+            expected_df = classifier._inference_per_partition(texts.copy())
+            pred_column, prob_column = ensemble._columns(model_name)
+
+            assert result_df[pred_column].tolist() == expected_df["quality_pred"].tolist()
+            assert np.allclose(
+                result_df[prob_column].tolist(), expected_df["quality_prob"].tolist()
+            )
+        # The models do not agree, so each column comes from its own model
+        assert not np.allclose(
+            result_df[f"quality_prob_{ensemble.model_names[0]}"].tolist(),
+            result_df[f"quality_prob_{ensemble.model_names[1]}"].tolist(),
+        )
+
+    def test_duplicate_model_names(self):
+        with pytest.raises(ValueError):
+            MultipleModelQualityClassifier(
+                ["run1/model.pth", "run2/model.pth"], ["High", "Medium", "Low"]
+            )
+
+
+class TestMmapStateDict:
+    def test_load(self, tmp_path):
+        model = nn.Sequential(nn.Linear(8, 16), nn.ReLU(), nn.Linear(16, 2))
+        model_file = str(tmp_path / "model.pth")
+        torch.save({"model_state_dict": model.state_dict()}, model_file)
+
+        calls = []
+
+        def read_state_dict(model_file_name):
+            calls.append(model_file_name)
+            return torch.load(model_file_name)["model_state_dict"]
+
+        mmap_dir = str(tmp_path / "mmap")
+        for _ in range(2):
+            sd = load_mmap_state_dict(model_file, read_state_dict, mmap_dir)
+        assert len(calls) == 1
+        assert len(os.listdir(mmap_dir)) == 1
+
+        loaded = nn.Sequential(nn.Linear(8, 16), nn.ReLU(), nn.Linear(16, 2))
+        loaded.load_state_dict(sd, strict=True, assign=True)
+        inputs = torch.randn(4, 8)
+        assert torch.equal(loaded(inputs), model(inputs))
+
+    def test_newer_checkpoint(self, tmp_path):
+        model_file = str(tmp_path / "model.pth")
+        mmap_dir = str(tmp_path / "mmap")
+        torch.save({"weight": torch.zeros(3)}, model_file)
+        load_mmap_state_dict(model_file, torch.load, mmap_dir)
+
+        torch.save({"weight": torch.ones(3)}, model_file)
+        mmap_file = os.path.join(mmap_dir, os.listdir(mmap_dir)[0])
+        os.utime(model_file, (0, os.path.getmtime(mmap_file) + 1))
+
+        sd = load_mmap_state_dict(model_file, torch.load, mmap_dir)
+        assert sd["weight"].tolist() == [1, 1, 1]
+
+    def test_init_empty_weights(self):
+        class PositionModel(nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.linear = nn.Linear(4, 2)
+                self.register_buffer("positions", torch.arange(4.0), persistent=False)
+
+            def forward(self, inputs):
+                return self.linear(inputs + self.positions)
+
+        model = PositionModel()
+        with init_empty_weights():
+            empty_model = PositionModel()
+        assert all(p.is_meta for p in empty_model.parameters())
+        assert not empty_model.positions.is_meta
+
+        empty_model.load_state_dict(model.state_dict(), strict=True, assign=True)
+        inputs = torch.randn(3, 4)
+        assert torch.equal(empty_model(inputs), model(inputs))
+
+    def test_build_model_without_pretrained_weights(self, tmp_path, monkeypatch):
+        from transformers import AutoModel, DebertaV2Config, DebertaV2Model
+
+        torch.manual_seed(0)
+        model_dir = str(tmp_path / "deberta")
+        config = DebertaV2Config(
+            vocab_size=64,
+            hidden_size=16,
+            num_hidden_layers=1,
+            num_attention_heads=2,
+            intermediate_size=32,
+        )
+        DebertaV2Model(config).save_pretrained(model_dir)
+        cfg = CFG()
+        cfg.model = model_dir
+        model_file = str(tmp_path / "model.pth")
+        torch.save(CustomModel(cfg, out_dim=3).state_dict(), model_file)
+
+        labels = ["High", "Medium", "Low"]
+        device = torch.device("cpu")
+        model = QualityClassifier(model_file, labels, device_type="cpu")._build_model(
+            cfg, device, model_file
+        )
+
+        def from_pretrained(*args, **kwargs):
+            raise AssertionError("The pretrained weights should not be loaded")
+
+        monkeypatch.setattr(AutoModel, "from_pretrained", from_pretrained)
+        mmap_model = QualityClassifier(
+            model_file, labels, device_type="cpu", mmap_dir=str(tmp_path / "mmap")
+        )._build_model(cfg, device, model_file)
+
+        assert not any(t.is_meta for t in mmap_model.state_dict().values())
+        batch = {
+            "input_ids": torch.randint(1, 64, (2, 8)),
+            "attention_mask": torch.ones(2, 8, dtype=torch.int64),
+        }
+        with torch.no_grad():
+            assert torch.allclose(mmap_model(batch), model(batch), atol=1e-6)
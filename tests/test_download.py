@@ -0,0 +1,562 @@
+# Copyright (c) 2024, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bz2
+import gzip
+import os
+import shutil
+import tarfile
+import threading
+import xml.etree.ElementTree as ElementTree
+from hashlib import md5
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from warcio.statusandheaders import StatusAndHeaders
+from warcio.warcwriter import WARCWriter
+
+from nemo_curator.download import (
+    ArxivExtractor,
+    ArxivIterator,
+    CommonCrawlWARCDownloader,
+    CommonCrawlWARCIterator,
+    DocumentDownloader,
+    DocumentExtractor,
+    DocumentIterator,
+    WikipediaExtractor,
+    WikipediaIterator,
+    batch_download,
+    download_and_extract,
+)
+from nemo_curator.utils.download_utils import download_file
+
+
+class LocalDownloader(DocumentDownloader):
+    """Writes the url as the content of a local file instead of downloading it"""
+
+    def __init__(self, download_dir):
+        super().__init__()
+        self._download_dir = download_dir
+
+    def download(self, url):
+        output_file = os.path.join(self._download_dir, url)
+        with open(output_file, "w") as f:
+            f.write(url)
+        return output_file
+
+
+class CountingIterator(DocumentIterator):
+    """Yields num_records records for a file named "<name>-<num_records>" """
+
+    def iterate(self, file_path):
+        with open(file_path) as f:
+            name, num_records = f.read().rsplit("-", 1)
+        for i in range(int(num_records)):
+            yield {"id": f"{name}-{i}"}, f"Document {i} of {name}"
+
+
+class SkippingExtractor(DocumentExtractor):
+    """Drops every third record"""
+
+    def extract(self, content):
+        number = int(content.split()[1])
+        if number % 3 == 2:
+            return None
+        return {"length": len(content)}, content.upper()
+
+
+class CopyingDownloader(DocumentDownloader):
+    """Copies a local file to the download directory"""
+
+    def __init__(self, download_dir):
+        super().__init__()
+        self._download_dir = download_dir
+
+    def download(self, url):
+        output_file = os.path.join(self._download_dir, os.path.basename(url))
+        if not os.path.exists(output_file):
+            shutil.copy(url, output_file)
+        return output_file
+
+
+class DecodingExtractor(DocumentExtractor):
+    def extract(self, content):
+        return {}, content.decode("utf-8")
+
+
+@pytest.fixture
+def warc_file(tmpdir):
+    """A WARC file of 50 responses, each preceded by its request"""
+    warc_path = str(tmpdir / "crawl.warc.gz")
+    with open(warc_path, "wb") as f:
+        writer = WARCWriter(f, gzip=True)
+        for i in range(50):
+            url = f"http://example.com/{i}"
+            request_headers = StatusAndHeaders(
+                f"GET /{i} HTTP/1.0", [], is_http_request=True
+            )
+            writer.write_record(
+                writer.create_warc_record(
+                    url, "request", payload=BytesIO(b""), http_headers=request_headers
+                )
+            )
+            http_headers = StatusAndHeaders(
+                "200 OK", [("Content-Type", "text/html")], protocol="HTTP/1.0"
+            )
+            payload = BytesIO(f"<p>Page {i}</p>".encode() * (i + 1))
+            writer.write_record(
+                writer.create_warc_record(
+                    url, "response", payload=payload, http_headers=http_headers
+                )
+            )
+    return warc_path
+
+
+WIKIPEDIA_PAGE = """  <page>
+    <title>{title}</title>
+    <ns>{ns}</ns>
+    <id>{id}</id>{redirect}
+    <revision>
+      <id>{revision_id}</id>
+      <text bytes="{length}" xml:space="preserve">{text}</text>
+    </revision>
+  </page>
+"""
+
+
+@pytest.fixture
+def wikipedia_dump(tmpdir):
+    """
+    A multistream dump of 10 streams of 3 pages and its index of stream offsets.
+    Every fifth page is a talk page, and every seventh page a redirect.
+    """
+    dump_path = str(tmpdir / "enwiki-20240201-pages-articles-multistream1.xml-p1p30.bz2")
+    index_path = str(
+        tmpdir / "enwiki-20240201-pages-articles-multistream-index1.txt-p1p30.bz2"
+    )
+    header = '<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/">\n'
+    header += "  <siteinfo>\n    <sitename>Wikipedia</sitename>\n  </siteinfo>\n"
+    streams = [header]
+    index_lines = []
+    offset = len(bz2.compress(header.encode()))
+    for i in range(10):
+        stream = ""
+        for page_id in range(3 * i + 1, 3 * i + 4):
+            title = f"Page {page_id} &amp; more"
+            text = f"'''Page {page_id}''' &lt;ref&gt;Ünïcode&lt;/ref&gt; " * page_id
+            stream += WIKIPEDIA_PAGE.format(
+                title=title,
+                ns=1 if page_id % 5 == 0 else 0,
+                id=page_id,
+                redirect=f'\n    <redirect title="{title}" />' if page_id % 7 == 0 else "",
+                revision_id=1000 + page_id,
+                length=len(text),
+                text=text,
+            )
+            index_lines.append(f"{offset}:{page_id}:{title}\n")
+        streams.append(stream)
+        offset += len(bz2.compress(stream.encode()))
+    streams.append("</mediawiki>\n")
+
+    with open(dump_path, "wb") as f:
+        for stream in streams:
+            f.write(bz2.compress(stream.encode()))
+    with bz2.open(index_path, "wt", encoding="utf-8") as f:
+        f.writelines(index_lines)
+    return dump_path
+
+
+ARXIV_TEX = r"""\documentclass{article}
+\newcommand{\space}{\R^n}
+\newcommand{\R}{\mathbb{R}}
+\begin{document}
+Title page
+\section{Introduction}
+% A comment line
+We work in \space and \R.
+\appendix
+Proofs
+\end{document}
+"""
+
+
+def add_to_tar(tar, name, data):
+    member = tarfile.TarInfo(name)
+    member.size = len(data)
+    tar.addfile(member, BytesIO(data))
+
+
+@pytest.fixture
+def arxiv_tar(tmpdir):
+    """A bulk tar file of a gzipped tar project, a gzipped tex file and a pdf"""
+    tar_path = str(tmpdir / "arXiv_src_2301_001.tar")
+    project = BytesIO()
+    with tarfile.open(fileobj=project, mode="w:gz") as project_tar:
+        add_to_tar(project_tar, "main.tex", ARXIV_TEX.encode())
+        add_to_tar(project_tar, "figure.png", b"\x89PNG")
+    with tarfile.open(tar_path, "w") as tar:
+        add_to_tar(tar, "2301/2301.00001.gz", project.getvalue())
+        add_to_tar(tar, "2301/2301.00002.gz", gzip.compress(ARXIV_TEX.encode()))
+        add_to_tar(tar, "2301/2301.00003.pdf", b"%PDF")
+    return tar_path
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """
+    Serves the files of its server with support for range requests.
+    The server can be told to fail or to cut off a number of responses.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get("Range")))
+        if server.failures > 0:
+            server.failures -= 1
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        data = server.files[self.path]
+        start = 0
+        if self.headers.get("Range"):
+            start = int(self.headers["Range"][len("bytes=") :].rstrip("-"))
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}"
+            )
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+        if server.truncations > 0:
+            server.truncations -= 1
+            self.wfile.write(data[start : start + (len(data) - start) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(data[start:])
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def file_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FileHandler)
+    server.files = {
+        f"/crawl/file-{i}.warc.gz": os.urandom(100_000 + i) for i in range(3)
+    }
+    server.requests = []
+    server.failures = 0
+    server.truncations = 0
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+OUTPUT_FORMAT = {"text": str, "id": str, "length": int, "filename": str}
+
+
+def extract(tmpdir, output_type, records_per_chunk=None, **kwargs):
+    name = "-".join(map(str, [records_per_chunk, *kwargs.values()]))
+    download_dir = tmpdir.mkdir(f"downloads-{name}")
+    output_dir = tmpdir.mkdir(f"output-{name}")
+    urls = ["a-10", "b-0", "c-1"]
+    output_paths = [os.path.join(output_dir, f"{url}.{output_type}") for url in urls]
+    dataset = download_and_extract(
+        urls,
+        output_paths,
+        LocalDownloader(str(download_dir)),
+        CountingIterator(),
+        SkippingExtractor(),
+        OUTPUT_FORMAT,
+        output_type=output_type,
+        records_per_chunk=records_per_chunk,
+        **kwargs,
+    )
+    df = dataset.df.compute()
+    return df[sorted(df.columns)].reset_index(drop=True), output_dir
+
+
+class TestDownloadAndExtract:
+    @pytest.mark.parametrize("output_type", ["jsonl", "parquet"])
+    def test_records_per_chunk(self, tmpdir, output_type):
+        expected_df, _ = extract(tmpdir, output_type)
+        streamed_df, output_dir = extract(tmpdir, output_type, records_per_chunk=4)
+
+        assert len(expected_df) == 8
+        assert sorted(os.listdir(output_dir)) == [
+            f"a-10.{output_type}",
+            f"c-1.{output_type}",
+        ]
+        pd.testing.assert_frame_equal(
+            expected_df, streamed_df, check_dtype=False, check_like=True
+        )
+
+    def test_records_per_chunk_reads_written_files(self, tmpdir):
+        output_dir = tmpdir.mkdir("output")
+        urls = ["a-10", "b-0", "c-1"]
+        output_paths = [os.path.join(output_dir, f"{url}.jsonl") for url in urls]
+        dataset = download_and_extract(
+            urls,
+            output_paths,
+            LocalDownloader(str(tmpdir.mkdir("downloads"))),
+            CountingIterator(),
+            SkippingExtractor(),
+            OUTPUT_FORMAT,
+            records_per_chunk=4,
+        )
+
+        # The files are written before the dataset is computed,
+        assert sorted(os.listdir(output_dir)) == ["a-10.jsonl", "c-1.jsonl"]
+        assert dataset.df.npartitions == 2
+        # and the partitions read them back from disk
+        with open(os.path.join(output_dir, "c-1.jsonl"), "w") as f:
+            f.write('{"filename": "c-1.jsonl", "id": "rewritten", "length": 1, "text": "x"}\n')
+        assert dataset.df.partitions[1].compute()["id"].tolist() == ["rewritten"]
+        assert len(dataset.df.partitions[0].compute()) == 7
+
+    def test_parquet_row_groups(self, tmpdir):
+        _, output_dir = extract(tmpdir, "parquet", records_per_chunk=3)
+        metadata = pq.read_metadata(os.path.join(output_dir, "a-10.parquet"))
+        assert metadata.num_row_groups == 3
+        assert metadata.num_rows == 7
+
+    @pytest.mark.parametrize("prefetch_max_bytes", [None, 1])
+    def test_prefetch(self, tmpdir, prefetch_max_bytes):
+        expected_df, _ = extract(tmpdir, "jsonl")
+        result_df, _ = extract(
+            tmpdir,
+            "jsonl",
+            files_per_partition=2,
+            prefetch_depth=2,
+            prefetch_max_bytes=prefetch_max_bytes,
+        )
+        pd.testing.assert_frame_equal(expected_df, result_df)
+
+    def test_extract_processes(self, tmpdir):
+        expected_df, _ = extract(tmpdir, "jsonl")
+        result_df, _ = extract(
+            tmpdir, "jsonl", extract_processes=2, extract_chunksize=2
+        )
+        pd.testing.assert_frame_equal(expected_df, result_df)
+
+
+    def test_splits_per_file(self, tmpdir, warc_file):
+        def extract_warc(name, splits_per_file):
+            download_dir = tmpdir.mkdir(f"downloads-{name}")
+            output_dir = tmpdir.mkdir(f"output-{name}")
+            dataset = download_and_extract(
+                [warc_file],
+                [os.path.join(output_dir, "crawl.warc.gz.jsonl")],
+                CopyingDownloader(str(download_dir)),
+                CommonCrawlWARCIterator(),
+                DecodingExtractor(),
+                {"text": str, "url": str, "warc_id": str, "source_id": str},
+                splits_per_file=splits_per_file,
+            )
+            assert dataset.df.npartitions == splits_per_file
+            df = dataset.df.compute().reset_index(drop=True)
+            return df, download_dir, output_dir
+
+        expected_df, _, _ = extract_warc("whole", 1)
+        split_df, download_dir, output_dir = extract_warc("split", 4)
+
+        assert len(expected_df) == 50
+        assert split_df["url"].tolist() == expected_df["url"].tolist()
+        assert split_df["text"].tolist() == expected_df["text"].tolist()
+        assert sorted(os.listdir(output_dir)) == [
+            f"crawl.warc.gz-{i:05d}-of-00004.jsonl" for i in range(4)
+        ]
+        # The download is only removed once every split has been extracted
+        assert os.listdir(download_dir) == []
+
+
+class TestCommonCrawlWARCIterator:
+    def test_split(self, warc_file):
+        iterator = CommonCrawlWARCIterator()
+        byte_ranges = iterator.split(warc_file, 4)
+
+        assert len(byte_ranges) == 4
+        assert byte_ranges[0][0] == 0
+        assert byte_ranges[-1][1] == os.path.getsize(warc_file)
+        for (_, end), (start, _) in zip(byte_ranges[:-1], byte_ranges[1:]):
+            assert end == start
+
+        records = list(iterator.iterate(warc_file))
+        split_records = []
+        for byte_range in byte_ranges:
+            range_records = list(iterator.iterate(warc_file, byte_range=byte_range))
+            assert 0 < len(range_records) < len(records)
+            split_records.extend(range_records)
+        assert split_records == records
+
+
+class TestWikipediaIterator:
+    def test_iterate(self, wikipedia_dump):
+        with bz2.open(wikipedia_dump) as f:
+            root = ElementTree.parse(f).getroot()
+        namespace = root.tag[: -len("mediawiki")]
+        expected = [
+            (page.find(f"{namespace}title").text, page.find(f"{namespace}id").text)
+            for page in root.iter(f"{namespace}page")
+            if page.find(f"{namespace}ns").text == "0"
+            and page.find(f"{namespace}redirect") is None
+        ]
+
+        records = list(WikipediaIterator().iterate(wikipedia_dump))
+
+        assert [(meta["title"], meta["id"]) for meta, _ in records] == expected
+        meta, content = records[0]
+        assert meta["title"] == "Page 1 & more"
+        assert meta["url"] == "https://en.wikipedia.org/wiki/Page%201%20%26%20more"
+        assert content == "'''Page 1''' <ref>Ünïcode</ref> "
+
+    def test_split(self, wikipedia_dump):
+        iterator = WikipediaIterator()
+        byte_ranges = iterator.split(wikipedia_dump, 3)
+
+        assert len(byte_ranges) == 3
+        assert byte_ranges[-1][1] == os.path.getsize(wikipedia_dump)
+        records = list(iterator.iterate(wikipedia_dump))
+        split_records = []
+        for byte_range in byte_ranges:
+            range_records = list(iterator.iterate(wikipedia_dump, byte_range=byte_range))
+            assert 0 < len(range_records) < len(records)
+            split_records.extend(range_records)
+        assert split_records == records
+
+
+class TestWikipediaExtractor:
+    def test_extract(self):
+        extractor = WikipediaExtractor(language="de")
+        content = (
+            "'''Topic''' __NOTOC__ is a [[thing]].<ref>A [[source]]</ref>\n"
+            "[[Datei:Picture.jpg|thumb|A caption]]\n"
+            "== History ==\n"
+            "A section without links.<ref>Reference</ref>\n"
+            "<table><tr><td>Cell</td></tr></table>\n"
+            "[[Kategorie:Things]]"
+        )
+
+        _, text = extractor.extract(content)
+
+        assert text == "Topic  is a thing.\n\nHistory \nA section without links.\n\nThings"
+        assert extractor.num_articles == 1
+        assert extractor.parse_time > 0 and extractor.clean_time > 0
+
+
+class TestArxiv:
+    def test_iterate(self, arxiv_tar):
+        records = list(ArxivIterator().iterate(arxiv_tar))
+
+        assert records == [
+            ({"id": "2301.00001", "source_id": "arXiv_src_2301_001.tar"}, [ARXIV_TEX]),
+            ({"id": "2301.00002", "source_id": "arXiv_src_2301_001.tar"}, [ARXIV_TEX]),
+        ]
+        # Nothing is extracted to disk
+        assert os.listdir(os.path.dirname(arxiv_tar)) == ["arXiv_src_2301_001.tar"]
+
+    def test_extract(self):
+        _, text = ArxivExtractor().extract([ARXIV_TEX])
+
+        # \R is defined after \space, so the \R in the value of \space is expanded too
+        assert text == (
+            "\\section{Introduction}\n"
+            "We work in \\mathbb{R}^n and \\mathbb{R}.\n"
+        )
+
+
+class TestDownloadFile:
+    def test_download(self, file_server, tmpdir):
+        data = file_server.files["/crawl/file-0.warc.gz"]
+        output_file = str(tmpdir / "file-0.warc.gz")
+        download_file(
+            f"{file_server.url}/crawl/file-0.warc.gz",
+            output_file,
+            md5=md5(data).hexdigest(),
+        )
+        with open(output_file, "rb") as f:
+            assert f.read() == data
+        assert os.listdir(tmpdir) == ["file-0.warc.gz"]
+
+    def test_resume(self, file_server, tmpdir):
+        data = file_server.files["/crawl/file-0.warc.gz"]
+        output_file = str(tmpdir / "file-0.warc.gz")
+        with open(output_file + ".part", "wb") as f:
+            f.write(data[:1000])
+        download_file(f"{file_server.url}/crawl/file-0.warc.gz", output_file)
+        with open(output_file, "rb") as f:
+            assert f.read() == data
+        assert file_server.requests == [("/crawl/file-0.warc.gz", "bytes=1000-")]
+
+    def test_complete_part_file(self, file_server, tmpdir):
+        data = file_server.files["/crawl/file-0.warc.gz"]
+        output_file = str(tmpdir / "file-0.warc.gz")
+        with open(output_file + ".part", "wb") as f:
+            f.write(data)
+        download_file(f"{file_server.url}/crawl/file-0.warc.gz", output_file)
+        with open(output_file, "rb") as f:
+            assert f.read() == data
+
+    def test_retry(self, file_server, tmpdir):
+        data = file_server.files["/crawl/file-0.warc.gz"]
+        file_server.failures = 2
+        file_server.truncations = 1
+        output_file = str(tmpdir / "file-0.warc.gz")
+        download_file(
+            f"{file_server.url}/crawl/file-0.warc.gz", output_file, backoff=0
+        )
+        with open(output_file, "rb") as f:
+            assert f.read() == data
+        # The truncated response is resumed from where it was cut off
+        assert len(file_server.requests) == 4
+        assert file_server.requests[-1][1] == f"bytes={len(data) // 2}-"
+
+    def test_failure(self, file_server, tmpdir):
+        output_file = str(tmpdir / "file-0.warc.gz")
+        with pytest.raises(RuntimeError, match="md5 checksum mismatch"):
+            download_file(
+                f"{file_server.url}/crawl/file-0.warc.gz",
+                output_file,
+                md5="0" * 32,
+                max_retries=1,
+                backoff=0,
+            )
+        assert os.listdir(tmpdir) == []
+
+    def test_batch_download(self, file_server, tmpdir):
+        urls = [f"{file_server.url}{path}" for path in sorted(file_server.files)]
+        downloader = CommonCrawlWARCDownloader(str(tmpdir))
+        output_files = batch_download(urls, downloader, num_threads=2)
+        assert output_files == [
+            os.path.join(tmpdir, f"crawl-file-{i}.warc.gz") for i in range(3)
+        ]
+        for output_file, path in zip(output_files, sorted(file_server.files)):
+            with open(output_file, "rb") as f:
+                assert f.read() == file_server.files[path]
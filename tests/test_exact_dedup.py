@@ -16,6 +16,8 @@ import pandas as pd
 import pytest
 from dask import dataframe as dd
 from dask.dataframe.utils import assert_eq
+
+import nemo_curator
 from nemo_curator.datasets import DocumentDataset
 from nemo_curator.modules import ExactDuplicates
 
@@ -50,3 +52,14 @@ class TestExactDuplicates:
         expected_df = exact_dedup_data.df.compute()
         expected_df = expected_df[expected_df.text.duplicated(keep=False)]
         assert_eq(result.df.id, expected_df.id, check_index=False)
+
+    def test_dup_integer_ids(self, exact_dedup_data):
+        dataset = nemo_curator.AddId("doc_id", dataset_id=3)(exact_dedup_data)
+        exact_dups = ExactDuplicates(id_field=["dataset_id", "doc_id"])
+        result = exact_dups(dataset).df.compute()
+        assert list(result.columns) == ["dataset_id", "doc_id", "_hashes"]
+        expected_df = dataset.df.compute()
+        expected_df = expected_df[expected_df.text.duplicated(keep=False)]
+        assert_eq(
+            result.doc_id.sort_values(), expected_df.doc_id, check_index=False
+        )
@@ -12,15 +12,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 import os
+import random
+import time
+import dask
+import numpy as np
 import pandas as pd
 from dask import dataframe as dd
+from distributed import Client, LocalCluster
 
 import pytest
 
 from nemo_curator.datasets import DocumentDataset
-from nemo_curator.modules import ScoreFilter, Score, Filter, Sequential
+from nemo_curator.modules import ScoreFilter, Score, Filter, FirstFailingFilter, FusedScoreFilter, Sequential
 from nemo_curator.filters import DocumentFilter, NonAlphaNumericFilter, SymbolsToWordsFilter, NumbersFilter, UrlsFilter, BulletsFilter, WhiteSpaceFilter, ParenthesesFilter, LongWordFilter, WordCountFilter, BoilerPlateStringFilter, MeanWordLengthFilter, RepeatedLinesFilter, RepeatedParagraphsFilter, RepeatedLinesByCharFilter, RepeatedParagraphsByCharFilter, RepeatingTopNGramsFilter, RepeatingDuplicateNGramsFilter, PunctuationFilter, EllipsisFilter, CommonEnglishWordsFilter, WordsWithoutAlphabetsFilter, PornographicUrlsFilter
+from nemo_curator.filters import BatchedNonAlphaNumericFilter, BatchedNumbersFilter, BatchedUrlsFilter, BatchedWhiteSpaceFilter, BatchedParenthesesFilter, BatchedWordCountFilter
+from nemo_curator.utils.config_utils import build_filter_pipeline
+from nemo_curator.utils.score_cache import score_fingerprint
+from nemo_curator.filters import FastTextLangId, FastTextQualityFilter, BatchedFastTextLangId, BatchedFastTextQualityFilter
+from nemo_curator.filters import classifier_filter
 from nemo_curator.filters import PythonCommentToCodeFilter, GeneralCommentToCodeFilter, NumberOfLinesOfCodeFilter, TokenizerFertilityFilter, XMLHeaderFilter, AlphaFilter, HTMLBoilerplateFilter, PerExtensionFilter
 
 class LetterCountFilter(DocumentFilter):
@@ -38,6 +49,62 @@ class LetterCountFilter(DocumentFilter):
     def keep_document(self, score):
         return score >= self.min_count
 
+class CountingLetterFilter(LetterCountFilter):
+    """
+    LetterCountFilter that counts how many documents it scored
+    """
+    def __init__(self, letter="a", min_count=5):
+        super().__init__(letter=letter, min_count=min_count)
+        self.num_scored = 0
+
+    def score_document(self, text):
+        self.num_scored += 1
+        return super().score_document(text)
+
+class SleepingRepeatedLinesFilter(RepeatedLinesFilter):
+    """
+    RepeatedLinesFilter that yields to other threads before reading its sentences
+    """
+    def score_document(self, text):
+        time.sleep(0.001)
+        return super().score_document(text)
+
+class SharedCountingLetterFilter(LetterCountFilter):
+    """
+    LetterCountFilter that counts the documents scored by all of its copies,
+    including those sent to the workers of an in-process Dask cluster
+    """
+    num_scored = 0
+
+    def score_document(self, text):
+        SharedCountingLetterFilter.num_scored += 1
+        return super().score_document(text)
+
+def make_letter_counter(letter):
+    return lambda text: text.count(letter)
+
+def count_letter(text, letter="a"):
+    return text.count(letter)
+
+class StubFastTextModel:
+    """
+    Predicts like a FastText model, labelling each document by its first letter
+    with a probability given by its length, and records the size of its batches
+    """
+    def __init__(self):
+        self.batch_sizes = []
+
+    def _predict(self, text):
+        label = "__label__hq" if text[:1].lower() < "n" else "__label__lq"
+        return (label,), np.array([0.5 + (len(text) % 10) / 20])
+
+    def predict(self, text, k=1):
+        if isinstance(text, list):
+            self.batch_sizes.append(len(text))
+            predictions = [self._predict(t) for t in text]
+            return [labels for labels, _ in predictions], [probs for _, probs in predictions]
+        return self._predict(text)
+
 class BatchedLengthFilter(DocumentFilter):
     """
     Keeps documents of a given length
@@ -133,6 +200,162 @@ class TestFilterModule:
         expected_data = DocumentDataset(letter_count_data.df.loc[expected_indices])
         assert all_equal(expected_data, filtered_data), f"Expected {expected_data} but got {filtered_data}"
 
+    def test_fused_sequential_filter(self, letter_count_data):
+        modules = [
+            ScoreFilter(LetterCountFilter(), text_field="documents", score_field="a_count", score_type=int),
+            ScoreFilter(LetterCountFilter(letter="S", min_count=1), text_field="documents", invert=True),
+            ScoreFilter(LetterCountFilter(letter="F", min_count=1), text_field="documents", score_field="f_count"),
+        ]
+        expected_data = Sequential(modules)(letter_count_data)
+        fused_step = Sequential(modules, fused=True)
+        assert isinstance(fused_step._fuse_modules()[0], FusedScoreFilter)
+        filtered_data = fused_step(letter_count_data)
+
+        assert list(filtered_data.df.compute().index) == [2]
+        assert filtered_data.df.compute().equals(expected_data.df.compute())
+        # Including the first partition, where every document is rejected
+        for partition in filtered_data.df.to_delayed():
+            assert partition.compute().dtypes.equals(filtered_data.df._meta.dtypes)
+
+    def test_fused_heuristic_pipeline(self):
+        config_file = os.path.join(os.path.dirname(__file__), os.pardir, "config", "heuristic_filter_en.yaml")
+        sentence = "The quick brown fox jumps over the lazy dog near the river bank today."
+        documents = [
+            " ".join([sentence] * 10),
+            "\n".join(f"Line number {i} talks about the weather and the news of the day." for i in range(60)),
+            "\n\n".join([sentence] * 8),
+            "\n".join(f"{i}. {sentence}" for i in range(80)),
+            "Too short.",
+            "spam " * 200,
+        ]
+        dataset = list_to_dataset(documents, npartitions=3)
+        expected_data = build_filter_pipeline(config_file)(dataset)
+        filtered_data = build_filter_pipeline(config_file, fused=True)(dataset)
+
+        assert filtered_data.df.compute().equals(expected_data.df.compute())
+
+    def test_first_failing_filter(self, letter_count_data):
+        length_filter = BatchedLengthFilter(min_length=8, max_length=12)
+        modules = [
+            ScoreFilter(LetterCountFilter(min_count=3), text_field="documents", score_field="a_count"),
+            ScoreFilter(LetterCountFilter(letter="F", min_count=1), text_field="documents", invert=True),
+            Score(length_filter.score_document, text_field="documents", score_field="length", batched=True),
+            Filter(length_filter.keep_document, "length", batched=True),
+        ]
+        labeled_data = FirstFailingFilter(modules, label_field="failed")(letter_count_data)
+        labeled_df = labeled_data.df.compute()
+
+        assert labeled_df["failed"].tolist() == [0, -1, 1, 3]
+        assert labeled_df["a_count"].tolist() == [2, 3, 5, 7]
+        assert labeled_df["length"].isna().tolist() == [True, False, True, False]
+        assert labeled_df["length"].dropna().tolist() == [11, 13]
+        assert labeled_df["length"].dtype == "Int64"
+
+        expected_df = Sequential(modules)(letter_count_data).df.compute()
+        kept_df = FirstFailingFilter(modules, label_field="failed").kept(labeled_data).df.compute()
+        assert kept_df.dtypes.equals(expected_df.dtypes)
+        assert kept_df.equals(expected_df)
+
+    def test_fused_filters_threaded(self):
+        rng = random.Random(0)
+        vocabulary = ["alpha", "beta", "gamma", "delta", "river", "stone", "cloud", "paper", "green", "quiet", "north", "table"]
+        documents = []
+        for _ in range(128):
+            lines = [" ".join(rng.choices(vocabulary, k=rng.randint(3, 9))) + rng.choice([".", "!", ""]) for _ in range(rng.randint(1, 6))]
+            lines += rng.sample(lines, k=rng.randint(0, len(lines)))
+            documents.append(rng.choice(["\n", "\n\n"]).join(lines))
+        dataset = list_to_dataset(documents, npartitions=8)
+        modules = [
+            ScoreFilter(SleepingRepeatedLinesFilter(max_repeated_line_fraction=0.5), score_field="repeated_lines"),
+            ScoreFilter(RepeatedParagraphsFilter(max_repeated_paragraphs_ratio=0.5), score_field="repeated_paragraphs"),
+            ScoreFilter(RepeatingTopNGramsFilter(n=2, max_repeating_ngram_ratio=0.3), score_field="top_2grams"),
+            ScoreFilter(RepeatingDuplicateNGramsFilter(n=3, max_repeating_duplicate_ngram_ratio=0.3), score_field="duplicate_3grams"),
+            ScoreFilter(PunctuationFilter(max_num_sentences_without_endmark_ratio=0.5), score_field="punctuation"),
+        ]
+        scored_df = Sequential([Score(module.filter_obj.score_document, score_field=module.score_field) for module in modules])(dataset).df.compute()
+        expected_df = Sequential(modules)(dataset).df.compute()
+
+        with dask.config.set(scheduler="threads", num_workers=8):
+            fused_data = Sequential(modules, fused=True)(dataset)
+            fused_df = fused_data.df.compute()
+            labeler = FirstFailingFilter(modules, label_field="failed")
+            labeled_data = labeler(dataset)
+            labeled_df = labeled_data.df.compute()
+            kept_df = labeler.kept(labeled_data).df.compute()
+
+        assert fused_df.equals(expected_df)
+        assert fused_data.df._meta.dtypes.equals(fused_df.dtypes)
+        assert labeled_data.df._meta.dtypes.equals(labeled_df.dtypes)
+        assert all(labeled_df[module.score_field].dtype == "Float64" for module in modules)
+        assert kept_df.dtypes.equals(expected_df.dtypes)
+        assert kept_df.equals(expected_df)
+        for index, row in labeled_df.iterrows():
+            num_scored = len(modules) if row["failed"] == -1 else row["failed"] + 1
+            for position, module in enumerate(modules):
+                if position < num_scored:
+                    assert row[module.score_field] == scored_df.loc[index, module.score_field]
+                else:
+                    assert pd.isna(row[module.score_field])
+
+    def test_score_filter_cache(self, letter_count_data, tmp_path):
+        letter_filter = CountingLetterFilter()
+        filtered_data = ScoreFilter(letter_filter, text_field="documents", score_field="a_count", score_type=int, score_cache_dir=str(tmp_path))(letter_count_data)
+        expected_df = filtered_data.df.compute()
+        assert letter_filter.num_scored == 4
+
+        # Only the threshold changed, so every score comes from the cache
+        threshold_filter = CountingLetterFilter(min_count=6)
+        filtered_data = ScoreFilter(threshold_filter, text_field="documents", score_field="a_count", score_type=int, score_cache_dir=str(tmp_path))(letter_count_data)
+        assert threshold_filter.num_scored == 0
+        assert filtered_data.df.compute().equals(expected_df.loc[[3]])
+
+        # A different letter changes the scores
+        other_filter = CountingLetterFilter(letter="e")
+        ScoreFilter(other_filter, text_field="documents", score_type=int, score_cache_dir=str(tmp_path))(letter_count_data).df.compute()
+        assert other_filter.num_scored == 4
+
+    def test_score_fingerprint(self):
+        assert score_fingerprint(WordCountFilter(min_words=10).score_document) == score_fingerprint(WordCountFilter(max_words=20).score_document)
+        assert score_fingerprint(RepeatingTopNGramsFilter(n=2).score_document) != score_fingerprint(RepeatingTopNGramsFilter(n=3).score_document)
+        assert score_fingerprint(WordCountFilter().score_document) != score_fingerprint(LongWordFilter().score_document)
+
+    def test_score_fingerprint_captured_values(self):
+        assert score_fingerprint(make_letter_counter("a")) == score_fingerprint(make_letter_counter("a"))
+        assert score_fingerprint(make_letter_counter("a")) != score_fingerprint(make_letter_counter("b"))
+        assert score_fingerprint(functools.partial(count_letter, letter="a")) != score_fingerprint(functools.partial(count_letter, letter="b"))
+        assert score_fingerprint(functools.partial(count_letter, letter="a")) != score_fingerprint(count_letter)
+        assert score_fingerprint(lambda text: text.count("a")) != score_fingerprint(lambda text: text.count("b"))
+
+        # Captured objects without a stable representation cannot be cached safely
+        with pytest.raises(ValueError):
+            score_fingerprint(make_letter_counter(object()))
+        with pytest.raises(ValueError):
+            score_fingerprint(LetterCountFilter())
+
+    def test_score_cache_closures(self, letter_count_data, tmp_path):
+        a_data = Score(make_letter_counter("a"), "count", text_field="documents", score_cache_dir=str(tmp_path))(letter_count_data)
+        assert a_data.df["count"].compute().tolist() == [2, 3, 5, 7]
+        e_data = Score(make_letter_counter("e"), "count", text_field="documents", score_cache_dir=str(tmp_path))(letter_count_data)
+        assert e_data.df["count"].compute().tolist() == [0, 2, 1, 2]
+
+    def test_score_cache_persistent_client(self, tmp_path):
+        dataset = list_to_dataset(["Two aa", "a a Three a", "Five aaa aa", "aaaSeven aaaa"], col_name="documents", npartitions=2)
+        cache_dir = str(tmp_path)
+        SharedCountingLetterFilter.num_scored = 0
+
+        with LocalCluster(n_workers=1, threads_per_worker=2, processes=False, dashboard_address=None) as cluster, Client(cluster):
+            expected_df = ScoreFilter(SharedCountingLetterFilter(), text_field="documents", score_field="a_count", score_type=int, score_cache_dir=cache_dir)(dataset).df.compute()
+            assert SharedCountingLetterFilter.num_scored == 4
+            (cache_path,) = [os.path.join(cache_dir, d) for d in os.listdir(cache_dir)]
+            assert len(os.listdir(cache_path)) == 2
+
+            # The worker that loaded the empty cache in the first run sees the scores it wrote since
+            filtered_df = ScoreFilter(SharedCountingLetterFilter(min_count=6), text_field="documents", score_field="a_count", score_type=int, score_cache_dir=cache_dir)(dataset).df.compute()
+            assert SharedCountingLetterFilter.num_scored == 4
+            assert filtered_df.equals(expected_df.loc[[3]])
+            # The files of the first run were compacted before the second one
+            assert len(os.listdir(cache_path)) == 1
+
     def test_batch_score_filter(self, letter_count_data):
         length_filter = BatchedLengthFilter(min_length=8, max_length=11)
         filter_step = ScoreFilter(length_filter, text_field="documents", batched=True)
@@ -386,6 +609,83 @@ class TestHeuristicFilters:
         assert all_equal(expected_data, filtered_data), f"Expected {expected_data} but got {filtered_data}"
 
 
+    @pytest.mark.parametrize("filter_pair", [
+        (NonAlphaNumericFilter(), BatchedNonAlphaNumericFilter()),
+        (NumbersFilter(max_number_to_text_ratio=0.1), BatchedNumbersFilter(max_number_to_text_ratio=0.1)),
+        (UrlsFilter(), BatchedUrlsFilter()),
+        (WhiteSpaceFilter(), BatchedWhiteSpaceFilter()),
+        (ParenthesesFilter(), BatchedParenthesesFilter()),
+        (WordCountFilter(min_words=2, max_words=4), BatchedWordCountFilter(min_words=2, max_words=4)),
+    ])
+    def test_batched_heuristics(self, filter_pair):
+        doc_filter, batched_filter = filter_pair
+        dataset = list_to_dataset([
+            "",
+            "  \t\b\r\n  ",
+            "Mixed 123 text ٣ with (parentheses) [and] {braces}.",
+            "See https://www.nvidia.com/en-us/ and http://example.com?a=1 now",
+            "one two\u00a0three\u2003four",
+            "$#@!%^&*()",
+        ])
+        expected_data = ScoreFilter(doc_filter, score_field="score")(dataset)
+        filtered_data = ScoreFilter(batched_filter, score_field="score", batched=True)(dataset)
+
+        expected_df = expected_data.df.compute()
+        filtered_df = filtered_data.df.compute()
+        assert list(filtered_df.index) == list(expected_df.index)
+        assert filtered_df["score"].tolist() == pytest.approx(expected_df["score"].tolist())
+
+
+@pytest.fixture
+def stub_fasttext(monkeypatch):
+    model = StubFastTextModel()
+    monkeypatch.setattr(classifier_filter, "load_object_on_worker", lambda attr, load_object_function, load_object_kwargs: model)
+    return model
+
+
+class TestClassifierFilters:
+    @pytest.mark.parametrize("batch_size", [1, 3, 4096])
+    @pytest.mark.parametrize("filter_classes", [
+        (FastTextQualityFilter, BatchedFastTextQualityFilter),
+        (FastTextLangId, BatchedFastTextLangId),
+    ])
+    def test_batched_fasttext(self, stub_fasttext, filter_classes, batch_size):
+        doc_filter_class, batched_filter_class = filter_classes
+        dataset = list_to_dataset([
+            "skipped", "skipped", "skipped",
+            "A first document\nover two lines",
+            "zebra crossing",
+            "__label__lq is not a label here",
+            "  Padded document  ",
+            "",
+            "Mixed case words",
+        ], npartitions=3)
+        # The first partition is left empty
+        dataset = DocumentDataset(dataset.df.map_partitions(lambda df: df[df.index >= 3]))
+        assert dataset.df.npartitions == 3
+
+        expected_data = Score(doc_filter_class("model.bin").score_document, score_field="score")(dataset)
+        scored_data = Score(batched_filter_class("model.bin", batch_size=batch_size).score_document, score_field="score", batched=True)(dataset)
+
+        expected_df = expected_data.df.compute()
+        scored_df = scored_data.df.compute()
+        assert list(scored_df.index) == list(expected_df.index) == [3, 4, 5, 6, 7, 8]
+        assert scored_df["score"].tolist() == expected_df["score"].tolist()
+        assert 0 < max(stub_fasttext.batch_sizes) <= batch_size
+
+    @pytest.mark.parametrize("batched_filter_class", [BatchedFastTextQualityFilter, BatchedFastTextLangId])
+    def test_batched_fasttext_empty(self, stub_fasttext, batched_filter_class):
+        scores = batched_filter_class("model.bin").score_document(pd.Series([], dtype=object))
+        assert len(scores) == 0
+        assert stub_fasttext.batch_sizes == []
+
+    @pytest.mark.parametrize("batched_filter_class", [BatchedFastTextQualityFilter, BatchedFastTextLangId])
+    def test_batched_fasttext_without_worker(self, batched_filter_class):
+        texts = pd.Series(["one", "two"], index=[5, 7])
+        scores = batched_filter_class("model.bin").score_document(texts)
+        assert list(scores.index) == [5, 7]
+
+
 class TestCodeFilters:
     def test_python_comment_to_code(self):
         doc_1 = "# Good code\nprint('hello world')"
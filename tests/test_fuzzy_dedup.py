@@ -19,11 +19,14 @@ from typing import Iterable
 import cudf
 import dask_cudf
 import numpy as np
+import pandas as pd
 import pytest
+from dask import dataframe as dd
 from dask.dataframe.utils import assert_eq
 
 from nemo_curator.datasets import DocumentDataset
-from nemo_curator.modules import LSH, MinHash
+from nemo_curator.modules import LSH, AddId, MinHash
+from nemo_curator.utils.fuzzy_dedup_utils.hash_utils import minhash_pandas
 
 
 @pytest.fixture
@@ -44,6 +47,24 @@ def fuzzy_dedup_data():
     return DocumentDataset(df)
 
 
+@pytest.fixture
+def fuzzy_dedup_data_cpu():
+    df = pd.DataFrame(
+        {
+            "id": [1, 2, 300, 4, -1],
+            "text": [
+                "A test string",
+                "A different test string",
+                "A different object",
+                "The quick brown fox jumps over the lazy dog",
+                "The quick black cat jumps over the lazy dog",
+            ],
+        }
+    )
+    df = dd.from_pandas(df, 2)
+    return DocumentDataset(df)
+
+
 def minhash_overlap(minhash1: np.array, minhash2: np.array):
     assert len(minhash1) == len(minhash2)
     overlap = sum(minhash1 == minhash2)
@@ -58,6 +79,12 @@ def jaccard_index(str1: str, str2: str, char_ngrams):
     )
 
 
+def jaccard_index_cpu(str1: str, str2: str, char_ngrams):
+    shingles1 = {str1[i : i + char_ngrams] for i in range(len(str1) - char_ngrams + 1)}
+    shingles2 = {str2[i : i + char_ngrams] for i in range(len(str2) - char_ngrams + 1)}
+    return len(shingles1 & shingles2) / len(shingles1 | shingles2)
+
+
 def generate_all_pairs(item: Iterable):
     return combinations(item, 2)
 
@@ -123,6 +150,82 @@ class TestMinhashes:
         assert len(os.listdir(tmpdir / "_minhashes.parquet")) != 0
 
 
+class TestMinhashesCPU:
+    @pytest.mark.parametrize("use_64bit_hash", [False, True])
+    @pytest.mark.parametrize("seed,char_ngrams,num_hashes", [(128, 3, 260)])
+    def test_identical_minhash(
+        self, fuzzy_dedup_data_cpu, use_64bit_hash, seed, char_ngrams, num_hashes
+    ):
+        minhasher1 = MinHash(
+            seed=seed,
+            num_hashes=num_hashes,
+            char_ngrams=char_ngrams,
+            use_64bit_hash=use_64bit_hash,
+        )
+        minhash_sig1 = minhasher1(fuzzy_dedup_data_cpu)
+        sig_lengths = minhash_sig1.df["_minhash_signature"].compute().map(len)
+        assert (sig_lengths == num_hashes).all()
+
+        minhasher2 = MinHash(
+            seed=seed,
+            num_hashes=num_hashes,
+            char_ngrams=char_ngrams,
+            use_64bit_hash=use_64bit_hash,
+        )
+        minhash_sig2 = minhasher2(fuzzy_dedup_data_cpu)
+        sig1 = np.stack(minhash_sig1.df["_minhash_signature"].compute().values)
+        sig2 = np.stack(minhash_sig2.df["_minhash_signature"].compute().values)
+        assert sig1.dtype == (np.uint64 if use_64bit_hash else np.uint32)
+        np.testing.assert_array_equal(sig1, sig2)
+
+    @pytest.mark.parametrize(
+        "use_64bit_hash,seed,char_ngrams,num_hashes",
+        [(False, 42, 5, 260), (True, 32768, 10, 128)],
+    )
+    def test_minhash_approximation(
+        self, fuzzy_dedup_data_cpu, use_64bit_hash, seed, char_ngrams, num_hashes
+    ):
+        THRESHOLD = 0.15
+
+        minhasher = MinHash(
+            seed=seed,
+            num_hashes=num_hashes,
+            char_ngrams=char_ngrams,
+            use_64bit_hash=use_64bit_hash,
+        )
+        minhashes = minhasher(fuzzy_dedup_data_cpu)
+        minhash_signatures = minhashes.df["_minhash_signature"].compute().values
+        strings = fuzzy_dedup_data_cpu.df["text"].compute().values
+        for (sig1, str1), (sig2, str2) in generate_all_pairs(
+            tuple(zip(minhash_signatures, strings))
+        ):
+            true_jaccard = jaccard_index_cpu(str1, str2, char_ngrams)
+            minhash_approximation = minhash_overlap(sig1, sig2)
+            assert abs(true_jaccard - minhash_approximation) < THRESHOLD
+
+    def test_minhash_batching(self, fuzzy_dedup_data_cpu):
+        minhasher = MinHash(num_hashes=16, char_ngrams=5)
+        ser = fuzzy_dedup_data_cpu.df["text"].compute()
+        expected = minhash_pandas(ser, minhasher.seeds, char_ngram=5)
+        result = minhash_pandas(ser, minhasher.seeds, char_ngram=5, batch_size=50)
+        np.testing.assert_array_equal(np.stack(expected), np.stack(result))
+
+    def test_minhash_cache(self, fuzzy_dedup_data_cpu, tmpdir):
+        minhasher = MinHash(cache_dir=tmpdir)
+        result = minhasher(fuzzy_dedup_data_cpu)
+        assert len(result) == len(fuzzy_dedup_data_cpu)
+        assert "_minhashes.parquet" in os.listdir(tmpdir)
+        assert len(os.listdir(tmpdir / "_minhashes.parquet")) != 0
+
+    def test_minhash_integer_ids(self, fuzzy_dedup_data_cpu):
+        dataset = AddId("doc_id", dataset_id=5)(fuzzy_dedup_data_cpu)
+        minhasher = MinHash(num_hashes=16, id_field=["dataset_id", "doc_id"])
+        result = minhasher(dataset).df.compute()
+        assert list(result.columns) == ["dataset_id", "doc_id", "_minhash_signature"]
+        assert result["doc_id"].dtype == "int64"
+        assert list(result["doc_id"]) == [0, 1, 2, 3, 4]
+
+
 @pytest.mark.gpu
 class TestLSH:
     @pytest.fixture(autouse=True)
@@ -176,3 +279,60 @@ class TestLSH:
             [[(1, 1), (1, 2)], [(1, 2), (2, 3)], [(3, 4), (4, 5)]], name="new_id"
         )
         assert_eq(expected_df, docs_list, check_index=False)
+
+
+class TestLSHCPU:
+    @pytest.fixture(autouse=True)
+    def minhash_data(self):
+        df = pd.DataFrame(
+            {
+                "id": [1, 2, 3, 4, 5],
+                "dataset_id": [1, 1, 2, 3, 4],
+                "minhash_sig": [
+                    [1, 2, 1, 2, 1, 2],
+                    [1, 2, 3, 4, 5, 6],
+                    [3, 2, 1, 4, 5, 6],
+                    [9, 8, 7, 6, 5, 4],
+                    [3, 1, 2, 4, 5, 4],
+                ],
+            }
+        )
+        df = dd.from_pandas(df, 2)
+        self.dataset = DocumentDataset(df)
+
+    @pytest.mark.parametrize("buckets_per_shuffle", [1, 2, 3])
+    def test_lsh(self, tmpdir, buckets_per_shuffle):
+        lsh = LSH(
+            cache_dir=tmpdir,
+            minhash_length=6,
+            num_buckets=3,
+            buckets_per_shuffle=buckets_per_shuffle,
+            minhash_field="minhash_sig",
+            id_fields="id",
+        )
+        buckets = lsh(self.dataset)
+        buckets_df = buckets.df.compute()
+        assert buckets_df["_bucket_id"].dtype == np.uint64
+        docs_list = buckets_df.groupby("_bucket_id").id.apply(sorted)
+        assert sorted(docs_list) == [[1, 2], [2, 3], [4, 5]]
+
+    def test_multiple_id_cols(self, tmpdir):
+        lsh = LSH(
+            cache_dir=tmpdir,
+            minhash_length=6,
+            num_buckets=3,
+            buckets_per_shuffle=1,
+            id_fields=["id", "dataset_id"],
+            minhash_field="minhash_sig",
+        )
+        buckets = lsh(self.dataset)
+        buckets_df = buckets.df.compute()
+        buckets_df["new_id"] = list(zip(buckets_df.dataset_id, buckets_df.id))
+        docs_list = buckets_df.groupby("_bucket_id").new_id.apply(sorted)
+        assert sorted(docs_list) == [[(1, 1), (1, 2)], [(1, 2), (2, 3)], [(3, 4), (4, 5)]]
+
+    def test_band_index_in_bucket_id(self):
+        lsh = LSH(cache_dir="./", minhash_length=4, num_buckets=2)
+        df = pd.DataFrame({"id": [1], "_minhash_signature": [[7, 7, 7, 7]]})
+        buckets = lsh.minhash_to_buckets(df, lsh.bucket_ranges)
+        assert buckets["_bucket_0"].iloc[0] != buckets["_bucket_1"].iloc[0]
@@ -0,0 +1,141 @@
+# Copyright (c) 2024, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import dask.dataframe as dd
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from nemo_curator.datasets import DocumentDataset
+from nemo_curator.utils.distributed_utils import (
+    apply_filters,
+    read_data,
+    single_partition_write_with_filename,
+)
+
+
+@pytest.fixture
+def documents():
+    return pd.DataFrame(
+        {
+            "text": [f"Document number {i} with ünïcode" for i in range(10)],
+            "id": range(10),
+            "score": [i / 3 for i in range(10)],
+            "filename": ["file.jsonl"] * 10,
+        }
+    )
+
+
+class TestWriteToDisk:
+    def test_jsonl_records_per_chunk(self, tmpdir, documents):
+        expected_dir = tmpdir.mkdir("expected")
+        chunked_dir = tmpdir.mkdir("chunked")
+        single_partition_write_with_filename(documents, str(expected_dir))
+        single_partition_write_with_filename(
+            documents, str(chunked_dir), records_per_chunk=3
+        )
+
+        with open(expected_dir / "file.jsonl", encoding="utf-8") as f:
+            expected = f.read()
+        with open(chunked_dir / "file.jsonl", encoding="utf-8") as f:
+            assert f.read() == expected
+        assert len(expected.splitlines()) == 10
+
+    @pytest.mark.parametrize("write_to_filename", [True, False])
+    def test_parquet_options(self, tmpdir, documents, write_to_filename):
+        dataset = DocumentDataset(dd.from_pandas(documents, npartitions=1))
+        dataset.to_parquet(
+            str(tmpdir),
+            write_to_filename=write_to_filename,
+            row_group_size=4,
+            compression="zstd",
+            use_dictionary=False,
+        )
+
+        files = [f for f in os.listdir(tmpdir) if f.endswith(".parquet")]
+        assert len(files) == 1
+        metadata = pq.read_metadata(os.path.join(tmpdir, files[0]))
+        assert metadata.num_row_groups == 3
+        column = metadata.row_group(0).column(0)
+        assert column.compression == "ZSTD"
+        assert not any("DICTIONARY" in encoding for encoding in column.encodings)
+
+        result = pd.read_parquet(os.path.join(tmpdir, files[0]))
+        pd.testing.assert_frame_equal(result.reset_index(drop=True), documents)
+
+
+@pytest.fixture
+def dataset_files(tmpdir):
+    df = pd.DataFrame(
+        {
+            "id": range(12),
+            "text": [f"Document {i}" for i in range(12)],
+            "language": ["EN", "DE", "FR"] * 4,
+            "url": [f"https://example.com/{i}" for i in range(12)],
+        }
+    )
+    files = {}
+    for file_type in ["jsonl", "parquet"]:
+        files[file_type] = []
+        for i in range(2):
+            path = str(tmpdir / f"part_{i}.{file_type}")
+            part = df.iloc[6 * i : 6 * (i + 1)]
+            if file_type == "jsonl":
+                part.to_json(path, orient="records", lines=True)
+            else:
+                part.to_parquet(path, row_group_size=3)
+            files[file_type].append(path)
+    return files
+
+
+class TestReadData:
+    @pytest.mark.parametrize("file_type", ["jsonl", "parquet"])
+    def test_columns_and_filters(self, dataset_files, file_type):
+        df = read_data(
+            dataset_files[file_type],
+            file_type=file_type,
+            backend="pandas",
+            add_filename=True,
+            columns=["id", "text"],
+            filters=[("language", "==", "EN")],
+        ).compute()
+
+        assert list(df.columns) == ["filename", "id", "text"]
+        assert df["id"].tolist() == [0, 3, 6, 9]
+        assert df["filename"].tolist() == [f"part_{i}.{file_type}" for i in [0, 0, 1, 1]]
+
+    @pytest.mark.parametrize("file_type", ["jsonl", "parquet"])
+    def test_dataset_filters(self, dataset_files, file_type):
+        read = (
+            DocumentDataset.read_json
+            if file_type == "jsonl"
+            else DocumentDataset.read_parquet
+        )
+        dataset = read(
+            dataset_files[file_type],
+            filters=[[("language", "in", ["DE", "FR"]), ("id", "<", 4)], [("id", ">=", 11)]],
+        )
+
+        assert sorted(dataset.df["id"].compute().tolist()) == [1, 2, 11]
+
+    def test_apply_filters(self):
+        df = pd.DataFrame({"a": [1, 2, 3], "b": ["x", "y", "z"]})
+
+        result = apply_filters(df, [("a", "!=", 2), ("b", "not in", ["z"])])
+
+        pd.testing.assert_frame_equal(result, pd.DataFrame({"a": [1], "b": ["x"]}))
+        with pytest.raises(ValueError, match="Unknown filter operator"):
+            apply_filters(df, [("a", "~", 2)])
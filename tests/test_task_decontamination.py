@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import random
+
 import pytest
 import pandas as pd
 import dask.dataframe as dd
@@ -19,6 +21,7 @@ from collections import defaultdict
 
 import nemo_curator
 from nemo_curator.datasets import DocumentDataset
+from nemo_curator.modules.task import HashNgramMatcher, LoopNgramMatcher
 from nemo_curator.tasks import DownstreamTask
 
 class SimpleTask(DownstreamTask):
@@ -185,8 +188,9 @@ class TestRemoveMatchingNgrams:
         assert expected_data == actual_data, f"Expected #{expected_data}, got #{actual_data}"
 
 class TestFullPipeline:
-    def test_single_task(self, contaminated_dataset):
-        decontaminator = nemo_curator.TaskDecontamination(SimpleTask(), min_document_length=1, remove_char_each_side=1)
+    @pytest.mark.parametrize("ngram_matcher", ["hash", "loop"])
+    def test_single_task(self, contaminated_dataset, ngram_matcher):
+        decontaminator = nemo_curator.TaskDecontamination(SimpleTask(), min_document_length=1, remove_char_each_side=1, ngram_matcher=ngram_matcher)
         filtered_dataset = decontaminator(contaminated_dataset)
 
         actual_data = sorted(filtered_dataset.df.compute()['text'].to_list())
@@ -201,8 +205,9 @@ class TestFullPipeline:
         expected_data.sort()
         assert expected_data == actual_data, f"Expected #{expected_data}, got #{actual_data}"
     
-    def test_multiple_tasks(self, contaminated_dataset):
-        decontaminator = nemo_curator.TaskDecontamination([SimpleTask(), TinyTask()], min_document_length=1, remove_char_each_side=1)
+    @pytest.mark.parametrize("ngram_matcher", ["hash", "loop"])
+    def test_multiple_tasks(self, contaminated_dataset, ngram_matcher):
+        decontaminator = nemo_curator.TaskDecontamination([SimpleTask(), TinyTask()], min_document_length=1, remove_char_each_side=1, ngram_matcher=ngram_matcher)
         filtered_dataset = decontaminator(contaminated_dataset)
 
         actual_data = sorted(filtered_dataset.df.compute()['text'].to_list())
@@ -215,4 +220,22 @@ class TestFullPipeline:
                         "Small contamination in a very short document 1.",
                         "Small contamination in a very short document 2."]
         expected_data.sort()
-        assert expected_data == actual_data, f"Expected #{expected_data}, got #{actual_data}"
\ No newline at end of file
+        assert expected_data == actual_data, f"Expected #{expected_data}, got #{actual_data}"
+
+class TestNgramMatchers:
+    def test_unknown_matcher(self):
+        with pytest.raises(ValueError):
+            nemo_curator.TaskDecontamination(SimpleTask(), ngram_matcher="trie")
+
+    def test_same_match_as_loop(self):
+        rng = random.Random(0)
+        vocab = ["a", "b", "c", "d", "e", ""]
+        for _ in range(500):
+            max_ngram_size = rng.choice([4, 5])
+            ngrams = {" ".join(rng.choice(vocab) for _ in range(rng.randint(1, max_ngram_size))): 0 for _ in range(rng.randint(1, 6))}
+            ngrams_freq = sorted({(len(ngram.split(" ")), 1) for ngram in ngrams})
+            words = [rng.choice(vocab) for _ in range(rng.randint(0, 20))]
+
+            expected = LoopNgramMatcher(ngrams, ngrams_freq, max_ngram_size).search(words)
+            actual = HashNgramMatcher(ngrams, ngrams_freq, max_ngram_size).search(words)
+            assert expected == actual, f"Expected: {expected}, got: {actual} for {words} and {ngrams}"